@@ -3,7 +3,12 @@ Analytics Metrics
 Usage statistics and data analysis for admin dashboard
 """
 import config
-from utils.csv_handler import read_csv
+from utils.csv_handler import read_csv_iter
+from utils.schema import read_records
+from utils.log_pipeline import flush_logs
+from utils.log_rotation import segments
+from notifications.counters import counters
+from users.models import user_index
 from collections import Counter, defaultdict
 import os
 
@@ -12,16 +17,14 @@ def get_usage_stats():
     """
     Get overall system usage statistics
     """
-    users = read_csv(config.USERS_CSV)
-    notifications = read_csv(config.NOTIFICATIONS_CSV)
-    routes = read_csv(config.ROUTES_CSV)
-    locations = read_csv(config.LOCATIONS_CSV)
+    def count(filepath):
+        return sum(1 for _ in read_csv_iter(filepath, columns=['id']))
     
     return {
-        'total_users': len(users),
-        'total_notifications': len(notifications),
-        'total_routes': len(routes),
-        'total_locations': len(locations)
+        'total_users': sum(user_index.role_counts().values()),
+        'total_notifications': counters.stats()['total'],
+        'total_routes': count(config.ROUTES_CSV),
+        'total_locations': count(config.LOCATIONS_CSV)
     }
 
 
@@ -29,14 +32,14 @@ def get_user_stats():
     """
     Get user statistics by role
     """
-    users = read_csv(config.USERS_CSV)
     role_counts = Counter()
     
-    for user in users:
-        role = user.get('role', 'unknown').lower()
+    # Counts maintained by the user index instead of a table scan
+    for role, count in user_index.role_counts().items():
+        role = role or 'unknown'
         if role == 'staff':
             role = 'faculty'
-        role_counts[role] += 1
+        role_counts[role] += count
     
     return dict(role_counts)
 
@@ -45,28 +48,14 @@ def get_notification_stats():
     """
     Get notification delivery statistics
     """
-    notifications = read_csv(config.NOTIFICATIONS_CSV)
-    
-    total = len(notifications)
-    delivered = sum(1 for n in notifications if n.get('delivered', '').lower() == 'true')
-    
-    # Message type breakdown
-    message_types = Counter(n.get('message', 'Unknown') for n in notifications)
-    
-    return {
-        'total': total,
-        'delivered': delivered,
-        'pending': total - delivered,
-        'delivery_rate': round(delivered / total * 100, 1) if total > 0 else 0,
-        'by_type': dict(message_types)
-    }
+    return counters.stats()
 
 
 def get_popular_routes():
     """
     Get most frequently used routes (based on route data)
     """
-    routes = read_csv(config.ROUTES_CSV)
+    routes = read_csv_iter(config.ROUTES_CSV, columns=['start_location', 'end_location'])
     
     # Count routes by start-end pairs
     route_counts = Counter()
@@ -82,7 +71,7 @@ def get_popular_locations():
     """
     Get most connected/popular locations
     """
-    routes = read_csv(config.ROUTES_CSV)
+    routes = read_csv_iter(config.ROUTES_CSV, columns=['start_location', 'end_location'])
     location_counts = Counter()
     
     for route in routes:
@@ -96,19 +85,24 @@ def get_accessibility_stats():
     """
     Get accessibility statistics
     """
-    locations = read_csv(config.LOCATIONS_CSV)
-    routes = read_csv(config.ROUTES_CSV)
+    def count_accessible(filepath):
+        total = accessible = 0
+        for row in read_records(filepath, columns=['accessible']):
+            total += 1
+            if row.accessible:
+                accessible += 1
+        return accessible, total
     
-    accessible_locations = sum(1 for loc in locations if loc.get('accessible', '').lower() == 'true')
-    accessible_routes = sum(1 for r in routes if r.get('accessible', '').lower() == 'true')
+    accessible_locations, total_locations = count_accessible(config.LOCATIONS_CSV)
+    accessible_routes, total_routes = count_accessible(config.ROUTES_CSV)
     
     return {
         'accessible_locations': accessible_locations,
-        'total_locations': len(locations),
-        'location_accessibility_rate': round(accessible_locations / len(locations) * 100, 1) if locations else 0,
+        'total_locations': total_locations,
+        'location_accessibility_rate': round(accessible_locations / total_locations * 100, 1) if total_locations else 0,
         'accessible_routes': accessible_routes,
-        'total_routes': len(routes),
-        'route_accessibility_rate': round(accessible_routes / len(routes) * 100, 1) if routes else 0
+        'total_routes': total_routes,
+        'route_accessibility_rate': round(accessible_routes / total_routes * 100, 1) if total_routes else 0
     }
 
 
@@ -116,18 +110,15 @@ def get_building_stats():
     """
     Get statistics by building
     """
-    locations = read_csv(config.LOCATIONS_CSV)
+    locations = read_records(config.LOCATIONS_CSV, columns=['building', 'floor', 'accessible'])
     building_data = defaultdict(lambda: {'count': 0, 'accessible': 0, 'floors': set()})
     
     for loc in locations:
-        building = loc.get('building', 'Unknown')
+        building = loc.building
         building_data[building]['count'] += 1
-        if loc.get('accessible', '').lower() == 'true':
+        if loc.accessible:
             building_data[building]['accessible'] += 1
-        try:
-            building_data[building]['floors'].add(int(loc.get('floor', 1)))
-        except ValueError:
-            pass
+        building_data[building]['floors'].add(loc.floor)
     
     result = {}
     for building, data in building_data.items():
@@ -145,10 +136,18 @@ def get_peak_times():
     """
     Analyze activity logs for peak usage times
     Returns hourly distribution of activity
+    Rotated segments are added up from their manifests; only the active log is parsed
     """
     hourly_counts = {str(h).zfill(2): 0 for h in range(24)}
     
     try:
+        flush_logs()
+        for manifest in segments(config.ACTIVITY_LOG):
+            for hour_key, count in manifest['hours'].items():
+                # 'YYYY-MM-DDTHH'
+                hour = hour_key[11:13]
+                hourly_counts[hour] = hourly_counts.get(hour, 0) + count
+        
         if os.path.exists(config.ACTIVITY_LOG):
             with open(config.ACTIVITY_LOG, 'r', encoding='utf-8') as f:
                 for line in f:
@@ -172,14 +171,10 @@ def get_route_distance_stats():
     """
     Get route distance statistics
     """
-    routes = read_csv(config.ROUTES_CSV)
+    routes = read_records(config.ROUTES_CSV, columns=['distance_m'])
     
-    distances = []
-    for route in routes:
-        try:
-            distances.append(int(route.get('distance_m', 0)))
-        except ValueError:
-            pass
+    # Rows whose distance does not parse come back as None
+    distances = [route.distance_m for route in routes if route.distance_m is not None]
     
     if not distances:
         return {'min': 0, 'max': 0, 'avg': 0, 'total': 0}
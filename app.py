@@ -21,6 +21,11 @@ app.secret_key = config.SECRET_KEY
 app.config['SESSION_TYPE'] = config.SESSION_TYPE
 app.config['PERMANENT_SESSION_LIFETIME'] = config.PERMANENT_SESSION_LIFETIME
 
+# Flush buffered writes and queued log lines on SIGTERM (they are also
+# flushed at normal exit)
+from utils import write_behind
+write_behind.install_signal_handlers()
+
 # Ensure required directories exist
 os.makedirs(config.LOGS_DIR, exist_ok=True)
 os.makedirs(os.path.join(config.STATIC_DIR, 'images', 'charts'), exist_ok=True)
@@ -29,10 +34,45 @@ os.makedirs(os.path.join(config.STATIC_DIR, 'images', 'charts'), exist_ok=True)
 from auth import auth_bp
 from navigation import navigation_bp
 from dashboard import dashboard_bp
+from notifications import notifications_bp
 
 app.register_blueprint(auth_bp)
 app.register_blueprint(navigation_bp)
 app.register_blueprint(dashboard_bp)
+app.register_blueprint(notifications_bp)
+
+
+def _reloader_watcher():
+    """
+    Check if this is the Werkzeug reloader's parent process
+    With the reloader ('python app.py', 'flask run --debug') the app is
+    loaded twice: by a parent that only watches for file changes and by a
+    child, with WERKZEUG_RUN_MAIN set, that serves requests
+    """
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        return False
+    if __name__ == '__main__':
+        return True
+    from flask.helpers import get_debug_flag
+    reload = '--reload' in sys.argv or (get_debug_flag() and '--no-reload' not in sys.argv)
+    return os.environ.get('FLASK_RUN_FROM_CLI') == 'true' and reload
+
+
+# Background jobs: archive old delivered notifications, reconcile the
+# notification counters, deliver new notifications and send scheduled ones,
+# then fill the buffer of recent notifications. Only the serving process
+# runs them, or pending rows and due schedules would be sent twice.
+if not _reloader_watcher():
+    from notifications.archive import start_retention_job
+    from notifications.counters import start_reconcile_job
+    from notifications.delivery import start_delivery_workers
+    from notifications.scheduler import start_scheduler
+    from notifications.recent import recent
+    start_retention_job()
+    start_reconcile_job()
+    start_delivery_workers()
+    start_scheduler()
+    recent.seed()
 
 
 # Root route
@@ -51,13 +91,13 @@ def index():
 def inject_user():
     """
     Inject user info into all templates
+    notification_count is a callable so templates without the badge skip the lookup
     """
-    from notifications.engine import get_undelivered_notifications
+    from notifications.engine import get_unread_count
     
-    notification_count = 0
-    if session.get('user_id'):
-        notifications = get_undelivered_notifications(session.get('user_id'))
-        notification_count = len(notifications)
+    def notification_count():
+        user_id = session.get('user_id')
+        return get_unread_count(user_id) if user_id else 0
     
     return {
         'notification_count': notification_count
@@ -3,8 +3,8 @@ MFA - Multi-Factor Authentication
 OTP-based authentication via console/file simulation
 """
 import random
-import os
 from datetime import datetime
+from utils.log_pipeline import log_event
 from utils.time_utils import get_timestamp, time_difference_seconds
 import config
 
@@ -38,10 +38,8 @@ def save_otp(user_id, otp):
     
     # File simulation - save to logs
     try:
-        os.makedirs(config.LOGS_DIR, exist_ok=True)
-        otp_log_path = os.path.join(config.LOGS_DIR, 'otp_log.txt')
-        with open(otp_log_path, 'a', encoding='utf-8') as f:
-            f.write(f"[{timestamp}] User {user_id}: OTP = {otp}\n")
+        log_event(config.OTP_LOG, f"[{timestamp}] User {user_id}: OTP = {otp}\n", 'otp',
+                  user_id=str(user_id), otp=otp)
     except Exception as e:
         print(f"Could not write OTP to file: {e}")
     
@@ -7,8 +7,8 @@ from flask import render_template, request, redirect, url_for, flash, session
 from auth import auth_bp
 from auth.mfa import generate_otp, save_otp, verify_otp
 from users.models import authenticate_user, create_user, get_user_by_id
+from utils.log_pipeline import log_event
 from utils.time_utils import get_timestamp
-import os
 import config
 
 
@@ -17,12 +17,10 @@ def log_activity(user_id, action, details=''):
     Log user activity
     """
     try:
-        os.makedirs(config.LOGS_DIR, exist_ok=True)
         timestamp = get_timestamp()
         log_entry = f"[{timestamp}] User {user_id}: {action} - {details}\n"
         
-        with open(config.ACTIVITY_LOG, 'a', encoding='utf-8') as f:
-            f.write(log_entry)
+        log_event(config.ACTIVITY_LOG, log_entry, 'activity', user_id=user_id, action=action, details=details)
     except Exception as e:
         print(f"Error writing to activity log: {e}")
 
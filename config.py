@@ -12,12 +12,94 @@ USERS_CSV = os.path.join(DATA_DIR, 'scns_users.csv')
 LOCATIONS_CSV = os.path.join(DATA_DIR, 'scns_locations.csv')
 ROUTES_CSV = os.path.join(DATA_DIR, 'scns_routes.csv')
 NOTIFICATIONS_CSV = os.path.join(DATA_DIR, 'scns_notifications.csv')
+BROADCASTS_CSV = os.path.join(DATA_DIR, 'scns_broadcasts.csv')
+SCHEDULES_CSV = os.path.join(DATA_DIR, 'scns_schedules.csv')
+MESSAGES_CSV = os.path.join(DATA_DIR, 'scns_messages.csv')
+
+# Storage backend: 'csv' (files above) or 'sqlite' (indexed database)
+STORAGE_BACKEND = 'csv'
+SQLITE_DB = os.path.join(DATA_DIR, 'scns.db')
+
+# Journaled row changes per CSV file before it is compacted into a new snapshot
+JOURNAL_COMPACT_THRESHOLD = 200
+
+# Ids reserved at a time from a table's persistent sequence ('<file>.seq')
+SEQUENCE_BLOCK_SIZE = 20
+
+# Keep an id -> byte offset index ('<file>.idx') for point lookups by id
+PK_INDEX_ENABLED = True
+
+# Durability of table writes: 'sync' writes to disk before a request returns;
+# 'write_behind' queues table changes in memory and a background writer
+# commits them in batches (a crash can lose up to WRITE_BEHIND_INTERVAL
+# seconds of writes). Log lines are always written asynchronously (see
+# LOG_QUEUE_SIZE).
+DURABILITY = 'sync'
+WRITE_BEHIND_INTERVAL = 1.0  # seconds
+WRITE_BEHIND_BATCH_SIZE = 100
+
+# Delivered notifications older than this move from the active table to
+# gzip monthly archives in NOTIFICATIONS_ARCHIVE_DIR; the job runs every
+# NOTIFICATION_ARCHIVE_INTERVAL seconds
+NOTIFICATIONS_ARCHIVE_DIR = os.path.join(DATA_DIR, 'archive')
+NOTIFICATION_RETENTION_DAYS = 30
+NOTIFICATION_ARCHIVE_INTERVAL = 3600
+
+# Seconds between full recounts of the materialised notification counters
+COUNTER_RECONCILE_INTERVAL = 600
+
+# Server-Sent Events stream (/notifications/stream): recent events kept for
+# clients reconnecting with Last-Event-ID, seconds between heartbeats on an
+# idle stream, and the reconnect delay suggested to browsers
+STREAM_BACKLOG = 1000
+STREAM_HEARTBEAT_INTERVAL = 15
+STREAM_RETRY_MS = 3000
+
+# Newest notifications kept in memory for the admin "recent" views
+RECENT_NOTIFICATIONS_SIZE = 50
+
+# Inbox API (/notifications/inbox): default and largest page size
+INBOX_PAGE_SIZE = 20
+INBOX_PAGE_MAX = 100
+
+# Notification delivery: channel ('console', 'spool' or 'smtp'), worker
+# threads, queue capacity, and attempts before a notification is marked
+# 'Failed' (retry n waits DELIVERY_RETRY_BASE * 2**(n-1) seconds, at most
+# DELIVERY_RETRY_MAX)
+DELIVERY_CHANNEL = 'spool'
+DELIVERY_SPOOL_DIR = os.path.join(DATA_DIR, 'spool')
+DELIVERY_WORKERS = 4
+DELIVERY_QUEUE_SIZE = 1000
+DELIVERY_MAX_ATTEMPTS = 5
+DELIVERY_RETRY_BASE = 2.0
+DELIVERY_RETRY_MAX = 300
+SMTP_HOST = 'localhost'
+SMTP_PORT = 1025
+SMTP_SENDER = 'noreply@scns.local'
 
 # Logs directory
 LOGS_DIR = os.path.join(BASE_DIR, 'logs')
 ACTIVITY_LOG = os.path.join(LOGS_DIR, 'activity_log.txt')
 ALERTS_LOG = os.path.join(LOGS_DIR, 'alerts_log.txt')
 AUDIT_LOG = os.path.join(LOGS_DIR, 'audit_log.txt')
+OTP_LOG = os.path.join(LOGS_DIR, 'otp_log.txt')
+
+# Log lines are queued (at most LOG_QUEUE_SIZE; more are dropped and
+# counted) and appended by one writer thread, up to LOG_BATCH_SIZE per
+# batch. With LOG_JSONL each event is also written as JSON to
+# '<log name>.jsonl' beside the text log.
+LOG_QUEUE_SIZE = 10000
+LOG_BATCH_SIZE = 500
+LOG_JSONL = True
+
+# A log reaching LOG_ROTATE_BYTES, or (with LOG_ROTATE_DAILY) last written
+# on an earlier day, is compressed into LOG_SEGMENTS_DIR with a manifest
+# of its time range and per-hour line counts before more is appended
+LOG_SEGMENTS_DIR = os.path.join(LOGS_DIR, 'segments')
+LOG_ROTATE_BYTES = 5 * 1024 * 1024
+LOG_ROTATE_DAILY = True
+# Search index of the alerts log (see utils/log_index.py)
+ALERTS_LOG_INDEX = os.path.join(LOGS_DIR, 'alerts_log.idx')
 
 # Static and Templates
 STATIC_DIR = os.path.join(BASE_DIR, 'static')
@@ -27,5 +109,8 @@ TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 SESSION_TYPE = 'filesystem'
 PERMANENT_SESSION_LIFETIME = 3600  # 1 hour
 
+# Users per page in the user management listing
+USERS_PAGE_SIZE = 50
+
 # MFA Configuration
 MFA_OTP_VALIDITY = 300  # 5 minutes in seconds
@@ -2,7 +2,8 @@
 Dashboard Routes
 Role-specific dashboard pages
 """
-from flask import render_template, session, redirect, url_for, flash, request
+import io
+from flask import render_template, session, redirect, url_for, flash, request, jsonify
 from dashboard import dashboard_bp
 from dashboard.widgets import (
     get_admin_widgets,
@@ -20,8 +21,11 @@ from users.services import (
     create_user_admin, 
     delete_user, 
     update_user_role, 
+    get_users_page,
     get_user_stats as get_user_role_stats
 )
+from users.importer import import_users
+from utils.time_utils import get_timestamp
 
 
 @dashboard_bp.route('/')
@@ -109,9 +113,12 @@ def view_notifications():
     View all notifications for current user
     """
     user_id = session.get('user_id')
-    notifications = get_user_notifications(user_id)
+    # Archived (older, read) notifications are only loaded on request
+    include_archived = request.args.get('archived') == '1'
+    notifications = get_user_notifications(user_id, include_archived=include_archived)
     
-    return render_template('notifications.html', notifications=notifications)
+    return render_template('notifications.html', notifications=notifications,
+                         include_archived=include_archived)
 
 
 @dashboard_bp.route('/notifications/mark-read')
@@ -131,11 +138,35 @@ def mark_notifications_read():
 def manage_users():
     """
     User management page (admin only)
+    Shows the first page; further pages load from users_data
     """
-    users = get_all_users()
+    filters = {
+        'sort': request.args.get('sort', 'id'),
+        'search': request.args.get('q', '').strip(),
+        'role': request.args.get('role', '')
+    }
+    users, next_cursor = get_users_page(filters['sort'], filters['search'], filters['role'],
+                                        request.args.get('after'))
     stats = get_user_role_stats()
     
-    return render_template('manage_users.html', users=users, stats=stats)
+    return render_template('manage_users.html', users=users, stats=stats,
+                         filters=filters, next_cursor=next_cursor)
+
+
+@dashboard_bp.route('/users/data')
+@admin_required
+def users_data():
+    """
+    JSON page of users for incremental loading (admin only)
+    """
+    users, next_cursor = get_users_page(request.args.get('sort', 'id'),
+                                        request.args.get('q', '').strip(),
+                                        request.args.get('role', ''),
+                                        request.args.get('after'))
+    return jsonify({
+        'users': [user.to_dict() for user in users],
+        'next': next_cursor
+    })
 
 
 @dashboard_bp.route('/users/create', methods=['GET', 'POST'])
@@ -160,6 +191,34 @@ def create_user_page():
     return render_template('create_user.html')
 
 
+@dashboard_bp.route('/users/import', methods=['GET', 'POST'])
+@admin_required
+def import_users_page():
+    """
+    Bulk import users from an uploaded CSV (admin only)
+    """
+    report = None
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Please choose a CSV file to upload.', 'warning')
+        else:
+            # Stream the upload instead of reading it into memory
+            stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+            default_role = request.form.get('default_role', 'student')
+            dry_run = request.form.get('dry_run') == 'on'
+            created, errors = import_users(stream, default_role, dry_run=dry_run)
+            report = {'created': created, 'errors': errors, 'dry_run': dry_run}
+            
+            if created:
+                verb = 'would be imported' if dry_run else 'imported'
+                flash(f'{len(created)} users {verb}.', 'success')
+            if errors:
+                flash(f'{len(errors)} rows skipped - see the report below.', 'warning')
+    
+    return render_template('import_users.html', report=report)
+
+
 @dashboard_bp.route('/users/delete/<int:user_id>', methods=['POST'])
 @admin_required
 def delete_user_page(user_id):
@@ -205,16 +264,22 @@ def content_management():
     """
     Content management page (Faculty and Admin only)
     """
-    from notifications.engine import get_all_notifications, get_notification_stats
+    from notifications.engine import get_recent_notifications, get_all_broadcasts, get_notification_stats
+    from notifications.scheduler import get_pending_schedules, RECURRENCES
     from utils.csv_handler import read_csv
     import config
     
-    notifications = get_all_notifications()[-20:]  # Last 20
+    notifications = get_recent_notifications(20)[::-1]  # Last 20, oldest first
+    broadcasts = get_all_broadcasts()[-20:]
+    schedules = get_pending_schedules()
     notif_stats = get_notification_stats()
     routes = read_csv(config.ROUTES_CSV)[:20]  # First 20 routes
     
     return render_template('content_management.html',
                          notifications=notifications,
+                         broadcasts=broadcasts,
+                         schedules=schedules,
+                         recurrences=RECURRENCES,
                          notif_stats=notif_stats,
                          routes=routes)
 
@@ -226,18 +291,30 @@ def add_notification():
     Add new notification (Faculty and Admin)
     """
     from notifications.engine import create_notification, broadcast_notification
+    from notifications.scheduler import schedule_notification, RECURRENCES
     from users.models import get_all_users
     
     if request.method == 'POST':
         message = request.form.get('message', '').strip()
         target = request.form.get('target', 'all')
         user_id = request.form.get('user_id', '')
+        send_at = request.form.get('send_at', '').strip()
+        recurrence = request.form.get('recurrence', '')
         
         if not message:
             flash('Please enter a notification message.', 'warning')
-            return render_template('add_notification.html', users=get_all_users())
+            return render_template('add_notification.html', users=get_all_users(), recurrences=RECURRENCES)
         
-        if target == 'all':
+        if send_at or recurrence:
+            target_value = {'role': request.form.get('role', 'student'), 'user': user_id}.get(target, '')
+            # A repeating notification without a start time starts now
+            schedule = schedule_notification(message, send_at or get_timestamp(), target=target, target_value=target_value,
+                                             recurrence=recurrence, created_by=session.get('user_id'))
+            if schedule:
+                flash(f"Notification scheduled for {schedule['send_at'].replace('T', ' ')[:16]}.", 'success')
+            else:
+                flash('Invalid schedule: choose a send time and a target.', 'danger')
+        elif target == 'all':
             count = broadcast_notification(message)
             flash(f'Notification sent to {count} users.', 'success')
         elif target == 'role':
@@ -253,7 +330,7 @@ def add_notification():
         return redirect(url_for('dashboard.content_management'))
     
     users = get_all_users()
-    return render_template('add_notification.html', users=users)
+    return render_template('add_notification.html', users=users, recurrences=RECURRENCES)
 
 
 @dashboard_bp.route('/content/notification/delete/<int:notif_id>', methods=['POST'])
@@ -262,10 +339,9 @@ def delete_notification(notif_id):
     """
     Delete notification (Faculty and Admin)
     """
-    from utils.csv_handler import delete_csv_row
-    import config
+    from notifications.engine import delete_notification as delete
     
-    if delete_csv_row(config.NOTIFICATIONS_CSV, 'id', notif_id):
+    if delete(notif_id):
         flash('Notification deleted.', 'success')
     else:
         flash('Failed to delete notification.', 'danger')
@@ -273,6 +349,22 @@ def delete_notification(notif_id):
     return redirect(url_for('dashboard.content_management'))
 
 
+@dashboard_bp.route('/content/schedule/cancel/<int:schedule_id>', methods=['POST'])
+@faculty_required
+def cancel_schedule(schedule_id):
+    """
+    Cancel a scheduled notification (Faculty and Admin)
+    """
+    from notifications.scheduler import cancel_schedule
+    
+    if cancel_schedule(schedule_id):
+        flash('Scheduled notification cancelled.', 'success')
+    else:
+        flash('Failed to cancel scheduled notification.', 'danger')
+    
+    return redirect(url_for('dashboard.content_management'))
+
+
 @dashboard_bp.route('/notifications/confirm/<int:notif_id>', methods=['GET'])
 @faculty_required
 def confirm_notification(notif_id):
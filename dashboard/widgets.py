@@ -11,6 +11,8 @@ from analytics.metrics import (
     get_peak_times
 )
 from notifications.engine import get_recent_notifications, get_undelivered_notifications
+from notifications.delivery import get_delivery_metrics
+from utils.log_pipeline import get_log_metrics
 from users.models import get_all_users
 
 
@@ -40,7 +42,9 @@ def get_admin_widgets():
         'notification_stats': get_notification_stats(),
         'popular_locations': get_popular_locations()[:5],
         'accessibility': get_accessibility_stats(),
-        'recent_notifications': get_recent_notifications(5)
+        'recent_notifications': get_recent_notifications(5),
+        'delivery': get_delivery_metrics(),
+        'logging': get_log_metrics()
     }
 
 
@@ -3,7 +3,7 @@ Accessibility - Lift and Disability Route Checks
 Accessible routing and lift status management
 """
 import config
-from utils.csv_handler import read_csv
+from utils.schema import read_records, ROUTE_SCHEMA
 from navigation.pathfinder import dijkstra_shortest_path, get_alternative_routes
 
 
@@ -22,19 +22,14 @@ def get_accessible_locations():
     """
     Get all accessible locations
     """
-    locations = read_csv(config.LOCATIONS_CSV)
-    accessible = []
-    for loc in locations:
-        if loc.get('accessible', '').lower() == 'true':
-            accessible.append(loc)
-    return accessible
+    return [loc.to_dict() for loc in read_records(config.LOCATIONS_CSV) if loc.accessible]
 
 
 def filter_accessible_routes(routes):
     """
     Filter routes to only include accessible ones
     """
-    return [r for r in routes if r.get('accessible', '').lower() == 'true']
+    return [r for r in routes if ROUTE_SCHEMA.value(r, 'accessible')]
 
 
 def check_lift_status(building=None):
@@ -67,13 +62,12 @@ def get_building_accessibility(building):
     """
     Get accessibility info for a building
     """
-    locations = read_csv(config.LOCATIONS_CSV)
-    building_locs = [loc for loc in locations if loc.get('building', '') == building]
+    building_locs = list(read_records(config.LOCATIONS_CSV, columns=['building', 'accessible'], where={'building': building}))
     
     if not building_locs:
         return None
     
-    accessible_count = sum(1 for loc in building_locs if loc.get('accessible', '').lower() == 'true')
+    accessible_count = sum(1 for loc in building_locs if loc.accessible)
     
     return {
         'building': building,
@@ -84,6 +78,13 @@ def get_building_accessibility(building):
     }
 
 
+def _locations_by_name():
+    """
+    Map location name -> typed location record
+    """
+    return {loc.name: loc for loc in read_records(config.LOCATIONS_CSV)}
+
+
 def needs_lift(path, locations_data=None):
     """
     Check if a path requires lift usage (crossing floors)
@@ -92,16 +93,12 @@ def needs_lift(path, locations_data=None):
         return False
     
     if locations_data is None:
-        locations_data = {loc['name']: loc for loc in read_csv(config.LOCATIONS_CSV)}
+        locations_data = _locations_by_name()
     
     floors = []
     for loc in path:
-        loc_data = locations_data.get(loc, {})
-        floor = loc_data.get('floor', 1)
-        try:
-            floors.append(int(floor))
-        except ValueError:
-            floors.append(1)
+        loc_data = locations_data.get(loc)
+        floors.append(loc_data.floor if loc_data else 1)
     
     # Check if there's a floor change
     return len(set(floors)) > 1
@@ -112,15 +109,15 @@ def get_accessibility_warnings(path):
     Generate accessibility warnings for a path
     """
     warnings = []
-    locations_data = {loc['name']: loc for loc in read_csv(config.LOCATIONS_CSV)}
+    locations_data = _locations_by_name()
     
     # Check each location in path
     for loc in path:
-        loc_data = locations_data.get(loc, {})
-        building = loc_data.get('building', '')
+        loc_data = locations_data.get(loc)
+        building = loc_data.building if loc_data else ''
         
         # Check if location is not accessible
-        if loc_data.get('accessible', '').lower() != 'true':
+        if not (loc_data and loc_data.accessible):
             warnings.append(f"Warning: {loc} may not be wheelchair accessible")
         
         # Check lift status for building
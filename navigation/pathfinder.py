@@ -4,6 +4,7 @@ Shortest path and alternative routes using Dijkstra's algorithm
 """
 import config
 from utils.csv_handler import read_csv
+from utils.schema import read_records
 from collections import defaultdict
 import heapq
 
@@ -20,11 +21,11 @@ def get_unique_locations():
     """
     Get unique location names from routes
     """
-    routes = read_csv(config.ROUTES_CSV)
+    routes = read_records(config.ROUTES_CSV, columns=['start_location', 'end_location'])
     locations = set()
     for route in routes:
-        locations.add(route.get('start_location', ''))
-        locations.add(route.get('end_location', ''))
+        locations.add(route.start_location)
+        locations.add(route.end_location)
     return sorted([loc for loc in locations if loc])
 
 
@@ -33,15 +34,14 @@ def build_graph(accessible_only=False):
     Build adjacency graph from routes CSV
     Returns: dict of {location: [(neighbor, distance, route_id, accessible), ...]}
     """
-    routes = read_csv(config.ROUTES_CSV)
     graph = defaultdict(list)
     
-    for route in routes:
-        start = route.get('start_location', '')
-        end = route.get('end_location', '')
-        distance = int(route.get('distance_m', 0))
-        accessible = route.get('accessible', '').lower() == 'true'
-        route_id = route.get('id', '')
+    for route in read_records(config.ROUTES_CSV):
+        start = route.start_location
+        end = route.end_location
+        distance = route.distance_m or 0
+        accessible = route.accessible
+        route_id = str(route.id)
         
         # Skip non-accessible routes if filter is on
         if accessible_only and not accessible:
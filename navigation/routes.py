@@ -17,8 +17,8 @@ from navigation.accessibility import (
     check_lift_status
 )
 from auth.permissions import login_required, visitor_allowed
+from utils.log_pipeline import log_event
 from utils.time_utils import get_timestamp
-import os
 import config
 
 
@@ -27,13 +27,11 @@ def log_navigation(user_id, start, end, success):
     Log navigation search for analytics
     """
     try:
-        os.makedirs(config.LOGS_DIR, exist_ok=True)
         timestamp = get_timestamp()
         status = "SUCCESS" if success else "NO_PATH"
         log_entry = f"[{timestamp}] User {user_id}: {start} -> {end} ({status})\n"
         
-        with open(config.ACTIVITY_LOG, 'a', encoding='utf-8') as f:
-            f.write(log_entry)
+        log_event(config.ACTIVITY_LOG, log_entry, 'navigation', user_id=user_id, start=start, end=end, status=status)
     except Exception as e:
         print(f"Error writing navigation log: {e}")
 
@@ -2,3 +2,5 @@
 from flask import Blueprint
 
 notifications_bp = Blueprint('notifications', __name__, url_prefix='/notifications')
+
+from notifications import routes
@@ -0,0 +1,200 @@
+"""
+Notification Archive
+Moves delivered notifications out of the active table into monthly archives
+
+The active table (config.NOTIFICATIONS_CSV) is the hot segment: undelivered
+notifications and delivered ones newer than
+config.NOTIFICATION_RETENTION_DAYS. Older delivered notifications are moved
+to gzip-compressed monthly segments in config.NOTIFICATIONS_ARCHIVE_DIR
+('scns_notifications_YYYY-MM.csv.gz', by created_at month). Rows from
+before created_at was recorded have no age and stay in the active table.
+
+Segments are appended to before the active table is rewritten. A run that
+fails cuts its segments back; one interrupted between the two writes leaves
+rows in both, so readers skip ids already read from the archive.
+"""
+import csv
+import gzip
+import os
+import threading
+import config
+from utils.csv_handler import transaction
+from utils.schema import NOTIFICATION_SCHEMA
+from notifications.counters import counters
+from notifications.messages import message_key, resolve
+from utils.time_utils import time_difference_seconds
+
+
+ARCHIVE_FIELDS = ['id', 'user_id', 'message', 'delivered', 'status', 'created_at']
+ARCHIVE_PREFIX = 'scns_notifications_'
+ARCHIVE_SUFFIX = '.csv.gz'
+
+
+def archive_path(month):
+    """
+    Get the archive segment path for a month ('YYYY-MM')
+    """
+    return os.path.join(config.NOTIFICATIONS_ARCHIVE_DIR, f"{ARCHIVE_PREFIX}{month}{ARCHIVE_SUFFIX}")
+
+
+def list_archive_months():
+    """
+    Get the months that have an archive segment, oldest first
+    """
+    if not os.path.isdir(config.NOTIFICATIONS_ARCHIVE_DIR):
+        return []
+    return sorted(
+        name[len(ARCHIVE_PREFIX):-len(ARCHIVE_SUFFIX)]
+        for name in os.listdir(config.NOTIFICATIONS_ARCHIVE_DIR)
+        if name.startswith(ARCHIVE_PREFIX) and name.endswith(ARCHIVE_SUFFIX)
+    )
+
+
+def _is_expired(notification, retention_seconds):
+    """
+    Check if a notification is delivered and past the retention period
+    Rows without a created_at are never expired
+    """
+    created_at = notification.get('created_at')
+    if not created_at or not NOTIFICATION_SCHEMA.value(notification, 'delivered'):
+        return False
+    return time_difference_seconds(created_at) > retention_seconds
+
+
+def _write_segment(month, rows):
+    """
+    Append rows to a month's archive segment
+    Each call adds a gzip member; gzip readers see one continuous file
+    """
+    os.makedirs(config.NOTIFICATIONS_ARCHIVE_DIR, exist_ok=True)
+    path = archive_path(month)
+    is_new = not os.path.exists(path)
+    with gzip.open(path, 'at', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=ARCHIVE_FIELDS, extrasaction='ignore')
+        if is_new:
+            writer.writeheader()
+        writer.writerows(rows)
+
+
+def _segment_size(month):
+    """
+    Get the size of a month's segment, or None if there is none yet
+    """
+    path = archive_path(month)
+    return os.path.getsize(path) if os.path.exists(path) else None
+
+
+def _discard_appends(sizes):
+    """
+    Cut segments back to their sizes before a failed archive run
+    """
+    for month, size in sizes.items():
+        path = archive_path(month)
+        try:
+            if size is None:
+                os.remove(path)
+            else:
+                with open(path, 'r+b') as f:
+                    f.truncate(size)
+        except OSError as e:
+            print(f"Error restoring archive {path}: {e}")
+
+
+def archive_delivered(retention_days=None):
+    """
+    Move expired delivered notifications from the active table to the archive
+    Returns the number of notifications archived
+    """
+    if retention_days is None:
+        retention_days = config.NOTIFICATION_RETENTION_DAYS
+    retention_seconds = retention_days * 86400
+    sizes = {}
+    committed = False
+    
+    try:
+        with counters.change() as delta:
+            with transaction(config.NOTIFICATIONS_CSV) as tx:
+                by_month = {}
+                for notification in tx.rows:
+                    if _is_expired(notification, retention_seconds):
+                        by_month.setdefault(notification['created_at'][:7], []).append(notification)
+                
+                # Archive first: if writing a segment fails the active table is left unchanged
+                for month, rows in by_month.items():
+                    sizes[month] = _segment_size(month)
+                    # Segments keep the text so they stand alone
+                    _write_segment(month, [resolve(notification) for notification in rows])
+                    for notification in rows:
+                        tx.delete('id', notification['id'])
+            committed = True
+            
+            # After the commit: only rows that were archived
+            for rows in by_month.values():
+                for notification in rows:
+                    delta.removed(message_key(notification.get('message_id'), notification.get('message')),
+                                  notification.get('user_id'), delivered=True)
+    except Exception as e:
+        if not committed:
+            # The rows are still active: drop their archived copies
+            _discard_appends(sizes)
+        print(f"Error archiving notifications: {e}")
+        return 0
+    
+    return sum(len(rows) for rows in by_month.values())
+
+
+def read_archived(months=None):
+    """
+    Stream archived notifications, oldest month first
+    months: only read these months ('YYYY-MM'); all by default
+    An id archived twice (see the module docstring) is read once
+    """
+    seen = set()
+    for month in months or list_archive_months():
+        path = archive_path(month)
+        if not os.path.exists(path):
+            continue
+        try:
+            with gzip.open(path, 'rt', newline='', encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    if row.get('id') not in seen:
+                        seen.add(row.get('id'))
+                        yield row
+        except (OSError, EOFError) as e:
+            # A segment cut short by a crash is read up to the damage
+            print(f"Error reading archive {path}: {e}")
+
+
+# ========== RETENTION JOB ==========
+
+_retention_thread = None
+_retention_lock = threading.Lock()
+
+
+def start_retention_job(interval=None):
+    """
+    Run archive_delivered every interval seconds on a background thread
+    """
+    global _retention_thread
+    if interval is None:
+        interval = config.NOTIFICATION_ARCHIVE_INTERVAL
+    
+    with _retention_lock:
+        if _retention_thread is not None and _retention_thread.is_alive():
+            return
+        _retention_thread = threading.Thread(target=_retention_loop, args=(interval,),
+                                             name='notification-archiver', daemon=True)
+        _retention_thread.start()
+
+
+def _retention_loop(interval):
+    stop = threading.Event()
+    while not stop.wait(interval):
+        archived = archive_delivered()
+        if archived:
+            print(f"Archived {archived} delivered notifications")
+
+
+if __name__ == '__main__':
+    count = archive_delivered()
+    print(f"Archived {count} delivered notifications")
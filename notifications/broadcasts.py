@@ -0,0 +1,277 @@
+"""
+Broadcasts
+Notifications sent to every user (or every user with a role), stored once
+
+A broadcast is one row in config.BROADCASTS_CSV: the message, the target
+role ('' for everyone), the highest user id when it was sent and a bitmap
+with one bit per user id, set once that user has read it. Sending costs
+one row and one log line whatever the number of recipients; inboxes merge
+the broadcasts addressed to the user with their direct notifications.
+
+Users created after a broadcast do not receive it. Role targets are
+matched against the user's current role, both normalised as in the session
+(staff -> faculty).
+"""
+import base64
+import threading
+from collections import Counter
+import config
+from utils.csv_handler import append_csv, allocate_ids, update_csv_rows, table_version
+from utils.schema import read_records, BROADCAST_SCHEMA
+from utils.time_utils import get_timestamp
+from users.models import user_index, normalize_role
+from notifications.messages import intern_message, message_key, message_text
+
+
+BROADCAST_FIELDS = ['id', 'message_id', 'role', 'max_user_id', 'recipients', 'delivered_bitmap', 'created_at']
+ID_PREFIX = 'B'
+
+
+# ========== BITMAPS ==========
+
+def _decode(text):
+    return bytearray(base64.b64decode(text)) if text else bytearray()
+
+
+def _encode(bits):
+    return base64.b64encode(bytes(bits)).decode('ascii')
+
+
+def _is_set(bits, user_id):
+    byte = user_id >> 3
+    return byte < len(bits) and bool(bits[byte] & (1 << (user_id & 7)))
+
+
+def _set(bits, user_id):
+    byte = user_id >> 3
+    if byte >= len(bits):
+        bits.extend(bytes(byte + 1 - len(bits)))
+    bits[byte] |= 1 << (user_id & 7)
+
+
+def _user_key(user_id):
+    try:
+        return int(user_id)
+    except (TypeError, ValueError):
+        return None
+
+
+class Broadcast:
+    """
+    One broadcast with its decoded delivery bitmap
+    """
+    __slots__ = ('id', 'message_id', 'message', 'role', 'max_user_id', 'recipients', 'bits', 'created_at')
+    
+    def __init__(self, record):
+        self.id = record.id
+        self.message_id = message_key(record.message_id, record.message)
+        self.message = record.message or message_text(self.message_id)
+        self.role = record.role.casefold()
+        self.max_user_id = record.max_user_id
+        self.recipients = record.recipients
+        self.bits = _decode(record.delivered_bitmap)
+        self.created_at = record.created_at
+    
+    def targets(self, user_id, role):
+        return user_id <= self.max_user_id and (not self.role or normalize_role(self.role) == role)
+    
+    def as_notification(self, user_id):
+        """
+        Inbox entry for one recipient, shaped like a notifications row
+        """
+        delivered = _is_set(self.bits, user_id)
+        return {
+            'id': f"{ID_PREFIX}{self.id}",
+            'user_id': str(user_id),
+            'message': self.message,
+            'delivered': 'True' if delivered else 'False',
+            'status': 'Delivered' if delivered else 'Pending',
+            'created_at': self.created_at,
+            'broadcast_id': str(self.id)
+        }
+
+
+class BroadcastStore:
+    """
+    In-memory copy of config.BROADCASTS_CSV
+    Reloaded when the table version changes; this process's own writes are
+    applied in place. Unread counts are cached per user.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self.broadcasts = []
+        self._unread = {}
+    
+    def _current(self):
+        """
+        Reload if the table changed since it was read (caller holds the lock)
+        """
+        version = table_version(config.BROADCASTS_CSV)
+        if version != self._version:
+            self.broadcasts = [Broadcast(r) for r in read_records(config.BROADCASTS_CSV)]
+            self._unread = {}
+            self._version = version
+        return self
+    
+    def _in_step(self):
+        return self._version is not None and table_version(config.BROADCASTS_CSV) == self._version
+    
+    @staticmethod
+    def _recipient(user_id):
+        """
+        Get (user id as int, normalised role), or None for an unknown user
+        Looked up before taking the store lock
+        """
+        key = _user_key(user_id)
+        user = user_index.get('by_id', str(key)) if key is not None else None
+        if user is None:
+            return None
+        return key, normalize_role(user.get('role'))
+    
+    def create(self, message, role=None):
+        """
+        Store a broadcast
+        Returns: the saved row, or None if it could not be saved
+        """
+        counts = user_index.role_counts()
+        recipients = sum(count for user_role, count in counts.items()
+                         if not role or normalize_role(user_role) == normalize_role(role))
+        message_id = intern_message(message)
+        if message_id is None:
+            return None
+        row = {
+            'id': str(allocate_ids(config.BROADCASTS_CSV)),
+            'message_id': str(message_id),
+            'role': role or '',
+            'max_user_id': str(user_index.max_id()),
+            'recipients': str(recipients),
+            'delivered_bitmap': '',
+            'created_at': get_timestamp()
+        }
+        
+        with self._lock:
+            in_step = self._in_step()
+            if not append_csv(config.BROADCASTS_CSV, row, BROADCAST_FIELDS):
+                return None
+            if in_step:
+                self.broadcasts.append(Broadcast(BROADCAST_SCHEMA.parse(row)))
+                self._unread = {}
+                self._version = table_version(config.BROADCASTS_CSV)
+        return row
+    
+    def for_user(self, user_id):
+        """
+        Get the broadcasts addressed to a user as inbox entries, oldest first
+        """
+        recipient = self._recipient(user_id)
+        if recipient is None:
+            return []
+        key, role = recipient
+        with self._lock:
+            return [b.as_notification(key) for b in self._current().broadcasts if b.targets(key, role)]
+    
+    def unread_count(self, user_id):
+        """
+        Get the number of broadcasts a user has not read
+        """
+        recipient = self._recipient(user_id)
+        if recipient is None:
+            return 0
+        key, role = recipient
+        with self._lock:
+            current = self._current()
+            count = current._unread.get(recipient)
+            if count is None:
+                count = sum(1 for b in current.broadcasts
+                            if b.targets(key, role) and not _is_set(b.bits, key))
+                current._unread[recipient] = count
+            return count
+    
+    def mark_read(self, user_id):
+        """
+        Set a user's bit on every broadcast addressed to them
+        Returns the number of broadcasts newly marked
+        """
+        recipient = self._recipient(user_id)
+        if recipient is None:
+            return 0
+        key, role = recipient
+        
+        with self._lock:
+            current = self._current()
+            in_step = self._in_step()
+            unread = [b.id for b in current.broadcasts if b.targets(key, role) and not _is_set(b.bits, key)]
+            marked = {}
+            
+            def mark(row):
+                # Re-checked on the stored bitmap: another process may have set the bit
+                bits = _decode(row.get('delivered_bitmap'))
+                if _is_set(bits, key):
+                    return None
+                _set(bits, key)
+                marked[int(row['id'])] = bits
+                return {'delivered_bitmap': _encode(bits)}
+            
+            # Only the changed rows are written, each with its new bitmap
+            if not unread or not update_csv_rows(config.BROADCASTS_CSV, 'id', unread, mark):
+                return 0
+            if in_step and marked:
+                for b in self.broadcasts:
+                    if b.id in marked:
+                        b.bits = marked[b.id]
+                self._unread[recipient] = 0
+                self._version = table_version(config.BROADCASTS_CSV)
+        return len(marked)
+    
+    def recipients(self, broadcast_id):
+        """
+        Get the users a broadcast is addressed to, in id order
+        Read from the user index one role at a time
+        """
+        with self._lock:
+            broadcast = next((b for b in self._current().broadcasts if b.id == _user_key(broadcast_id)), None)
+        if broadcast is None:
+            return []
+        users = []
+        for user_role in user_index.role_counts():
+            role = normalize_role(user_role)
+            if broadcast.role and normalize_role(broadcast.role) != role:
+                continue
+            for user in user_index.with_role(user_role):
+                key = _user_key(user.get('id'))
+                if key is not None and broadcast.targets(key, role):
+                    users.append(user)
+        return sorted(users, key=lambda user: _user_key(user['id']))
+    
+    def stats(self):
+        """
+        Get (recipients, delivered, recipients by message id) over all broadcasts
+        """
+        with self._lock:
+            current = self._current()
+            total = 0
+            delivered = 0
+            by_type = Counter()
+            for b in current.broadcasts:
+                total += b.recipients
+                delivered += int.from_bytes(b.bits, 'little').bit_count()
+                by_type[b.message_id] += b.recipients
+            return total, delivered, by_type
+    
+    def all(self):
+        """
+        Get every broadcast as a row dict with its read count
+        """
+        with self._lock:
+            return [{
+                'id': f"{ID_PREFIX}{b.id}",
+                'message': b.message,
+                'role': b.role,
+                'recipients': b.recipients,
+                'read': int.from_bytes(b.bits, 'little').bit_count(),
+                'created_at': b.created_at
+            } for b in self._current().broadcasts]
+
+
+broadcasts = BroadcastStore()
@@ -0,0 +1,200 @@
+"""
+Notification Counters
+Materialised totals for the active notifications table
+
+Keeps total, delivered, per-message-id and per-user unread counts so
+dashboards and the navigation badge do not recount the table on every
+view. Writers wrap their change in counters.change() and record its
+effect, which is applied in O(1). The counters remember the table version
+they match: a change made elsewhere (another process, a direct CSV edit,
+compaction) makes the next read recount. A background job also reconciles
+against a full scan every config.COUNTER_RECONCILE_INTERVAL seconds.
+Broadcasts keep their own counts (see broadcasts.py) and are added in by
+stats() and unread_count().
+"""
+import threading
+from collections import Counter
+from contextlib import contextmanager
+import config
+from utils.csv_handler import table_version
+from utils.schema import read_records
+from notifications.broadcasts import broadcasts
+from notifications.messages import message_key, key_text
+
+
+class Delta:
+    """
+    Effect of one write on the counters
+    """
+    def __init__(self):
+        self.total = 0
+        self.delivered = 0
+        self.by_type = Counter()
+        self.unread = Counter()
+    
+    def created(self, message_id, user_id, delivered=False):
+        self.total += 1
+        self.by_type[message_id] += 1
+        if delivered:
+            self.delivered += 1
+        else:
+            self.unread[str(user_id)] += 1
+    
+    def marked_delivered(self, user_id, count=1):
+        self.delivered += count
+        self.unread[str(user_id)] -= count
+    
+    def removed(self, message_id, user_id, delivered):
+        self.total -= 1
+        self.by_type[message_id] -= 1
+        if delivered:
+            self.delivered -= 1
+        else:
+            self.unread[str(user_id)] -= 1
+
+
+class NotificationCounters:
+    """
+    Counters over config.NOTIFICATIONS_CSV
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self.total = 0
+        self.delivered = 0
+        self.by_type = Counter()
+        self.unread = Counter()
+    
+    def _recount(self):
+        total = 0
+        delivered = 0
+        by_type = Counter()
+        unread = Counter()
+        for n in read_records(config.NOTIFICATIONS_CSV, columns=['user_id', 'message', 'message_id', 'delivered']):
+            total += 1
+            if n.delivered:
+                delivered += 1
+            else:
+                unread[str(n.user_id)] += 1
+            by_type[message_key(n.message_id, n.message)] += 1
+        return total, delivered, by_type, unread
+    
+    def _current(self):
+        """
+        Recount if the table changed since the counters were last in step (caller holds the lock)
+        """
+        version = table_version(config.NOTIFICATIONS_CSV)
+        if version != self._version:
+            self.total, self.delivered, self.by_type, self.unread = self._recount()
+            # Version from before the recount: a write during it forces another
+            self._version = version
+        return self
+    
+    @contextmanager
+    def change(self):
+        """
+        Wrap a write to the notifications table and record its effect
+        
+        Usage:
+            with counters.change() as delta:
+                if append_csv(config.NOTIFICATIONS_CSV, row):
+                    delta.created(row['message_id'], row['user_id'])
+        
+        The delta is applied only if the counters matched the table before
+        the write; otherwise the next read recounts. Writers are serialised
+        on the counters lock, which is always taken before the table lock.
+        """
+        with self._lock:
+            in_step = self._version is not None and table_version(config.NOTIFICATIONS_CSV) == self._version
+            delta = Delta()
+            yield delta
+            if in_step:
+                self.total += delta.total
+                self.delivered += delta.delivered
+                self.by_type.update(delta.by_type)
+                self.unread.update(delta.unread)
+                # Drop entries that reached zero
+                self.by_type = +self.by_type
+                self.unread = +self.unread
+                self._version = table_version(config.NOTIFICATIONS_CSV)
+    
+    def stats(self):
+        """
+        Get notification statistics
+        Same shape as engine.get_notification_stats; broadcasts count once per recipient
+        """
+        with self._lock:
+            current = self._current()
+            total, delivered, by_type = current.total, current.delivered, Counter(current.by_type)
+        broadcast_total, broadcast_delivered, broadcast_types = broadcasts.stats()
+        total += broadcast_total
+        delivered += broadcast_delivered
+        # Counted by message key; reported by text
+        by_text = Counter()
+        for key, count in (by_type + broadcast_types).items():
+            by_text[key_text(key) or 'Unknown'] += count
+        return {
+            'total': total,
+            'delivered': delivered,
+            'pending': total - delivered,
+            'delivery_rate': round(delivered / total * 100, 1) if total > 0 else 0,
+            'by_type': dict(by_text)
+        }
+    
+    def unread_count(self, user_id):
+        """
+        Get the number of undelivered notifications for a user, broadcasts included
+        """
+        with self._lock:
+            direct = self._current().unread.get(str(user_id), 0)
+        return direct + broadcasts.unread_count(user_id)
+    
+    def reconcile(self):
+        """
+        Recount from a full scan and replace the counters
+        Returns True if they had drifted
+        """
+        with self._lock:
+            version = table_version(config.NOTIFICATIONS_CSV)
+            counts = self._recount()
+            drifted = (self._version == version and
+                       counts != (self.total, self.delivered, self.by_type, self.unread))
+            self.total, self.delivered, self.by_type, self.unread = counts
+            self._version = version
+        if drifted:
+            print("Notification counters had drifted and were reconciled")
+        return drifted
+
+
+counters = NotificationCounters()
+
+
+# ========== RECONCILE JOB ==========
+
+_reconcile_thread = None
+_reconcile_lock = threading.Lock()
+
+
+def start_reconcile_job(interval=None):
+    """
+    Reconcile the counters every interval seconds on a background thread
+    """
+    global _reconcile_thread
+    if interval is None:
+        interval = config.COUNTER_RECONCILE_INTERVAL
+    
+    with _reconcile_lock:
+        if _reconcile_thread is not None and _reconcile_thread.is_alive():
+            return
+        _reconcile_thread = threading.Thread(target=_reconcile_loop, args=(interval,),
+                                             name='counter-reconciler', daemon=True)
+        _reconcile_thread.start()
+
+
+def _reconcile_loop(interval):
+    stop = threading.Event()
+    while not stop.wait(interval):
+        try:
+            counters.reconcile()
+        except Exception as e:
+            print(f"Error reconciling notification counters: {e}")
@@ -0,0 +1,268 @@
+"""
+Notification Delivery
+Background workers that deliver new notifications through a channel
+
+New notifications are put on a bounded queue and sent by a pool of
+config.DELIVERY_WORKERS threads through config.DELIVERY_CHANNEL:
+'console' (print), 'spool' (one JSON file per message in
+config.DELIVERY_SPOOL_DIR) or 'smtp' (a local SMTP server such as
+`python -m aiosmtpd -n -l localhost:1025`). A broadcast is one job: the
+console and spool channels record it once, smtp mails each recipient. A
+failed attempt is retried
+with exponential backoff up to config.DELIVERY_MAX_ATTEMPTS times. Every
+outcome goes to the alert log, and the notification's status becomes
+'Sent' or 'Failed'. Notifications still 'Pending' when the workers start
+(e.g. queued before a restart) are queued again.
+"""
+import heapq
+import json
+import os
+import queue
+import smtplib
+import threading
+import time
+from collections import deque
+from email.message import EmailMessage
+import config
+from utils.csv_handler import read_csv_iter
+from utils.time_utils import get_timestamp
+from notifications.logger import log_alert
+from users.models import user_index
+from notifications.messages import resolve
+from notifications.broadcasts import broadcasts
+
+
+# ========== CHANNELS ==========
+
+def _deliver_console(job):
+    print(f"[Notification {job['id']}] To user {job['user_id']}: {job['message']}")
+
+
+def _deliver_spool(job):
+    os.makedirs(config.DELIVERY_SPOOL_DIR, exist_ok=True)
+    path = os.path.join(config.DELIVERY_SPOOL_DIR, f"{job['id']}.json")
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(dict(job, spooled_at=get_timestamp()), f)
+    os.replace(temp_path, path)
+
+
+def _deliver_smtp(job):
+    if job.get('broadcast_id'):
+        # Recipients without an email address still see it in their inbox
+        users = [user for user in broadcasts.recipients(job['broadcast_id']) if user.get('email')]
+    else:
+        user = user_index.get('by_id', str(job['user_id'])) if job['user_id'] else None
+        if user is None or not user.get('email'):
+            raise ValueError(f"No email address for user {job['user_id']}")
+        users = [user]
+    
+    # A retry skips the recipients an earlier attempt reached
+    sent_to = job.setdefault('sent_to', [])
+    with smtplib.SMTP(config.SMTP_HOST, config.SMTP_PORT, timeout=10) as smtp:
+        for user in users:
+            if user['id'] in sent_to:
+                continue
+            email = EmailMessage()
+            email['From'] = config.SMTP_SENDER
+            email['To'] = user['email']
+            email['Subject'] = 'Campus notification'
+            email.set_content(job['message'])
+            smtp.send_message(email)
+            sent_to.append(user['id'])
+
+
+CHANNELS = {
+    'console': _deliver_console,
+    'spool': _deliver_spool,
+    'smtp': _deliver_smtp
+}
+
+
+# ========== METRICS ==========
+
+class DeliveryMetrics:
+    """
+    Running totals and recent throughput of the delivery workers
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.dropped = 0
+        self._recent = deque()  # completion times within the last minute
+    
+    def record(self, outcome):
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+            if outcome == 'sent':
+                now = time.monotonic()
+                self._recent.append(now)
+                while self._recent and self._recent[0] < now - 60:
+                    self._recent.popleft()
+    
+    def per_minute(self):
+        with self._lock:
+            cutoff = time.monotonic() - 60
+            while self._recent and self._recent[0] < cutoff:
+                self._recent.popleft()
+            return len(self._recent)
+
+
+metrics = DeliveryMetrics()
+
+
+# ========== QUEUE AND WORKERS ==========
+
+_queue = queue.Queue(maxsize=config.DELIVERY_QUEUE_SIZE)
+_retries = []  # heap of (due time, sequence, job)
+_retry_cond = threading.Condition()
+_retry_sequence = 0
+_workers = []
+_start_lock = threading.Lock()
+
+
+def enqueue(notification):
+    """
+    Queue a notification for delivery
+    Returns False if the queue is full (the notification stays 'Pending')
+    """
+    job = {
+        'id': str(notification.get('id')),
+        'user_id': str(notification.get('user_id') or ''),
+        'message': notification.get('message', ''),
+        'attempt': 0
+    }
+    if notification.get('broadcast_id'):
+        job['broadcast_id'] = str(notification['broadcast_id'])
+    try:
+        _queue.put_nowait(job)
+        return True
+    except queue.Full:
+        metrics.record('dropped')
+        log_alert(job['id'], job['user_id'], job['message'], 'QUEUE_FULL')
+        return False
+
+
+def _retry_delay(attempt):
+    return min(config.DELIVERY_RETRY_BASE * (2 ** (attempt - 1)), config.DELIVERY_RETRY_MAX)
+
+
+def _schedule_retry(job):
+    global _retry_sequence
+    with _retry_cond:
+        _retry_sequence += 1
+        heapq.heappush(_retries, (time.monotonic() + _retry_delay(job['attempt']), _retry_sequence, job))
+        _retry_cond.notify()
+
+
+def _set_status(job, status):
+    # Broadcasts ('B<id>') have no per-user row to update
+    if job['id'].isdigit():
+        from notifications.engine import set_status  # the engine imports this module
+        set_status(job['id'], status, user_id=job['user_id'])
+
+
+def _deliver(job):
+    """
+    One delivery attempt
+    """
+    channel = config.DELIVERY_CHANNEL
+    job['attempt'] += 1
+    try:
+        CHANNELS[channel](job)
+    except Exception as e:
+        if job['attempt'] < config.DELIVERY_MAX_ATTEMPTS:
+            metrics.record('retried')
+            log_alert(job['id'], job['user_id'], job['message'], f"RETRY {job['attempt']} ({channel}: {e})")
+            _schedule_retry(job)
+        else:
+            metrics.record('failed')
+            log_alert(job['id'], job['user_id'], job['message'], f"FAILED after {job['attempt']} attempts ({channel}: {e})")
+            _set_status(job, 'Failed')
+        return
+    
+    metrics.record('sent')
+    log_alert(job['id'], job['user_id'], job['message'], f"SENT via {channel}")
+    _set_status(job, 'Sent')
+
+
+def _worker_loop():
+    while True:
+        job = _queue.get()
+        try:
+            _deliver(job)
+        except Exception as e:
+            print(f"Error delivering notification {job.get('id')}: {e}")
+        finally:
+            _queue.task_done()
+
+
+def _retry_loop():
+    """
+    Move retries back onto the queue when they fall due
+    """
+    while True:
+        with _retry_cond:
+            while not _retries or _retries[0][0] > time.monotonic():
+                _retry_cond.wait(_retries[0][0] - time.monotonic() if _retries else None)
+            due = []
+            while _retries and _retries[0][0] <= time.monotonic():
+                due.append(heapq.heappop(_retries)[2])
+        for job in due:
+            # Blocks while the queue is full rather than dropping a retry
+            _queue.put(job)
+
+
+def requeue_pending():
+    """
+    Queue every notification still 'Pending'
+    Returns the number queued
+    """
+    count = 0
+    for notification in list(read_csv_iter(config.NOTIFICATIONS_CSV, where={'status': 'Pending'})):
+        if not enqueue(resolve(notification)):
+            break
+        count += 1
+    return count
+
+
+def start_delivery_workers(workers=None):
+    """
+    Start the delivery worker pool and the retry scheduler
+    """
+    if workers is None:
+        workers = config.DELIVERY_WORKERS
+    
+    with _start_lock:
+        if _workers:
+            return
+        for number in range(workers):
+            thread = threading.Thread(target=_worker_loop, name=f'delivery-{number + 1}', daemon=True)
+            thread.start()
+            _workers.append(thread)
+        thread = threading.Thread(target=_retry_loop, name='delivery-retry', daemon=True)
+        thread.start()
+        _workers.append(thread)
+    requeue_pending()
+
+
+def get_delivery_metrics():
+    """
+    Get delivery worker statistics for the admin dashboard
+    """
+    with _retry_cond:
+        waiting_retry = len(_retries)
+    return {
+        'channel': config.DELIVERY_CHANNEL,
+        'workers': sum(1 for thread in _workers if thread.name != 'delivery-retry' and thread.is_alive()),
+        'queue_depth': _queue.qsize(),
+        'queue_capacity': config.DELIVERY_QUEUE_SIZE,
+        'waiting_retry': waiting_retry,
+        'sent': metrics.sent,
+        'failed': metrics.failed,
+        'retried': metrics.retried,
+        'dropped': metrics.dropped,
+        'per_minute': metrics.per_minute()
+    }
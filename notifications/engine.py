@@ -3,18 +3,65 @@ Notification Engine
 Rules, triggers, and notification management
 """
 import config
-from utils.csv_handler import read_csv, write_csv, append_csv, get_next_id, update_csv_row
+from utils.csv_handler import (
+    read_csv, get_csv_row, get_csv_rows, append_csv, allocate_ids,
+    update_csv_row, update_csv_rows, delete_csv_row
+)
+from utils.schema import read_records, get_record, get_records, NOTIFICATION_SCHEMA
+from utils.log_pipeline import log_event
+from notifications import archive
+from notifications.broadcasts import broadcasts, ID_PREFIX
+from notifications.counters import counters
+from notifications.recent import recent, get_recent
+from notifications.inbox import inbox
+from notifications.pubsub import publish_notification, publish_read
+from notifications import delivery
+from notifications.messages import intern_message, message_key, key_text, resolve
+from collections import Counter
 from utils.time_utils import get_timestamp
-import os
+import itertools
 
 
-def get_user_notifications(user_id):
+def get_user_notifications(user_id, include_archived=False):
     """
-    Get all notifications for a user
+    Get all notifications for a user, direct and broadcast, oldest first
+    Archived notifications are only read when include_archived is set
     """
-    notifications = read_csv(config.NOTIFICATIONS_CSV)
-    user_notifs = [n for n in notifications if str(n.get('user_id')) == str(user_id)]
-    return user_notifs
+    notifications = [resolve(n) for n in _user_rows(user_id)]
+    if include_archived:
+        archived = [n for n in archive.read_archived() if n.get('user_id') == str(user_id)]
+        notifications = archived + notifications
+    # Stable sort: rows from before created_at was recorded stay first, in file order
+    return sorted(notifications + broadcasts.for_user(user_id), key=lambda n: n.get('created_at') or '')
+
+
+def _user_rows(user_id):
+    """
+    Get a user's notification rows by id from the inbox index, oldest first
+    """
+    return get_csv_rows(config.NOTIFICATIONS_CSV, inbox.ids(user_id))
+
+
+def get_inbox_page(user_id, before_id=None, since_id=None, limit=None):
+    """
+    Get one page of a user's inbox for the inbox API (see InboxIndex.page)
+    """
+    return inbox.page(user_id, before_id, since_id, limit or config.INBOX_PAGE_SIZE)
+
+
+def get_inbox_etag(user_id, before_id=None, since_id=None, limit=None):
+    """
+    Get the ETag of one page of a user's inbox
+    """
+    return inbox.etag(user_id, before_id, since_id, limit)
+
+
+def get_unread_count(user_id):
+    """
+    Get the number of undelivered notifications for a user
+    Served from the counters instead of reading the user's notifications
+    """
+    return counters.unread_count(user_id)
 
 
 def get_undelivered_notifications(user_id):
@@ -22,26 +69,42 @@ def get_undelivered_notifications(user_id):
     Get undelivered notifications for a user
     """
     notifications = get_user_notifications(user_id)
-    return [n for n in notifications if n.get('delivered', '').lower() != 'true']
+    return [n for n in notifications if not NOTIFICATION_SCHEMA.value(n, 'delivered')]
 
 
 def create_notification(user_id, message):
     """
     Create a new notification
+    The text is stored once in the message table and referenced by id
     """
-    next_id = get_next_id(config.NOTIFICATIONS_CSV)
+    message_id = intern_message(message)
+    if message_id is None:
+        return None
+    next_id = allocate_ids(config.NOTIFICATIONS_CSV)
     
-    notification = {
+    row = {
         'id': str(next_id),
         'user_id': str(user_id),
-        'message': message,
+        'message': '',
         'delivered': 'False',
-        'status': 'Pending'
+        'status': 'Pending',
+        'created_at': get_timestamp(),
+        'message_id': str(message_id)
     }
     
-    fieldnames = ['id', 'user_id', 'message', 'delivered', 'status']
-    if append_csv(config.NOTIFICATIONS_CSV, notification, fieldnames):
+    fieldnames = ['id', 'user_id', 'message', 'delivered', 'status', 'created_at', 'message_id']
+    with counters.change() as delta, recent.change() as buffer, inbox.change() as index:
+        created = append_csv(config.NOTIFICATIONS_CSV, row, fieldnames)
+        if created:
+            delta.created(message_id, user_id)
+            buffer.append(row)
+            index.add(row)
+    
+    notification = dict(row, message=message)
+    if created:
         log_notification(next_id, message, 'CREATED')
+        publish_notification(notification, user_id=user_id)
+        delivery.enqueue(notification)
         return notification
     return None
 
@@ -50,7 +113,12 @@ def mark_delivered(notification_id):
     """
     Mark notification as delivered
     """
-    update_csv_row(config.NOTIFICATIONS_CSV, 'id', notification_id, {'delivered': 'True'})
+    with counters.change() as delta, inbox.change() as index:
+        notification = get_record(config.NOTIFICATIONS_CSV, notification_id)
+        if update_csv_row(config.NOTIFICATIONS_CSV, 'id', notification_id, {'delivered': 'True'}) and notification:
+            index.touch(notification.user_id)
+            if not notification.delivered:
+                delta.marked_delivered(notification.user_id)
     log_notification(notification_id, '', 'DELIVERED')
 
 
@@ -58,84 +126,148 @@ def confirm_notification(notification_id):
     """
     Confirm notification status (admin action)
     """
-    update_csv_row(config.NOTIFICATIONS_CSV, 'id', notification_id, {'status': 'Confirmed'})
+    set_status(notification_id, 'Confirmed')
     log_notification(notification_id, '', 'CONFIRMED')
     return True
 
 
-def get_notification_by_id(notification_id):
+def delete_notification(notification_id):
+    """
+    Delete a notification (admin action)
+    """
+    with counters.change() as delta, recent.change() as buffer, inbox.change() as index:
+        notification = get_record(config.NOTIFICATIONS_CSV, notification_id)
+        deleted = notification is not None and delete_csv_row(config.NOTIFICATIONS_CSV, 'id', notification_id)
+        if deleted:
+            delta.removed(message_key(notification.message_id, notification.message),
+                          notification.user_id, notification.delivered)
+            buffer.remove(notification_id)
+            index.remove(notification)
+    if deleted:
+        log_notification(notification_id, '', 'DELETED')
+    return deleted
+
+
+def set_status(notification_id, status, user_id=None):
+    """
+    Set the delivery status of a notification
+    user_id saves looking the row up when the caller knows it
+    """
+    with counters.change(), inbox.change() as index:
+        if user_id is None:
+            notification = get_csv_row(config.NOTIFICATIONS_CSV, notification_id)
+            user_id = notification.get('user_id') if notification else None
+        updated = update_csv_row(config.NOTIFICATIONS_CSV, 'id', notification_id, {'status': status})
+        if updated:
+            index.touch(user_id)
+    return updated
+
+
+def get_notification_by_id(notification_id, include_archived=False):
     """
     Get a specific notification by ID
     """
-    notifications = read_csv(config.NOTIFICATIONS_CSV)
-    for notif in notifications:
-        if str(notif.get('id')) == str(notification_id):
-            return notif
-    return None
+    notification = resolve(get_csv_row(config.NOTIFICATIONS_CSV, notification_id))
+    if notification is None and include_archived:
+        for archived in archive.read_archived():
+            if archived.get('id') == str(notification_id):
+                return archived
+    return notification
 
 
 def mark_all_delivered(user_id):
     """
     Mark all notifications for a user as delivered
     """
-    notifications = read_csv(config.NOTIFICATIONS_CSV)
-    updated = False
-    
-    for notif in notifications:
-        if str(notif.get('user_id')) == str(user_id) and notif.get('delivered', '').lower() != 'true':
-            notif['delivered'] = 'True'
-            updated = True
-    
-    if updated:
-        fieldnames = ['id', 'user_id', 'message', 'delivered']
-        write_csv(config.NOTIFICATIONS_CSV, notifications, fieldnames)
+    with counters.change() as delta:
+        notifications = get_records(config.NOTIFICATIONS_CSV, inbox.ids(user_id))
+        ids = [notif.id for notif in notifications if not notif.delivered]
+        
+        # The inbox lock is taken after reading the user's rows through the index
+        with inbox.change() as index:
+            if ids and update_csv_rows(config.NOTIFICATIONS_CSV, 'id', ids, {'delivered': 'True'}):
+                delta.marked_delivered(user_id, len(ids))
+                index.touch(user_id)
+    broadcasts.mark_read(user_id)
+    publish_read(user_id)
 
 
-def get_all_notifications():
+def get_all_notifications(include_archived=False):
     """
     Get all notifications (admin)
     """
-    return read_csv(config.NOTIFICATIONS_CSV)
+    notifications = [resolve(n) for n in read_csv(config.NOTIFICATIONS_CSV)]
+    if include_archived:
+        notifications = list(archive.read_archived()) + notifications
+    return notifications
 
 
-def get_notification_stats():
+def get_all_broadcasts():
+    """
+    Get all broadcasts with their read counts (admin)
+    """
+    return broadcasts.all()
+
+
+def get_notification_stats(include_archived=False):
     """
     Get notification statistics
+    Served from the materialised counters unless archives are included
     """
-    notifications = read_csv(config.NOTIFICATIONS_CSV)
+    if not include_archived:
+        return counters.stats()
+    
+    total = 0
+    delivered = 0
+    message_counts = Counter()
+    
+    # Single streaming pass over the columns needed, counting by message id
+    columns = ['message', 'message_id', 'delivered']
+    convert = NOTIFICATION_SCHEMA.converter(columns)
+    records = itertools.chain(read_records(config.NOTIFICATIONS_CSV, columns=columns),
+                              map(convert, archive.read_archived()))
+    for n in records:
+        total += 1
+        if n.delivered:
+            delivered += 1
+        message_counts[message_key(n.message_id, n.message)] += 1
+    
+    # Broadcasts count once per recipient
+    broadcast_total, broadcast_delivered, broadcast_types = broadcasts.stats()
+    total += broadcast_total
+    delivered += broadcast_delivered
+    message_counts.update(broadcast_types)
     
-    total = len(notifications)
-    delivered = sum(1 for n in notifications if n.get('delivered', '').lower() == 'true')
     pending = total - delivered
     
-    # Count by message type
-    message_counts = {}
-    for n in notifications:
-        msg = n.get('message', 'Unknown')
-        message_counts[msg] = message_counts.get(msg, 0) + 1
+    # Counted by message key; reported by text
+    by_text = Counter()
+    for key, count in message_counts.items():
+        by_text[key_text(key) or 'Unknown'] += count
     
     return {
         'total': total,
         'delivered': delivered,
         'pending': pending,
         'delivery_rate': round(delivered / total * 100, 1) if total > 0 else 0,
-        'by_type': message_counts
+        'by_type': dict(by_text)
     }
 
 
 def broadcast_notification(message, role=None):
     """
     Send notification to all users (optionally filtered by role)
+    Stored once as a broadcast, not as a row per user
+    Returns the number of recipients
     """
-    users = read_csv(config.USERS_CSV)
-    count = 0
-    
-    for user in users:
-        if role is None or user.get('role', '').lower() == role.lower():
-            create_notification(user.get('id'), message)
-            count += 1
-    
-    return count
+    broadcast = broadcasts.create(message, role)
+    if broadcast is None:
+        return 0
+    broadcast = dict(broadcast, id=f"{ID_PREFIX}{broadcast['id']}", broadcast_id=broadcast['id'], message=message)
+    log_notification(broadcast['id'], message, f"BROADCAST ({broadcast['recipients']} users)")
+    publish_notification(broadcast, role=role)
+    delivery.enqueue(broadcast)
+    return int(broadcast['recipients'])
 
 
 def log_notification(notification_id, message, status):
@@ -143,21 +275,18 @@ def log_notification(notification_id, message, status):
     Log notification to alerts log
     """
     try:
-        os.makedirs(config.LOGS_DIR, exist_ok=True)
         timestamp = get_timestamp()
         log_entry = f"[{timestamp}] Notification {notification_id}: {message[:50]}... - {status}\n"
         
-        with open(config.ALERTS_LOG, 'a', encoding='utf-8') as f:
-            f.write(log_entry)
+        log_event(config.ALERTS_LOG, log_entry, 'notification', notification_id=str(notification_id),
+                  message=message, status=status)
     except Exception as e:
         print(f"Error writing to alerts log: {e}")
 
 
 def get_recent_notifications(limit=10):
     """
-    Get most recent notifications
+    Get most recent notifications, newest first
+    Served from the in-memory buffer of the newest rows
     """
-    notifications = read_csv(config.NOTIFICATIONS_CSV)
-    # Sort by id descending (assuming higher id = more recent)
-    sorted_notifs = sorted(notifications, key=lambda x: int(x.get('id', 0)), reverse=True)
-    return sorted_notifs[:limit]
+    return get_recent(limit)
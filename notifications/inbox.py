@@ -0,0 +1,212 @@
+"""
+Notification Inbox
+Per-user index of notification ids for the inbox API
+
+Maps each user to the ids of their notifications, ordered by
+(created_at, id), so an inbox page reads only that user's rows (by id)
+instead of scanning the table. Broadcasts addressed to the user are
+merged in from the broadcast store. Writers wrap their change in
+inbox.change() and record which rows and users it touched; each user has
+an inbox version, bumped by every change to their notifications, that the
+API turns into an ETag. As with the counters, a change made elsewhere
+changes the table version and makes the next read rebuild the index.
+"""
+import hashlib
+import heapq
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter
+from contextlib import contextmanager
+import config
+from utils.csv_handler import read_csv_iter, get_csv_rows, table_version
+from notifications.broadcasts import broadcasts, ID_PREFIX
+from notifications.messages import resolve
+
+
+class InboxChange:
+    """
+    Rows added or removed and users whose notifications changed in one write
+    """
+    def __init__(self):
+        self.added = []
+        self.removed = []
+        self.touched = set()
+    
+    def add(self, row):
+        self.added.append(row)
+        self.touched.add(str(row.get('user_id')))
+    
+    def remove(self, row):
+        self.removed.append(row)
+        self.touched.add(str(row.get('user_id')))
+    
+    def touch(self, user_id):
+        self.touched.add(str(user_id))
+
+
+class InboxIndex:
+    """
+    user id -> sorted (created_at, 0, id) keys of their notifications
+    Broadcast keys are (created_at, 1, broadcast id), so they sort after a
+    direct notification created at the same moment.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._built = None
+        self.by_user = {}
+        self.versions = Counter()
+    
+    @staticmethod
+    def _key(row):
+        try:
+            return (row.get('created_at') or '', 0, int(row.get('id')))
+        except (TypeError, ValueError):
+            return None
+    
+    def _add(self, row, bulk=False):
+        key = self._key(row)
+        if key is None:
+            return
+        keys = self.by_user.setdefault(str(row.get('user_id')), [])
+        if bulk:
+            keys.append(key)
+        else:
+            insort(keys, key)
+    
+    def _remove(self, row):
+        key = self._key(row)
+        keys = self.by_user.get(str(row.get('user_id')), [])
+        position = bisect_left(keys, key) if key is not None else len(keys)
+        if position < len(keys) and keys[position] == key:
+            del keys[position]
+    
+    def _current(self):
+        """
+        Rebuild if the table changed since the index was built (caller holds the lock)
+        """
+        version = table_version(config.NOTIFICATIONS_CSV)
+        if version != self._version:
+            self.by_user = {}
+            for row in read_csv_iter(config.NOTIFICATIONS_CSV, columns=['id', 'user_id', 'created_at']):
+                self._add(row, bulk=True)
+            for keys in self.by_user.values():
+                keys.sort()
+            # Every inbox may have changed: start new ETags
+            self.versions = Counter()
+            self._built = version
+            self._version = version
+        return self
+    
+    @contextmanager
+    def change(self):
+        """
+        Wrap a write to the notifications table and record what it touched
+        
+        Usage:
+            with inbox.change() as index:
+                if append_csv(config.NOTIFICATIONS_CSV, row):
+                    index.add(row)
+        
+        Applied only if the index matched the table before the write;
+        otherwise the next read rebuilds. Taken after the counters lock.
+        """
+        with self._lock:
+            in_step = self._version is not None and table_version(config.NOTIFICATIONS_CSV) == self._version
+            change = InboxChange()
+            yield change
+            if in_step:
+                for row in change.added:
+                    self._add(row)
+                for row in change.removed:
+                    self._remove(row)
+                self.versions.update(change.touched)
+                self._version = table_version(config.NOTIFICATIONS_CSV)
+    
+    def ids(self, user_id):
+        """
+        Get the ids of a user's notifications, oldest first
+        """
+        with self._lock:
+            return [key[2] for key in self._current().by_user.get(str(user_id), [])]
+    
+    def etag(self, user_id, *query):
+        """
+        Get a token that changes whenever the user's inbox changes
+        query: what selects the page (cursor, limit), so each page has its own token
+        """
+        with self._lock:
+            current = self._current()
+            state = (current._built, current.versions[str(user_id)])
+        addressed = broadcasts.for_user(user_id)
+        state += (len(addressed), broadcasts.unread_count(user_id)) + query
+        return hashlib.sha1(repr(state).encode('utf-8')).hexdigest()
+    
+    def page(self, user_id, before_id=None, since_id=None, limit=20):
+        """
+        One page of a user's inbox, direct notifications and broadcasts
+        before_id: the page older than that entry, newest first (the
+        newest page if neither cursor is given)
+        since_id: entries newer than that one, oldest first, for clients
+        catching up
+        Returns: dict with 'notifications', 'next_before_id' (None on the
+        last page), 'has_more' and 'latest_id'; None if the cursor is not
+        in the user's inbox
+        """
+        addressed = {n['id']: n for n in broadcasts.for_user(user_id)}
+        broadcast_keys = [(n['created_at'] or '', 1, int(n['broadcast_id'])) for n in addressed.values()]
+        with self._lock:
+            direct = list(self._current().by_user.get(str(user_id), []))
+        keys = list(heapq.merge(direct, sorted(broadcast_keys)))
+        
+        cursor = before_id if since_id is None else since_id
+        position = len(keys)
+        if cursor is not None:
+            cursor_key = _find_key(keys, cursor)
+            if cursor_key is None:
+                return None
+            position = bisect_left(keys, cursor_key) if since_id is None else bisect_right(keys, cursor_key)
+        
+        if since_id is None:
+            start = max(position - limit, 0)
+            page_keys = keys[start:position][::-1]
+            has_more = start > 0
+        else:
+            page_keys = keys[position:position + limit]
+            has_more = position + limit < len(keys)
+        
+        rows = {str(row.get('id')): row for row in
+                get_csv_rows(config.NOTIFICATIONS_CSV, [key[2] for key in page_keys if key[1] == 0])}
+        notifications = []
+        for key in page_keys:
+            entry = rows.get(str(key[2])) if key[1] == 0 else addressed.get(f"{ID_PREFIX}{key[2]}")
+            if entry is not None:
+                notifications.append(resolve(entry))
+        return {
+            'notifications': notifications,
+            'next_before_id': _entry_id(page_keys[-1]) if since_id is None and has_more else None,
+            'has_more': has_more,
+            'latest_id': _entry_id(keys[-1]) if keys else None
+        }
+
+
+def _entry_id(key):
+    return f"{ID_PREFIX}{key[2]}" if key[1] else str(key[2])
+
+
+def _find_key(keys, entry_id):
+    """
+    Find the key of an inbox entry id ('12' or 'B3') among a user's keys
+    """
+    entry_id = str(entry_id)
+    kind = 1 if entry_id.startswith(ID_PREFIX) else 0
+    number = entry_id[len(ID_PREFIX):] if kind else entry_id
+    if not number.isdigit():
+        return None
+    for key in keys:
+        if key[1] == kind and key[2] == int(number):
+            return key
+    return None
+
+
+inbox = InboxIndex()
@@ -3,9 +3,37 @@ Notification Logger
 Alert logs and delivery status tracking
 """
 import config
-from utils.csv_handler import read_csv
+from utils.schema import get_record
+from notifications.counters import counters
+from notifications.messages import message_text
+from utils.log_pipeline import log_event, flush_logs
+from utils.log_index import LogIndex
+from utils.log_rotation import reverse_segment_lines
+from utils.tail import tail_lines
 from utils.time_utils import get_timestamp, get_formatted_timestamp
-import os
+import itertools
+import re
+
+
+# Lines written by log_alert and by engine.log_notification
+ALERT_LINE = re.compile(r'ID:(\S+) \| User:(\S*) \| Status:(\w+)')
+NOTIFICATION_LINE = re.compile(r'\] Notification (\S+): .* - (\w+)')
+
+
+def _alert_fields(line):
+    """
+    Get the notification id, user id and status word of an alert log line
+    """
+    match = ALERT_LINE.search(line)
+    if match:
+        return {'id': match.group(1), 'user': match.group(2), 'status': match.group(3)}
+    match = NOTIFICATION_LINE.search(line)
+    if match:
+        return {'id': match.group(1), 'status': match.group(2)}
+    return None
+
+
+alert_index = LogIndex(config.ALERTS_LOG, config.ALERTS_LOG_INDEX, fields=_alert_fields)
 
 
 def log_alert(notification_id, user_id, message, status):
@@ -13,13 +41,11 @@ def log_alert(notification_id, user_id, message, status):
     Log notification alert with full details
     """
     try:
-        os.makedirs(config.LOGS_DIR, exist_ok=True)
         timestamp = get_formatted_timestamp()
         log_entry = f"[{timestamp}] ID:{notification_id} | User:{user_id} | Status:{status} | {message}\n"
         
-        with open(config.ALERTS_LOG, 'a', encoding='utf-8') as f:
-            f.write(log_entry)
-        return True
+        return log_event(config.ALERTS_LOG, log_entry, 'alert', notification_id=str(notification_id),
+                         user_id=str(user_id), status=status, message=message)
     except Exception as e:
         print(f"Error writing alert log: {e}")
         return False
@@ -29,14 +55,13 @@ def get_delivery_status(notification_id):
     """
     Get delivery status of a specific notification
     """
-    notifications = read_csv(config.NOTIFICATIONS_CSV)
-    for notif in notifications:
-        if str(notif.get('id')) == str(notification_id):
-            return {
-                'id': notification_id,
-                'delivered': notif.get('delivered', '').lower() == 'true',
-                'message': notif.get('message', '')
-            }
+    notif = get_record(config.NOTIFICATIONS_CSV, notification_id)
+    if notif:
+        return {
+            'id': notification_id,
+            'delivered': notif.delivered,
+            'message': notif.message or message_text(notif.message_id)
+        }
     return None
 
 
@@ -45,14 +70,16 @@ def get_alert_log_entries(limit=50):
     Read recent alert log entries
     """
     try:
-        if not os.path.exists(config.ALERTS_LOG):
-            return []
-        
-        with open(config.ALERTS_LOG, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
+        # Include alert lines still queued for the writer
+        flush_logs()
         
-        # Return last N entries (reverse order)
-        return [line.strip() for line in reversed(lines[-limit:])]
+        # Return last N entries (reverse order), reading only the end of the log
+        entries = [line.strip() for line in reversed(tail_lines(config.ALERTS_LOG, limit))]
+        if len(entries) < limit:
+            # The log was rotated recently: continue into its segments
+            entries += [line.strip() for line in itertools.islice(reverse_segment_lines(config.ALERTS_LOG),
+                                                                 limit - len(entries))]
+        return entries
     except Exception as e:
         print(f"Error reading alert log: {e}")
         return []
@@ -62,9 +89,11 @@ def get_delivery_statistics():
     """
     Calculate delivery statistics from notifications
     """
-    notifications = read_csv(config.NOTIFICATIONS_CSV)
+    stats = counters.stats()
+    total = stats['total']
+    delivered = stats['delivered']
     
-    if not notifications:
+    if not total:
         return {
             'total': 0,
             'delivered': 0,
@@ -72,9 +101,6 @@ def get_delivery_statistics():
             'rate': 0
         }
     
-    total = len(notifications)
-    delivered = sum(1 for n in notifications if n.get('delivered', '').lower() == 'true')
-    
     return {
         'total': total,
         'delivered': delivered,
@@ -83,9 +109,16 @@ def get_delivery_statistics():
     }
 
 
-def search_alerts(query):
+def search_alerts(query='', notification_id=None, user_id=None, status=None, limit=200):
     """
-    Search alert logs for specific content
+    Search the whole alert log, newest first
+    query: text the entry contains (case-insensitive); status: first word
+    of the status, e.g. 'SENT' or 'FAILED'
     """
-    entries = get_alert_log_entries(limit=200)
-    return [entry for entry in entries if query.lower() in entry.lower()]
+    try:
+        flush_logs()
+        entries = alert_index.search(query, limit=limit, id=notification_id, user=user_id, status=status)
+        return [entry.strip() for entry in entries]
+    except Exception as e:
+        print(f"Error searching alert log: {e}")
+        return []
@@ -0,0 +1,171 @@
+"""
+Notification Messages
+Interning table for notification texts
+
+Most notifications repeat a handful of texts. Each distinct text is stored
+once in config.MESSAGES_CSV and notification and broadcast rows refer to it
+by message_id, leaving their own 'message' column empty. Rows written
+before the table existed keep their text and still read the same; run
+`python -m notifications.messages migrate` to convert them; until then
+they are counted by their text. Message id 0 stands for an empty text.
+
+Usage: python -m notifications.messages migrate
+"""
+import sys
+import threading
+import config
+from utils.csv_handler import read_csv, read_csv_iter, append_csv, allocate_ids, table_version, transaction
+
+
+MESSAGE_FIELDS = ['id', 'text']
+
+
+class MessageTable:
+    """
+    In-memory copy of config.MESSAGES_CSV in both directions
+    Reloaded when the table version changes
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self.by_id = {}
+        self.by_text = {}
+    
+    def _current(self):
+        """
+        Reload if the table changed since it was read (caller holds the lock)
+        """
+        version = table_version(config.MESSAGES_CSV)
+        if version != self._version:
+            self.by_id, self.by_text = {}, {}
+            for row in read_csv(config.MESSAGES_CSV):
+                message_id = int(row['id'])
+                self.by_id[message_id] = row.get('text', '')
+                self.by_text.setdefault(row.get('text', ''), message_id)
+            self._version = version
+        return self
+    
+    def intern(self, text):
+        """
+        Get the id of a text, adding it to the table if it is new
+        Returns None if a new text could not be saved
+        """
+        if not text:
+            return 0
+        with self._lock:
+            current = self._current()
+            if text in current.by_text:
+                return current.by_text[text]
+            
+            message_id = allocate_ids(config.MESSAGES_CSV)
+            if not append_csv(config.MESSAGES_CSV, {'id': str(message_id), 'text': text}, MESSAGE_FIELDS):
+                return None
+            current.by_id[message_id] = text
+            current.by_text[text] = message_id
+            self._version = table_version(config.MESSAGES_CSV)
+            return message_id
+    
+    def text(self, message_id):
+        try:
+            message_id = int(message_id)
+        except (TypeError, ValueError):
+            return ''
+        if not message_id:
+            return ''
+        with self._lock:
+            return self._current().by_id.get(message_id, '')
+
+
+messages = MessageTable()
+
+
+def intern_message(text):
+    """
+    Get the message id for a text (see MessageTable.intern)
+    """
+    return messages.intern(text)
+
+
+def message_text(message_id):
+    """
+    Get the text of a message id ('' if unknown)
+    """
+    return messages.text(message_id)
+
+
+def message_key(message_id, text):
+    """
+    Get the key a row is counted under: its message id, or ('text', text)
+    for a row written without one (read paths never add to the table)
+    """
+    if message_id:
+        return int(message_id)
+    return ('text', text) if text else 0
+
+
+def key_text(key):
+    """
+    Get the text of a message key (see message_key)
+    """
+    return key[1] if isinstance(key, tuple) else message_text(key)
+
+
+def resolve(row):
+    """
+    Get a notification or broadcast row with its 'message' text filled in
+    """
+    if row is None or row.get('message') or not row.get('message_id'):
+        return row
+    return dict(row, message=message_text(row['message_id']))
+
+
+def migrate_notifications():
+    """
+    Move the texts of notifications written before interning into the message table
+    Returns the number of rows converted
+    """
+    # Intern first: the transaction must not write to another table
+    ids = {}
+    for row in read_csv_iter(config.NOTIFICATIONS_CSV, columns=['message', 'message_id']):
+        if row.get('message') and not row.get('message_id') and row['message'] not in ids:
+            ids[row['message']] = intern_message(row['message'])
+    
+    converted = 0
+    with transaction(config.NOTIFICATIONS_CSV) as tx:
+        for row in tx.rows:
+            message_id = ids.get(row.get('message')) if not row.get('message_id') else None
+            if message_id:
+                tx.update('id', row['id'], {'message_id': str(message_id), 'message': ''})
+                converted += 1
+    return converted
+
+
+def migrate_broadcasts():
+    """
+    Move the texts of broadcasts written before interning into the message table
+    Returns the number of rows converted
+    """
+    ids = {}
+    for row in read_csv_iter(config.BROADCASTS_CSV, columns=['message', 'message_id']):
+        if row.get('message') and not row.get('message_id') and row['message'] not in ids:
+            ids[row['message']] = intern_message(row['message'])
+    
+    converted = 0
+    with transaction(config.BROADCASTS_CSV) as tx:
+        for row in tx.rows:
+            message_id = ids.get(row.get('message')) if not row.get('message_id') else None
+            if message_id:
+                tx.update('id', row['id'], {'message_id': str(message_id), 'message': ''})
+                converted += 1
+    return converted
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] != 'migrate':
+        print("Usage: python -m notifications.messages migrate")
+        sys.exit(1)
+    
+    count = migrate_notifications()
+    print(f"Converted {count} notifications to message ids")
+    count = migrate_broadcasts()
+    print(f"Converted {count} broadcasts to message ids")
@@ -0,0 +1,114 @@
+"""
+Notification Pub/Sub
+In-process publish/subscribe hub for pushing notifications to open streams
+
+Publishers add events with increasing ids to a bounded backlog of the last
+config.STREAM_BACKLOG events; every subscriber waits on one shared
+condition and reads the events after the last id it has seen. A client
+that reconnects with Last-Event-ID picks up from there, or is told to
+resync if the events it missed have left the backlog.
+"""
+import json
+import threading
+from collections import deque
+import config
+from users.models import normalize_role
+
+
+class Event:
+    """
+    One published event
+    user_id set: for that user only; otherwise for everyone with role ('' for all),
+    compared as normalised roles (staff -> faculty), like the broadcast inbox
+    """
+    __slots__ = ('id', 'name', 'data', 'user_id', 'role')
+    
+    def __init__(self, event_id, name, data, user_id=None, role=None):
+        self.id = event_id
+        self.name = name
+        self.data = data
+        self.user_id = str(user_id) if user_id is not None else None
+        self.role = normalize_role(role)
+    
+    def visible_to(self, user_id, role):
+        if self.user_id is not None:
+            return self.user_id == str(user_id)
+        return not self.role or self.role == normalize_role(role)
+    
+    def format(self):
+        """
+        Format as a Server-Sent Events message
+        """
+        return f"id: {self.id}\nevent: {self.name}\ndata: {json.dumps(self.data)}\n\n"
+
+
+class Hub:
+    """
+    Backlog of recent events and the condition subscribers wait on
+    """
+    def __init__(self, backlog):
+        self._cond = threading.Condition()
+        self._events = deque(maxlen=backlog)
+        self._last_id = 0
+    
+    def publish(self, name, data, user_id=None, role=None):
+        """
+        Publish an event and wake the subscribers
+        Returns the event id
+        """
+        with self._cond:
+            self._last_id += 1
+            self._events.append(Event(self._last_id, name, data, user_id, role))
+            self._cond.notify_all()
+            return self._last_id
+    
+    def last_id(self):
+        with self._cond:
+            return self._last_id
+    
+    def wait(self, after, timeout):
+        """
+        Wait up to timeout seconds for events newer than after
+        Returns: (events, missed) - events oldest first, and whether some
+        events after it were dropped from the backlog (or were published
+        before this process started) and cannot be replayed
+        """
+        with self._cond:
+            missed = after > self._last_id
+            if missed:
+                after = self._last_id
+            else:
+                self._cond.wait_for(lambda: self._last_id > after, timeout)
+            
+            events = []
+            for event in reversed(self._events):
+                if event.id <= after:
+                    break
+                events.append(event)
+            events.reverse()
+            if events and events[0].id > after + 1:
+                missed = True
+            elif not events and self._last_id > after:
+                missed = True
+            return events, missed
+
+
+hub = Hub(config.STREAM_BACKLOG)
+
+
+def publish_notification(notification, user_id=None, role=None):
+    """
+    Push a new notification to the user's open streams (or all matching users)
+    """
+    return hub.publish('notification', {
+        'id': notification.get('id'),
+        'message': notification.get('message'),
+        'created_at': notification.get('created_at')
+    }, user_id=user_id, role=role)
+
+
+def publish_read(user_id):
+    """
+    Tell the user's other open pages that their notifications were read
+    """
+    return hub.publish('read', {'unread': 0}, user_id=user_id)
@@ -0,0 +1,109 @@
+"""
+Recent Notifications
+Bounded buffer of the newest rows in the notifications table
+
+Holds the last config.RECENT_NOTIFICATIONS_SIZE rows so the admin views
+of recent notifications cost O(limit) instead of a read of the whole
+table. The buffer is seeded from the end of the table (read backwards,
+see utils/tail.py) and this process's creates and deletes are applied in
+place. Like the counters, it remembers the table version it matches: any
+other change (a status update, archiving, another process) makes the next
+read reseed from the tail.
+"""
+import heapq
+import threading
+from collections import deque
+from contextlib import contextmanager
+import config
+from utils.csv_handler import read_csv_iter, tail_csv, table_version
+from notifications.messages import resolve
+
+
+class RecentNotifications:
+    """
+    The newest notification rows, oldest first
+    """
+    def __init__(self, size):
+        self._lock = threading.Lock()
+        self._version = None
+        self.size = size
+        self.rows = deque(maxlen=size)
+        self._trimmed = False  # deletes left room for rows older than the buffer
+    
+    def _current(self, limit=0):
+        """
+        Reseed from the table tail if it changed since the buffer was filled,
+        or if deletes left fewer than limit rows in it (caller holds the lock)
+        """
+        version = table_version(config.NOTIFICATIONS_CSV)
+        if version != self._version or (self._trimmed and len(self.rows) < limit):
+            self.rows = deque(tail_csv(config.NOTIFICATIONS_CSV, self.size), maxlen=self.size)
+            self._trimmed = False
+            self._version = version
+        return self
+    
+    @contextmanager
+    def change(self):
+        """
+        Wrap a create or delete of a notification and record it
+        
+        Usage:
+            with recent.change() as buffer:
+                if append_csv(config.NOTIFICATIONS_CSV, row):
+                    buffer.append(row)
+        
+        Applied only if the buffer matched the table before the write;
+        otherwise the next read reseeds. Taken after the counters lock.
+        """
+        with self._lock:
+            in_step = self._version is not None and table_version(config.NOTIFICATIONS_CSV) == self._version
+            change = _Change()
+            yield change
+            if in_step:
+                for row in change.added:
+                    self.rows.append(dict(row))
+                if change.removed:
+                    self.rows = deque((r for r in self.rows if r.get('id') not in change.removed), maxlen=self.size)
+                    self._trimmed = True
+                self._version = table_version(config.NOTIFICATIONS_CSV)
+    
+    def get(self, limit):
+        """
+        Get up to limit rows, newest first
+        """
+        if limit > self.size:
+            # Beyond the buffer: fall back to a pass over the table
+            rows = read_csv_iter(config.NOTIFICATIONS_CSV)
+            return heapq.nlargest(limit, rows, key=lambda n: int(n.get('id') or 0))
+        with self._lock:
+            rows = self._current(limit).rows
+            return [dict(row) for row in list(rows)[::-1][:limit]]
+    
+    def seed(self):
+        with self._lock:
+            self._current()
+
+
+class _Change:
+    """
+    Rows added and ids removed by one write
+    """
+    def __init__(self):
+        self.added = []
+        self.removed = set()
+    
+    def append(self, row):
+        self.added.append(row)
+    
+    def remove(self, notification_id):
+        self.removed.add(str(notification_id))
+
+
+recent = RecentNotifications(config.RECENT_NOTIFICATIONS_SIZE)
+
+
+def get_recent(limit=10):
+    """
+    Get the newest notifications with their texts, newest first
+    """
+    return [resolve(n) for n in recent.get(limit)]
@@ -0,0 +1,93 @@
+"""
+Notification Routes
+Server-Sent Events stream of new notifications and the JSON inbox API
+"""
+import time
+from flask import Response, request, session, jsonify
+import config
+from notifications import notifications_bp
+from notifications.engine import get_unread_count, get_inbox_page, get_inbox_etag
+from notifications.pubsub import hub
+from auth.permissions import login_required
+
+
+def _parse_event_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+@notifications_bp.route('/stream')
+@login_required
+def stream():
+    """
+    Stream the current user's new notifications as Server-Sent Events
+    Resumes after the Last-Event-ID header (or ?last_event_id=) on reconnect
+    """
+    user_id = session.get('user_id')
+    role = session.get('role')
+    after = _parse_event_id(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    if after is None:
+        after = hub.last_id()
+    heartbeat = config.STREAM_HEARTBEAT_INTERVAL
+    
+    def generate(after):
+        yield f"retry: {config.STREAM_RETRY_MS}\n\n"
+        last_write = time.monotonic()
+        while True:
+            events, missed = hub.wait(after, heartbeat)
+            chunks = []
+            if missed:
+                # Events were lost; send the current count so the page can catch up
+                chunks.append(f"event: resync\ndata: {{\"unread\": {get_unread_count(user_id)}}}\n\n")
+            for event in events:
+                after = event.id
+                if event.visible_to(user_id, role):
+                    chunks.append(event.format())
+            
+            now = time.monotonic()
+            if chunks:
+                last_write = now
+                yield ''.join(chunks)
+            elif now - last_write >= heartbeat:
+                # Comment line: keeps proxies from closing an idle connection
+                last_write = now
+                yield ": heartbeat\n\n"
+    
+    return Response(generate(after), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@notifications_bp.route('/inbox')
+@login_required
+def inbox():
+    """
+    JSON page of the current user's notifications
+    ?before_id=<id>: the page older than that entry, newest first (default: newest page)
+    ?since_id=<id>: entries newer than that one, oldest first, for polling clients
+    ?limit=<n>: page size (at most config.INBOX_PAGE_MAX)
+    Answers 304 while the inbox is unchanged since the ETag sent in If-None-Match
+    """
+    user_id = session.get('user_id')
+    before_id = request.args.get('before_id') or None
+    since_id = request.args.get('since_id') or None
+    limit = request.args.get('limit', type=int) or config.INBOX_PAGE_SIZE
+    if before_id and since_id:
+        return jsonify({'error': 'Use before_id or since_id, not both'}), 400
+    limit = max(1, min(limit, config.INBOX_PAGE_MAX))
+    
+    # Taken before the page is read, so a change while reading gives a new ETag next time
+    etag = get_inbox_etag(user_id, before_id, since_id, limit)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        page = get_inbox_page(user_id, before_id=before_id, since_id=since_id, limit=limit)
+        if page is None:
+            # The cursor entry was deleted or archived; the client should start over
+            return jsonify({'error': 'Unknown cursor'}), 410
+        page['unread'] = get_unread_count(user_id)
+        response = jsonify(page)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
@@ -0,0 +1,223 @@
+"""
+Notification Scheduler
+Notifications sent at a future time, once or on a recurrence rule
+
+Schedules are rows in config.SCHEDULES_CSV. One scheduler thread keeps a
+heap of (send time, schedule id) and sleeps until the earliest is due, so
+adding or firing a schedule is O(log n) however many are waiting. Due
+schedules are sent through engine.create_notification or
+engine.broadcast_notification; a recurring schedule is then moved to its
+next occurrence, a one-off is deactivated. The heap is rebuilt from the
+table when the scheduler starts, and schedules that fell due while the
+app was down are sent once on start.
+"""
+import heapq
+import threading
+import time
+from datetime import timedelta
+import config
+from utils.csv_handler import read_csv, append_csv, allocate_ids, update_csv_row
+from utils.time_utils import get_timestamp, parse_timestamp
+from notifications.engine import create_notification, broadcast_notification
+
+
+SCHEDULE_FIELDS = ['id', 'target', 'target_value', 'message', 'send_at', 'recurrence',
+                   'created_by', 'active', 'last_sent_at']
+TARGETS = ['all', 'role', 'user']
+RECURRENCES = {
+    '': 'Once',
+    'hourly': 'Every hour',
+    'daily': 'Every day',
+    'weekdays': 'Every weekday',
+    'weekly': 'Every week'
+}
+
+
+def next_occurrence(send_at, recurrence, now):
+    """
+    Get the first occurrence of a recurring schedule after now
+    Returns None for a one-off schedule
+    """
+    if not recurrence:
+        return None
+    step = {'hourly': timedelta(hours=1), 'weekly': timedelta(weeks=1)}.get(recurrence, timedelta(days=1))
+    
+    # Jump over missed occurrences in one step, then walk to the next valid one
+    if send_at <= now:
+        send_at += step * ((now - send_at) // step + 1)
+    while recurrence == 'weekdays' and send_at.weekday() >= 5:
+        send_at += step
+    return send_at
+
+
+class Scheduler:
+    """
+    Heap of active schedules and the thread that fires them
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._heap = []
+        self._schedules = {}
+        self._thread = None
+    
+    def _push(self, schedule):
+        """
+        Add a schedule to the heap (caller holds the condition)
+        An entry is stale once the schedule's send_at changes or it is cancelled
+        """
+        self._schedules[str(schedule['id'])] = schedule
+        send_at = parse_timestamp(schedule['send_at'])
+        heapq.heappush(self._heap, (send_at.timestamp(), int(schedule['id']), schedule['send_at']))
+        self._cond.notify()
+    
+    def load(self):
+        """
+        Rebuild the heap from the active schedules in the table
+        """
+        schedules = [s for s in read_csv(config.SCHEDULES_CSV)
+                     if s.get('active') == 'True' and parse_timestamp(s.get('send_at') or '')]
+        with self._cond:
+            self._heap = []
+            self._schedules = {}
+            for schedule in schedules:
+                self._push(schedule)
+        return len(schedules)
+    
+    def add(self, schedule):
+        with self._cond:
+            self._push(schedule)
+    
+    def cancel(self, schedule_id):
+        with self._cond:
+            self._schedules.pop(str(schedule_id), None)
+    
+    def pending(self):
+        """
+        Get the active schedules, soonest first
+        """
+        with self._cond:
+            return sorted((dict(s) for s in self._schedules.values()), key=lambda s: s['send_at'])
+    
+    def _next_due(self):
+        """
+        Wait for the next due schedule and remove it from the heap
+        """
+        with self._cond:
+            while True:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                due_at, schedule_id, send_at = self._heap[0]
+                schedule = self._schedules.get(str(schedule_id))
+                if schedule is None or schedule['send_at'] != send_at:
+                    heapq.heappop(self._heap)  # cancelled or rescheduled
+                    continue
+                delay = due_at - time.time()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+                return dict(schedule)
+    
+    def _fire(self, schedule):
+        """
+        Send a due schedule and move it to its next occurrence
+        """
+        message = schedule['message']
+        if schedule['target'] == 'user':
+            create_notification(schedule['target_value'], message)
+        else:
+            broadcast_notification(message, role=schedule['target_value'] if schedule['target'] == 'role' else None)
+        
+        now = parse_timestamp(get_timestamp())
+        following = next_occurrence(parse_timestamp(schedule['send_at']), schedule.get('recurrence', ''), now)
+        updates = {'last_sent_at': now.isoformat()}
+        if following is None:
+            updates['active'] = 'False'
+        else:
+            updates['send_at'] = following.isoformat()
+        update_csv_row(config.SCHEDULES_CSV, 'id', schedule['id'], updates)
+        
+        with self._cond:
+            if str(schedule['id']) not in self._schedules:
+                return  # cancelled while it was being sent
+            if following is None:
+                del self._schedules[str(schedule['id'])]
+            else:
+                self._push(dict(schedule, **updates))
+    
+    def _run(self):
+        while True:
+            schedule = self._next_due()
+            try:
+                self._fire(schedule)
+            except Exception as e:
+                print(f"Error sending scheduled notification {schedule.get('id')}: {e}")
+    
+    def start(self):
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='notification-scheduler', daemon=True)
+            self._thread.start()
+        self.load()
+
+
+scheduler = Scheduler()
+
+
+def schedule_notification(message, send_at, target='all', target_value='', recurrence='', created_by=''):
+    """
+    Schedule a notification
+    send_at: datetime or ISO timestamp; target: 'all', 'role' (target_value
+    is the role) or 'user' (target_value is the user id)
+    Returns the schedule row, or None if it is invalid or could not be saved
+    """
+    if isinstance(send_at, str):
+        send_at = parse_timestamp(send_at)
+    if send_at is None or not message or target not in TARGETS or recurrence not in RECURRENCES:
+        return None
+    if target != 'all' and not target_value:
+        return None
+    while recurrence == 'weekdays' and send_at.weekday() >= 5:
+        send_at += timedelta(days=1)
+    
+    schedule = {
+        'id': str(allocate_ids(config.SCHEDULES_CSV)),
+        'target': target,
+        'target_value': str(target_value) if target != 'all' else '',
+        'message': message,
+        'send_at': send_at.isoformat(),
+        'recurrence': recurrence,
+        'created_by': str(created_by),
+        'active': 'True',
+        'last_sent_at': ''
+    }
+    if not append_csv(config.SCHEDULES_CSV, schedule, SCHEDULE_FIELDS):
+        return None
+    scheduler.add(schedule)
+    return schedule
+
+
+def cancel_schedule(schedule_id):
+    """
+    Deactivate a schedule
+    """
+    if not update_csv_row(config.SCHEDULES_CSV, 'id', schedule_id, {'active': 'False'}):
+        return False
+    scheduler.cancel(schedule_id)
+    return True
+
+
+def get_pending_schedules():
+    """
+    Get the active schedules, soonest first
+    """
+    return scheduler.pending()
+
+
+def start_scheduler():
+    """
+    Load the active schedules and start the scheduler thread
+    """
+    scheduler.start()
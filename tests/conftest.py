@@ -0,0 +1,39 @@
+"""
+Shared fixtures: every test runs against a copy of the sample data
+"""
+import os
+import shutil
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from utils import schema, sqlite_store
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """
+    Point the data and log paths in config at a temporary copy of the sample data
+    """
+    data = tmp_path / 'data'
+    logs = tmp_path / 'logs'
+    logs.mkdir()
+    shutil.copytree(config.DATA_DIR, data,
+                    ignore=shutil.ignore_patterns('*.lock', '*.journal', '*.seq', '*.idx', '*.db*', 'archive', 'spool'))
+    moves = ((config.DATA_DIR, str(data)), (config.LOGS_DIR, str(logs)))
+    
+    def moved(path):
+        for old, new in moves:
+            if path == old or path.startswith(old + os.sep):
+                return new + path[len(old):]
+        return path
+    
+    for name, value in list(vars(config).items()):
+        if isinstance(value, str):
+            monkeypatch.setattr(config, name, moved(value))
+    # Tables keyed by their path
+    monkeypatch.setattr(schema, 'SCHEMAS', {moved(path): s for path, s in schema.SCHEMAS.items()})
+    monkeypatch.setattr(sqlite_store, 'TABLES', {moved(path): t for path, t in sqlite_store.TABLES.items()})
+    return tmp_path
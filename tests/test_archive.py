@@ -0,0 +1,53 @@
+"""
+Notification archive: what expires, and failed runs leave no archived copies
+"""
+import os
+import pytest
+import config
+from notifications import archive
+from utils import csv_handler
+from utils.csv_handler import append_csv, get_csv_row
+
+FIELDS = ['id', 'user_id', 'message', 'delivered', 'status', 'created_at', 'message_id']
+
+
+def _add(row_id, delivered, created_at):
+    row = {'id': str(row_id), 'user_id': '1', 'message': f"Old {row_id}", 'delivered': delivered,
+           'status': 'Delivered', 'created_at': created_at, 'message_id': ''}
+    assert append_csv(config.NOTIFICATIONS_CSV, row, FIELDS)
+
+
+@pytest.fixture
+def old_rows(data_dir):
+    _add(9001, 'True', '2020-01-05T10:00:00')
+    _add(9002, 'False', '2020-01-06T10:00:00')
+    _add(9003, 'True', '')
+
+
+def test_only_dated_delivered_rows_expire(old_rows):
+    assert archive.archive_delivered(retention_days=30) == 1
+    assert get_csv_row(config.NOTIFICATIONS_CSV, 9001) is None
+    # Undelivered and undated rows stay active
+    assert get_csv_row(config.NOTIFICATIONS_CSV, 9002) is not None
+    assert get_csv_row(config.NOTIFICATIONS_CSV, 9003) is not None
+    assert [row['id'] for row in archive.read_archived()] == ['9001']
+
+
+def test_failed_commit_discards_segment_rows(old_rows, monkeypatch):
+    with monkeypatch.context() as patch:
+        patch.setattr(csv_handler.Transaction, '_commit', lambda self: False)
+        assert archive.archive_delivered(retention_days=30) == 0
+        assert get_csv_row(config.NOTIFICATIONS_CSV, 9001) is not None
+        assert list(archive.read_archived()) == []
+        assert not os.path.exists(archive.archive_path('2020-01'))
+    
+    assert archive.archive_delivered(retention_days=30) == 1
+    assert [row['id'] for row in archive.read_archived()] == ['9001']
+
+
+def test_rows_archived_twice_are_read_once(old_rows):
+    row = dict(get_csv_row(config.NOTIFICATIONS_CSV, 9001), message='Old 9001')
+    # As left by a run interrupted between the segment write and the commit
+    archive._write_segment('2020-01', [row])
+    assert archive.archive_delivered(retention_days=30) == 1
+    assert [row['id'] for row in archive.read_archived()] == ['9001']
@@ -0,0 +1,29 @@
+"""
+Broadcast read state: only the changed rows are written
+"""
+import os
+import config
+from notifications.broadcasts import broadcasts, BroadcastStore
+from notifications.engine import broadcast_notification
+
+
+def _unread(store, user_id):
+    return [n['message'] for n in store.for_user(user_id) if n['delivered'] == 'False']
+
+
+def test_mark_read_journals_changed_rows(data_dir):
+    broadcast_notification('First broadcast')
+    broadcast_notification('Second broadcast')
+    snapshot = os.stat(config.BROADCASTS_CSV)
+    
+    assert broadcasts.mark_read(1) == 2
+    assert broadcasts.mark_read(1) == 0
+    # Bitmaps go to the journal; the table itself is not rewritten
+    after = os.stat(config.BROADCASTS_CSV)
+    assert (after.st_ino, after.st_size) == (snapshot.st_ino, snapshot.st_size)
+    
+    # A second store (another process) keeps the first user's bits
+    other = BroadcastStore()
+    assert other.mark_read(2) == 2
+    assert broadcasts.unread_count(1) == 0 and _unread(broadcasts, 2) == []
+    assert _unread(BroadcastStore(), 3) == ['First broadcast', 'Second broadcast']
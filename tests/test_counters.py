@@ -0,0 +1,29 @@
+"""
+Notification counters stay equal to a rebuild from the table across deletes
+"""
+from notifications.counters import counters
+from notifications.engine import create_notification, mark_delivered, delete_notification
+
+
+def _rebuilt():
+    counters._version = None
+    return counters.stats()
+
+
+def test_delete_adjusts_counters(data_dir):
+    before = counters.unread_count('1')
+    pending = create_notification('1', "Counted pending")
+    delivered = create_notification('1', "Counted delivered")
+    mark_delivered(delivered['id'])
+    assert counters.unread_count('1') == before + 1
+    
+    assert delete_notification(pending['id'])
+    assert delete_notification(delivered['id'])
+    assert not delete_notification(delivered['id'])
+    
+    # Applied in place, not rebuilt
+    assert counters._version is not None
+    assert counters.unread_count('1') == before
+    stats = counters.stats()
+    assert stats == _rebuilt()
+    assert 'Counted pending' not in stats['by_type']
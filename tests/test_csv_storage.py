@@ -0,0 +1,130 @@
+"""
+CSV storage: journal replay, compaction and concurrent writers
+"""
+import json
+import os
+import subprocess
+import sys
+import threading
+import pytest
+import config
+from utils import journal
+from utils.csv_handler import (read_csv, read_csv_iter, tail_csv, get_csv_row, write_csv, append_csv,
+                               update_csv_row, delete_csv_row, compact_csv)
+
+
+FIELDS = ['id', 'user_id', 'message', 'delivered']
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def table(tmp_path, monkeypatch):
+    # Compaction is started by hand in these tests
+    monkeypatch.setattr(config, 'JOURNAL_COMPACT_THRESHOLD', 10 ** 6)
+    path = str(tmp_path / 'table.csv')
+    rows = [{'id': str(n), 'user_id': str(n % 3), 'message': f"Message {n}", 'delivered': 'False'}
+            for n in range(1, 21)]
+    assert write_csv(path, rows, FIELDS)
+    return path, rows
+
+
+def _change(path, rows):
+    """
+    Journal some updates and deletes, and apply them to the expected rows
+    """
+    assert update_csv_row(path, 'id', '3', {'delivered': 'True'})
+    assert update_csv_row(path, 'id', '20', {'message': 'Edited, with "quotes"'})
+    assert delete_csv_row(path, 'id', '5')
+    assert delete_csv_row(path, 'id', '19')
+    assert update_csv_row(path, 'id', '3', {'message': 'Edited twice'})
+    expected = [dict(row) for row in rows if row['id'] not in ('5', '19')]
+    by_id = {row['id']: row for row in expected}
+    by_id['3'].update(delivered='True', message='Edited twice')
+    by_id['20']['message'] = 'Edited, with "quotes"'
+    return expected
+
+
+def test_journal_replay_matches_every_reader(table):
+    path, rows = table
+    expected = _change(path, rows)
+    assert os.path.exists(journal.journal_path(path))
+    
+    assert read_csv(path) == expected
+    assert list(read_csv_iter(path)) == expected
+    assert list(read_csv_iter(path, columns=['id', 'message'], where={'user_id': '0'})) == \
+        [{'id': row['id'], 'message': row['message']} for row in expected if row['user_id'] == '0']
+    assert list(read_csv_iter(path, where={'delivered': 'True'})) == [expected[2]]
+    assert tail_csv(path, 3) == expected[-3:]
+    for row in rows:
+        assert get_csv_row(path, row['id']) == next((r for r in expected if r['id'] == row['id']), None)
+
+
+def test_compaction_folds_the_journal(table):
+    path, rows = table
+    expected = _change(path, rows)
+    
+    assert compact_csv(path)
+    assert not os.path.exists(journal.journal_path(path))
+    assert read_csv(path) == expected
+    assert tail_csv(path, 2) == expected[-2:]
+    assert get_csv_row(path, '20') == expected[-1]
+    assert get_csv_row(path, '5') is None
+
+
+def test_journal_of_a_replaced_snapshot_is_ignored(table):
+    path, rows = table
+    _change(path, rows)
+    stale = open(journal.journal_path(path), encoding='utf-8').read()
+    
+    # An interrupted compaction: the snapshot was replaced, the old journal was left behind
+    assert compact_csv(path)
+    compacted = read_csv(path)
+    with open(journal.journal_path(path), 'w', encoding='utf-8') as f:
+        f.write(stale)
+    assert json.loads(stale.splitlines()[0])['inode'] != os.stat(path).st_ino
+    
+    assert read_csv(path) == compacted
+    assert list(read_csv_iter(path)) == compacted
+    assert get_csv_row(path, '3') == compacted[2]
+    # The next write starts a journal for the current snapshot
+    assert update_csv_row(path, 'id', '1', {'delivered': 'True'})
+    assert journal.read_ops(path) == [journal.update_op('id', '1', {'delivered': 'True'})]
+    assert compact_csv(path)
+    assert read_csv(path)[0]['delivered'] == 'True'
+    assert len(read_csv(path)) == len(compacted)
+
+
+def test_concurrent_writers(table):
+    path, rows = table
+    
+    def append(worker):
+        for n in range(25):
+            assert append_csv(path, {'id': f"{worker}{n:03d}", 'user_id': str(worker), 'message': 'thread',
+                                     'delivered': 'False'})
+    
+    def update(worker):
+        for n in range(1, 21):
+            update_csv_row(path, 'id', str(n), {'user_id': str(worker)})
+    
+    threads = [threading.Thread(target=append, args=(worker,)) for worker in range(100, 104)]
+    threads += [threading.Thread(target=update, args=(worker,)) for worker in range(2)]
+    threads.append(threading.Thread(target=compact_csv, args=(path,)))
+    script = ("import sys; sys.path.insert(0, sys.argv[1]); from utils.csv_handler import append_csv\n"
+              "for n in range(25):\n"
+              "    append_csv(sys.argv[2], {'id': sys.argv[3] + str(n).zfill(3), 'user_id': '9',"
+              " 'message': 'process', 'delivered': 'False'})\n")
+    processes = [subprocess.Popen([sys.executable, '-c', script, REPO, path, str(worker)])
+                 for worker in (200, 201)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert [process.wait() for process in processes] == [0, 0]
+    
+    result = read_csv(path)
+    ids = [row['id'] for row in result]
+    assert len(ids) == len(set(ids)) == 20 + 6 * 25
+    assert sum(row['message'] == 'process' for row in result) == 50
+    assert all(row['user_id'] in ('0', '1') for row in result if int(row['id']) <= 20)
+    assert compact_csv(path)
+    assert read_csv(path) == result
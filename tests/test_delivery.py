@@ -0,0 +1,66 @@
+"""
+Delivery: broadcasts reach each recipient through smtp
+"""
+import queue
+import pytest
+import config
+from notifications import delivery
+from notifications.engine import broadcast_notification
+from users.models import normalize_role
+from utils.csv_handler import read_csv
+
+
+class FakeSMTP:
+    sent = []
+    fail_after = None
+    
+    def __init__(self, host, port, timeout=None):
+        pass
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        return False
+    
+    def send_message(self, email):
+        if FakeSMTP.fail_after is not None and len(FakeSMTP.sent) >= FakeSMTP.fail_after:
+            FakeSMTP.fail_after = None
+            raise OSError('connection dropped')
+        FakeSMTP.sent.append(email['To'])
+
+
+@pytest.fixture
+def smtp(data_dir, monkeypatch):
+    monkeypatch.setattr(config, 'DELIVERY_CHANNEL', 'smtp')
+    monkeypatch.setattr(delivery.smtplib, 'SMTP', FakeSMTP)
+    monkeypatch.setattr(delivery, '_queue', queue.Queue())
+    monkeypatch.setattr(delivery, '_retries', [])
+    FakeSMTP.sent = []
+    FakeSMTP.fail_after = None
+    return FakeSMTP
+
+
+def _staff_emails():
+    return [user['email'] for user in read_csv(config.USERS_CSV)
+            if normalize_role(user['role']) == 'faculty' and user['email']]
+
+
+def test_broadcast_mails_each_recipient(smtp):
+    assert broadcast_notification('Staff meeting at noon', role='staff') > 0
+    job = delivery._queue.get_nowait()
+    delivery._deliver(job)
+    assert sorted(smtp.sent) == sorted(_staff_emails())
+    assert delivery._retries == []
+
+
+def test_broadcast_retry_skips_reached_recipients(smtp):
+    broadcast_notification('Library closes early')
+    job = delivery._queue.get_nowait()
+    smtp.fail_after = 3
+    delivery._deliver(job)
+    assert len(smtp.sent) == 3 and len(delivery._retries) == 1
+    
+    delivery._deliver(delivery._retries[0][2])
+    everyone = [user['email'] for user in read_csv(config.USERS_CSV) if user['email']]
+    assert sorted(smtp.sent) == sorted(everyone)
@@ -0,0 +1,39 @@
+"""
+Inbox API: pages and conditional requests
+"""
+import pytest
+from flask import Flask
+import config
+from notifications import notifications_bp
+from notifications.engine import create_notification
+
+
+@pytest.fixture
+def client(data_dir):
+    app = Flask(__name__, template_folder=config.TEMPLATES_DIR)
+    app.secret_key = 'test'
+    app.register_blueprint(notifications_bp)
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session.update(user_id='1', role='student', authenticated=True)
+    return client
+
+
+def test_pages_have_their_own_etag(client):
+    for number in range(3):
+        create_notification('1', f"Inbox message {number}")
+    
+    first = client.get('/notifications/inbox?limit=2')
+    assert first.status_code == 200
+    cursor = first.get_json()['next_before_id']
+    assert cursor
+    
+    # The first page's ETag must not make the second page look unchanged
+    second = client.get(f'/notifications/inbox?limit=2&before_id={cursor}',
+                        headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200
+    assert second.get_json()['notifications']
+    assert second.headers['ETag'] != first.headers['ETag']
+    
+    again = client.get('/notifications/inbox?limit=2', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
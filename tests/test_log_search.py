@@ -0,0 +1,54 @@
+"""
+Alert log search across rotated segments
+"""
+import config
+from notifications import logger
+from utils.log_index import LogIndex
+from utils.log_pipeline import flush_logs
+from utils import log_index, log_rotation
+
+
+def test_search_finds_alerts_from_before_rotation(data_dir, monkeypatch):
+    monkeypatch.setattr(logger, 'alert_index', LogIndex(config.ALERTS_LOG, config.ALERTS_LOG_INDEX,
+                                                        fields=logger._alert_fields))
+    logger.log_alert(101, 7, 'Library closes early', 'SENT')
+    assert len(logger.search_alerts('library')) == 1  # indexes the log before it rotates
+    
+    # The next write rotates the full log into a segment
+    monkeypatch.setattr(config, 'LOG_ROTATE_BYTES', 1)
+    logger.log_alert(102, 8, 'Gym reopens', 'SENT')
+    flush_logs()
+    assert [m['lines'] for m in log_rotation.segments(config.ALERTS_LOG)] == [1]
+    
+    assert [line.split('| ')[-1] for line in logger.search_alerts('library')] == ['Library closes early']
+    assert len(logger.search_alerts(notification_id='101')) == 1
+    assert len(logger.search_alerts(user_id='7', status='SENT')) == 1
+    assert [line.split('| ')[-1] for line in logger.search_alerts(status='SENT')] == ['Gym reopens', 'Library closes early']
+    assert logger.search_alerts('library', user_id='8') == []
+    
+    entries = logger.get_alert_log_entries(10)
+    assert [line.split('| ')[-1] for line in entries] == ['Gym reopens', 'Library closes early']
+
+
+def test_segment_postings_narrow_the_search(data_dir, monkeypatch):
+    monkeypatch.setattr(logger, 'alert_index', LogIndex(config.ALERTS_LOG, config.ALERTS_LOG_INDEX,
+                                                        fields=logger._alert_fields))
+    monkeypatch.setattr(config, 'LOG_ROTATE_BYTES', 1)
+    for number, message in enumerate(['Library closes early', 'Gym reopens', 'Pool closed', 'Lab open']):
+        logger.log_alert(200 + number, 9, message, 'SENT')
+        flush_logs()
+    manifests = log_rotation.segments(config.ALERTS_LOG)
+    assert len(manifests) == 3 and all(m['postings'] for m in manifests)
+    assert 'gym' in log_rotation.read_postings(manifests[1])
+    
+    opened = []
+    read_segment = log_index.read_segment
+    monkeypatch.setattr(log_index, 'read_segment', lambda manifest: opened.append(manifest['segment']) or read_segment(manifest))
+    assert [line.split('| ')[-1] for line in logger.search_alerts('gym')] == ['Gym reopens']
+    assert opened == [manifests[1]['segment']]
+    
+    # A segment without postings is scanned
+    del opened[:]
+    monkeypatch.setitem(manifests[0], 'postings', None)
+    assert [line.split('| ')[-1] for line in logger.search_alerts('librar')] == ['Library closes early']
+    assert opened == [manifests[0]['segment']]
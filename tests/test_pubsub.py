@@ -0,0 +1,28 @@
+"""
+Notification stream: who sees which events
+"""
+from notifications.pubsub import Event, hub
+from notifications.engine import broadcast_notification
+from notifications.broadcasts import broadcasts
+from users.models import get_user_by_id
+
+
+def test_staff_role_event_visible_to_staff_session():
+    # A staff user's session holds the normalised role
+    event = Event(1, 'notification', {}, role='staff')
+    assert event.visible_to('4', 'faculty')
+    assert event.visible_to('4', 'staff')
+    assert not event.visible_to('1', 'student')
+
+
+def test_staff_broadcast_reaches_stream_and_inbox(data_dir):
+    staff = get_user_by_id(4)
+    assert staff.role == 'faculty'  # stored as 'staff'
+    
+    after = hub.last_id()
+    assert broadcast_notification('Staff meeting at noon', role='staff') > 0
+    events, _ = hub.wait(after, 0)
+    
+    assert [e.data['message'] for e in events if e.visible_to(staff.id, staff.role)] == ['Staff meeting at noon']
+    assert [n['message'] for n in broadcasts.for_user(staff.id)] == ['Staff meeting at noon']
+    assert broadcasts.for_user(1) == []  # student
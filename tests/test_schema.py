@@ -0,0 +1,35 @@
+"""
+Typed records: read_records matches the dict readers, journal changes included
+"""
+import config
+from utils.csv_handler import read_csv, update_csv_row, delete_csv_row
+from utils.schema import read_records, get_record, get_records, NOTIFICATION_SCHEMA
+
+
+def test_records_match_rows(data_dir):
+    update_csv_row(config.NOTIFICATIONS_CSV, 'id', '1', {'delivered': 'False', 'message_id': '7'})
+    delete_csv_row(config.NOTIFICATIONS_CSV, 'id', '2')
+    
+    rows = read_csv(config.NOTIFICATIONS_CSV)
+    records = list(read_records(config.NOTIFICATIONS_CSV))
+    assert [record.id for record in records] == [int(row['id']) for row in rows]
+    assert [record.delivered for record in records] == [row['delivered'] == 'True' for row in rows]
+    
+    first = records[0]
+    assert (first.id, first.delivered, first.message_id) == (1, False, 7)
+    assert get_record(config.NOTIFICATIONS_CSV, 1).message_id == 7
+    assert get_record(config.NOTIFICATIONS_CSV, 2) is None
+    assert [record.id for record in get_records(config.NOTIFICATIONS_CSV, [3, 2, 1])] == [3, 1]
+
+
+def test_projection_and_filter(data_dir):
+    records = list(read_records(config.NOTIFICATIONS_CSV, columns=['user_id', 'delivered'], where={'user_id': 1}))
+    assert records and all(record.user_id == 1 for record in records)
+    # Columns outside the projection keep their defaults
+    assert all(record.message == '' and record.id is None for record in records)
+
+
+def test_value_parses_one_column():
+    assert NOTIFICATION_SCHEMA.value({'delivered': 'True'}, 'delivered') is True
+    assert NOTIFICATION_SCHEMA.value({'delivered': 'true'}, 'delivered') is True
+    assert NOTIFICATION_SCHEMA.value({}, 'delivered') is False
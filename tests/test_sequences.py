@@ -0,0 +1,76 @@
+"""
+Id allocation from per-table sequences
+"""
+import os
+import subprocess
+import sys
+import threading
+from utils.csv_handler import allocate_ids, write_csv, read_csv
+from utils.sequences import get_sequence
+
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_ids_are_unique_across_threads_and_processes(tmp_path):
+    path = str(tmp_path / 'table.csv')
+    assert write_csv(path, [{'id': '7', 'name': 'seven'}], ['id', 'name'])
+    
+    script = ("import sys; sys.path.insert(0, sys.argv[1]); from utils.csv_handler import allocate_ids\n"
+              "print(' '.join(str(allocate_ids(sys.argv[2], 1 + n % 3)) + ':' + str(1 + n % 3) for n in range(60)))\n")
+    processes = [subprocess.Popen([sys.executable, '-c', script, REPO, path], stdout=subprocess.PIPE, text=True)
+                 for _ in range(3)]
+    allocated = []
+    
+    def allocate():
+        for n in range(60):
+            count = 1 + n % 3
+            allocated.append((allocate_ids(path, count), count))
+    
+    threads = [threading.Thread(target=allocate) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for process in processes:
+        output, _ = process.communicate()
+        assert process.returncode == 0
+        allocated += [tuple(map(int, item.split(':'))) for item in output.split()]
+    
+    ids = [first + n for first, count in allocated for n in range(count)]
+    assert len(ids) == len(set(ids)) == 7 * 120
+    assert min(ids) > 7
+
+
+def _restart(path):
+    """
+    Forget the block of ids this process holds, as a new process would
+    """
+    sequence = get_sequence(path)
+    sequence._next = sequence._limit = None
+
+
+def test_lost_sequence_file_reseeds_past_the_table(tmp_path):
+    path = str(tmp_path / 'table.csv')
+    assert write_csv(path, [{'id': '1', 'name': 'one'}], ['id', 'name'])
+    first = allocate_ids(path)
+    rows = read_csv(path) + [{'id': str(first + n), 'name': 'new'} for n in range(30)]
+    assert write_csv(path, rows, ['id', 'name'])
+    
+    # A data directory restored without its sequence files
+    os.remove(path + '.seq')
+    _restart(path)
+    assert allocate_ids(path) > first + 29
+    
+    with open(path + '.seq', 'w', encoding='utf-8') as f:
+        f.write('not a number')
+    _restart(path)
+    assert write_csv(path, read_csv(path) + [{'id': '500', 'name': 'explicit'}], ['id', 'name'])
+    assert allocate_ids(path) > 500
+    
+    # Lost while this process still holds a block: no id it handed out comes back
+    handed_out = [allocate_ids(path) for _ in range(3)]
+    os.remove(path + '.seq')
+    later = [allocate_ids(path) for _ in range(40)]
+    assert min(later) > max(handed_out)
+    assert len(set(later)) == 40
@@ -0,0 +1,41 @@
+"""
+User listing pages: filtered pages match a full sort of the matching users
+"""
+import pytest
+import config
+from utils.csv_handler import read_csv
+from users.models import user_index
+
+
+def _all_pages(sort, prefix, roles, limit):
+    rows, after = [], None
+    while True:
+        page, after = user_index.page(sort, prefix, roles, after, limit)
+        assert len(page) <= limit
+        rows.extend(page)
+        if after is None:
+            return rows
+
+
+def _expected(sort, prefix, roles):
+    rows = [row for row in read_csv(config.USERS_CSV)
+            if (not roles or row['role'].casefold() in roles)
+            and (row['username'].casefold().startswith(prefix) or row['email'].casefold().startswith(prefix))]
+    if sort == 'username':
+        return sorted(rows, key=lambda row: (row['username'].casefold(), int(row['id'])))
+    return sorted(rows, key=lambda row: int(row['id']))
+
+
+@pytest.mark.parametrize('sort', ['id', 'username'])
+@pytest.mark.parametrize('prefix, roles', [
+    ('', ['admin']),
+    ('', ['staff', 'student']),
+    ('', ['nobody']),
+    ('s', None),
+    ('s', ['staff']),
+    ('zzz', None),
+])
+@pytest.mark.parametrize('limit', [1, 7, 500])
+def test_filtered_pages(data_dir, sort, prefix, roles, limit):
+    rows = _all_pages(sort, prefix, roles, limit)
+    assert [row['id'] for row in rows] == [row['id'] for row in _expected(sort, prefix, roles)]
@@ -0,0 +1,110 @@
+"""
+Bulk User Import
+Onboards a CSV of new users (e.g. semester intake) in one commit
+
+The input needs 'username' and 'email' columns and may have a 'role'
+column. Rows are streamed and validated against the user indexes and each
+other in a single pass; the valid ones get their ids in one sequence
+allocation and are written with one atomic table write. Invalid rows are
+skipped and reported with their line number.
+
+Usage: python -m users.importer <file.csv> [default_role]
+"""
+import csv
+import sys
+import config
+from utils.csv_handler import transaction
+from users.models import get_user_by_username, get_user_by_email, user_index
+from users.services import VALID_ROLES, log_admin_action
+
+
+REQUIRED_COLUMNS = ['username', 'email']
+
+
+def _validate_row(row, default_role, seen_usernames, seen_emails):
+    """
+    Check one input row
+    Returns: (user_data, error_message)
+    """
+    username = (row.get('username') or '').strip()
+    email = (row.get('email') or '').strip()
+    role = (row.get('role') or '').strip().lower() or default_role
+    
+    if not username:
+        return None, "Missing username"
+    if not email or '@' not in email:
+        return None, "Missing or invalid email"
+    if role not in VALID_ROLES:
+        return None, f"Invalid role '{role}'"
+    if username.casefold() in seen_usernames:
+        return None, "Duplicate username in file"
+    if email.casefold() in seen_emails:
+        return None, "Duplicate email in file"
+    if get_user_by_username(username):
+        return None, "Username already exists"
+    if get_user_by_email(email):
+        return None, "Email already exists"
+    
+    return {'username': username, 'email': email, 'role': role}, None
+
+
+def import_users(source, default_role='student', dry_run=False):
+    """
+    Import users from a CSV text stream
+    dry_run: validate only, write nothing
+    Returns: (created, errors) - created user rows (with ids unless dry_run)
+    and a list of {'line', 'username', 'error'} for skipped rows
+    """
+    reader = csv.DictReader(source)
+    columns = [(name or '').strip().lower() for name in (reader.fieldnames or [])]
+    missing = [name for name in REQUIRED_COLUMNS if name not in columns]
+    if missing:
+        return [], [{'line': 1, 'username': '', 'error': f"Missing columns: {', '.join(missing)}"}]
+    reader.fieldnames = columns
+    
+    if default_role not in VALID_ROLES:
+        return [], [{'line': 1, 'username': '', 'error': f"Invalid default role '{default_role}'"}]
+    
+    created = []
+    errors = []
+    seen_usernames = set()
+    seen_emails = set()
+    for row in reader:
+        user_data, error = _validate_row(row, default_role, seen_usernames, seen_emails)
+        if error:
+            errors.append({'line': reader.line_num, 'username': (row.get('username') or '').strip(), 'error': error})
+            continue
+        seen_usernames.add(user_data['username'].casefold())
+        seen_emails.add(user_data['email'].casefold())
+        created.append(user_data)
+    
+    if dry_run or not created:
+        return created, errors
+    
+    try:
+        # One read, one id allocation and one atomic write for the whole batch
+        with user_index.change() as change:
+            with transaction(config.USERS_CSV) as tx:
+                created = [tx.insert(user_data) for user_data in created]
+            for user_data in created:
+                change.add(user_data)
+    except Exception as e:
+        print(f"Error importing users: {e}")
+        return [], errors + [{'line': 0, 'username': '', 'error': "Failed to save users; nothing was imported"}]
+    
+    log_admin_action('IMPORT_USERS', f"Imported {len(created)} users ({len(errors)} rows skipped)")
+    return created, errors
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Usage: python -m users.importer <file.csv> [default_role]")
+        sys.exit(1)
+    
+    role = sys.argv[2] if len(sys.argv) > 2 else 'student'
+    with open(sys.argv[1], 'r', newline='', encoding='utf-8-sig') as f:
+        users, problems = import_users(f, role)
+    
+    for problem in problems:
+        print(f"Line {problem['line']}: {problem['username'] or '-'}: {problem['error']}")
+    print(f"Imported {len(users)} users, skipped {len(problems)} rows")
@@ -3,8 +3,14 @@ User Models
 User data abstraction and access methods
 Uses original CSV format without password hashing
 """
+import base64
+import heapq
+import json
+from bisect import bisect_left, bisect_right, insort
+from contextlib import contextmanager
+from threading import Lock
 import config
-from utils.csv_handler import read_csv, write_csv, append_csv, get_next_id
+from utils.csv_handler import read_csv, write_csv, append_csv, allocate_ids, table_version
 
 
 class User:
@@ -22,10 +28,7 @@ class User:
         """
         Normalize role names (staff -> faculty mapping)
         """
-        role = role.lower()
-        if role == 'staff':
-            return 'faculty'
-        return role
+        return normalize_role(role)
     
     def to_dict(self):
         """
@@ -63,14 +66,293 @@ class User:
         return self.role == 'visitor'
 
 
+def normalize_role(role):
+    """
+    Normalize a role name as the session holds it (staff -> faculty mapping)
+    """
+    role = (role or '').lower()
+    if role == 'staff':
+        return 'faculty'
+    return role
+
+
+class UserIndex:
+    """
+    In-memory lookups over the users table
+    id -> row, case-folded username/email -> row, case-folded role -> set of ids,
+    plus id-, username- and email-sorted lists for paging and prefix search
+    
+    Built on first use and kept up to date by the writes wrapped in
+    change(). Changes made elsewhere (another process, a direct CSV edit) change the table
+    version, which makes the next lookup rebuild the index.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._version = None
+        self.by_id = {}
+        self.by_username = {}
+        self.by_email = {}
+        self.by_role = {}
+        self.sorted_ids = []
+        self.sorted_usernames = []
+        self.sorted_emails = []
+    
+    @staticmethod
+    def _fold(value):
+        return str(value or '').casefold()
+    
+    @staticmethod
+    def _id_key(user_id):
+        try:
+            return int(user_id)
+        except (TypeError, ValueError):
+            return 0
+    
+    def _sort_keys(self, row):
+        id_key = self._id_key(row.get('id'))
+        return ((self.sorted_ids, id_key),
+                (self.sorted_usernames, (self._fold(row.get('username')), id_key)),
+                (self.sorted_emails, (self._fold(row.get('email')), id_key)))
+    
+    def _add(self, row, bulk=False):
+        user_id = str(row.get('id'))
+        if user_id in self.by_id:
+            return
+        self.by_id[user_id] = row
+        # The first row wins, as with a scan in file order
+        self.by_username.setdefault(self._fold(row.get('username')), row)
+        self.by_email.setdefault(self._fold(row.get('email')), row)
+        self.by_role.setdefault(self._fold(row.get('role')), set()).add(user_id)
+        for sorted_list, key in self._sort_keys(row):
+            if bulk:
+                # Sorted once at the end of a rebuild
+                sorted_list.append(key)
+            else:
+                insort(sorted_list, key)
+    
+    def _remove(self, user_id):
+        row = self.by_id.pop(str(user_id), None)
+        if row is None:
+            return
+        for sorted_list, key in self._sort_keys(row):
+            position = bisect_left(sorted_list, key)
+            if position < len(sorted_list) and sorted_list[position] == key:
+                del sorted_list[position]
+        for index, field in ((self.by_username, 'username'), (self.by_email, 'email')):
+            key = self._fold(row.get(field))
+            if index.get(key) is row:
+                del index[key]
+                # Fall back to a remaining duplicate, if any
+                for other in self.by_id.values():
+                    if self._fold(other.get(field)) == key:
+                        index[key] = other
+                        break
+        self.by_role.get(self._fold(row.get('role')), set()).discard(str(user_id))
+    
+    def _current(self):
+        """
+        Rebuild if the table changed since the index was built (caller holds the lock)
+        """
+        version = table_version(config.USERS_CSV)
+        if version != self._version:
+            self.by_id, self.by_username, self.by_email, self.by_role = {}, {}, {}, {}
+            self.sorted_ids, self.sorted_usernames, self.sorted_emails = [], [], []
+            for row in read_csv(config.USERS_CSV):
+                self._add(row, bulk=True)
+            self.sorted_ids.sort()
+            self.sorted_usernames.sort()
+            self.sorted_emails.sort()
+            self._version = table_version(config.USERS_CSV)
+        return self
+    
+    @contextmanager
+    def change(self):
+        """
+        Wrap a write to the users table and record its effect
+        
+        Usage:
+            with user_index.change() as change:
+                if append_csv(config.USERS_CSV, user_data, fieldnames):
+                    change.add(user_data)
+        
+        Applied only if the index matched the table before the write;
+        otherwise the next lookup rebuilds. Look users up before entering.
+        """
+        with self._lock:
+            in_step = self._version is not None and table_version(config.USERS_CSV) == self._version
+            change = UserChange()
+            yield change
+            if not in_step:
+                self._version = None
+                return
+            for user_id in change.removed:
+                self._remove(user_id)
+            for row in change.added:
+                self._add(row)
+            for user_id, role in change.roles:
+                row = self.by_id.get(user_id)
+                if row is not None:
+                    self.by_role.get(self._fold(row.get('role')), set()).discard(user_id)
+                    row['role'] = role
+                    self.by_role.setdefault(self._fold(role), set()).add(user_id)
+            self._version = table_version(config.USERS_CSV)
+    
+    def get(self, index_name, key):
+        with self._lock:
+            index = getattr(self._current(), index_name)
+            row = index.get(key if index_name == 'by_id' else self._fold(key))
+            return dict(row) if row is not None else None
+    
+    def with_role(self, role):
+        with self._lock:
+            current = self._current()
+            ids = current.by_role.get(self._fold(role), ())
+            return [dict(current.by_id[user_id]) for user_id in sorted(ids, key=int)]
+    
+    def role_counts(self):
+        with self._lock:
+            return {role: len(ids) for role, ids in self._current().by_role.items()}
+    
+    def max_id(self):
+        with self._lock:
+            ids = self._current().sorted_ids
+            return ids[-1] if ids else 0
+    
+    def _prefix_ids(self, sorted_list, prefix):
+        """
+        Ids whose sort key starts with prefix (binary search, then a range walk)
+        """
+        ids = set()
+        for position in range(bisect_left(sorted_list, (prefix,)), len(sorted_list)):
+            key, id_key = sorted_list[position]
+            if not key.startswith(prefix):
+                break
+            ids.add(id_key)
+        return ids
+    
+    def page(self, sort='id', prefix='', roles=None, after=None, limit=50):
+        """
+        One page of users in id or username order
+        prefix: case-insensitive prefix of the username or email
+        roles: only users with one of these roles
+        after: cursor returned with the previous page
+        Returns: (rows, next_cursor) - next_cursor is None on the last page
+        """
+        with self._lock:
+            current = self._current()
+            username_order = sort == 'username'
+            keys = current.sorted_usernames if username_order else current.sorted_ids
+            
+            def row_of(key):
+                return current.by_id[str(key[1] if username_order else key)]
+            
+            def sort_key(id_key):
+                if username_order:
+                    return (self._fold(current.by_id[str(id_key)].get('username')), id_key)
+                return id_key
+            
+            cursor = _decode_cursor(after)
+            if cursor is not None and isinstance(cursor, tuple) != username_order:
+                # Cursor from a listing with a different sort order
+                cursor = None
+            start = bisect_right(keys, cursor) if cursor is not None else 0
+            roles = {self._fold(role) for role in roles or ()}
+            prefix = self._fold(prefix)
+            
+            def selected(key):
+                row = row_of(key)
+                if roles and self._fold(row.get('role')) not in roles:
+                    return False
+                return (not prefix or self._fold(row.get('username')).startswith(prefix) or
+                        self._fold(row.get('email')).startswith(prefix))
+            
+            if not prefix and not roles:
+                page_keys = keys[start:start + limit + 1]
+            else:
+                if prefix:
+                    ids = (self._prefix_ids(current.sorted_usernames, prefix) |
+                           self._prefix_ids(current.sorted_emails, prefix))
+                    matches = len(ids)
+                else:
+                    ids = None
+                    matches = sum(len(current.by_role.get(role, ())) for role in roles)
+                
+                if matches * matches < (limit + 1) * len(keys):
+                    # Few matches: pick the page from them without sorting them all
+                    if ids is None:
+                        ids = {self._id_key(user_id) for role in roles for user_id in current.by_role.get(role, ())}
+                    page_keys = heapq.nsmallest(limit + 1, (
+                        key for key in map(sort_key, ids)
+                        if (cursor is None or key > cursor) and selected(key)
+                    ))
+                else:
+                    # Many matches: walk the sorted keys from the cursor, skipping
+                    # the rest (about len(keys) / matches keys per match)
+                    page_keys = []
+                    for position in range(start, len(keys)):
+                        if selected(keys[position]):
+                            page_keys.append(keys[position])
+                            if len(page_keys) > limit:
+                                break
+            
+            # One key past the page tells whether there is a next page
+            more = len(page_keys) > limit
+            page_keys = page_keys[:limit]
+            rows = [dict(row_of(key)) for key in page_keys]
+            next_cursor = _encode_cursor(page_keys[-1]) if more else None
+            return rows, next_cursor
+
+
+class UserChange:
+    """
+    Users added, removed or given a new role by one write
+    """
+    def __init__(self):
+        self.added = []
+        self.removed = []
+        self.roles = []
+    
+    def add(self, row):
+        self.added.append(dict(row))
+    
+    def remove(self, user_id):
+        self.removed.append(str(user_id))
+    
+    def set_role(self, user_id, role):
+        self.roles.append((str(user_id), role))
+
+
+def _encode_cursor(key):
+    """
+    Opaque page cursor for a sort key
+    """
+    return base64.urlsafe_b64encode(json.dumps(key).encode('utf-8')).decode('ascii')
+
+
+def _decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, UnicodeError):
+        return None
+    if isinstance(key, list) and len(key) == 2 and isinstance(key[0], str) and isinstance(key[1], int):
+        return tuple(key)
+    if isinstance(key, int):
+        return key
+    return None
+
+
+user_index = UserIndex()
+
+
 def get_user_by_id(user_id):
     """
     Get user by ID
     """
-    users = read_csv(config.USERS_CSV)
-    for user_data in users:
-        if str(user_data.get('id')) == str(user_id):
-            return User(**user_data)
+    user_data = user_index.get('by_id', str(user_id))
+    if user_data:
+        return User(**user_data)
     return None
 
 
@@ -78,10 +360,9 @@ def get_user_by_username(username):
     """
     Get user by username
     """
-    users = read_csv(config.USERS_CSV)
-    for user_data in users:
-        if user_data.get('username', '').lower() == username.lower():
-            return User(**user_data)
+    user_data = user_index.get('by_username', username)
+    if user_data:
+        return User(**user_data)
     return None
 
 
@@ -89,10 +370,9 @@ def get_user_by_email(email):
     """
     Get user by email
     """
-    users = read_csv(config.USERS_CSV)
-    for user_data in users:
-        if user_data.get('email', '').lower() == email.lower():
-            return User(**user_data)
+    user_data = user_index.get('by_email', email)
+    if user_data:
+        return User(**user_data)
     return None
 
 
@@ -114,8 +394,8 @@ def create_user(username, email, password, role='visitor'):
     if get_user_by_email(email):
         return None, "Email already exists"
     
-    # Get next ID
-    next_id = get_next_id(config.USERS_CSV)
+    # Reserve next ID from the table sequence
+    next_id = allocate_ids(config.USERS_CSV)
     
     # Create user data - original format only
     user_data = {
@@ -127,8 +407,10 @@ def create_user(username, email, password, role='visitor'):
     
     # Append to CSV using original fieldnames
     fieldnames = ['id', 'username', 'email', 'role']
-    if append_csv(config.USERS_CSV, user_data, fieldnames):
-        return User(**user_data), None
+    with user_index.change() as change:
+        if append_csv(config.USERS_CSV, user_data, fieldnames):
+            change.add(user_data)
+            return User(**user_data), None
     
     return None, "Failed to create user"
 
@@ -4,10 +4,13 @@ Admin-only user management operations
 Uses original CSV format
 """
 import config
-from utils.csv_handler import read_csv, write_csv, delete_csv_row, get_next_id
+from utils.csv_handler import append_csv, update_csv_row, delete_csv_row, allocate_ids
+from utils.log_pipeline import log_event
 from utils.time_utils import get_timestamp
-from users.models import User, get_user_by_id, get_user_by_username, get_user_by_email
-import os
+from users.models import User, get_user_by_id, get_user_by_username, get_user_by_email, user_index
+
+
+VALID_ROLES = ['admin', 'faculty', 'student', 'visitor', 'staff']
 
 
 def create_user_admin(username, email, role):
@@ -16,9 +19,8 @@ def create_user_admin(username, email, role):
     Adds to scns_users.csv with original format
     """
     # Validate role
-    valid_roles = ['admin', 'faculty', 'student', 'visitor', 'staff']
-    if role not in valid_roles:
-        return None, f"Invalid role. Must be one of: {', '.join(valid_roles)}"
+    if role not in VALID_ROLES:
+        return None, f"Invalid role. Must be one of: {', '.join(VALID_ROLES)}"
     
     # Check if username or email already exists
     if get_user_by_username(username):
@@ -26,8 +28,8 @@ def create_user_admin(username, email, role):
     if get_user_by_email(email):
         return None, "Email already exists"
     
-    # Get next ID
-    next_id = get_next_id(config.USERS_CSV)
+    # Reserve next ID from the table sequence
+    next_id = allocate_ids(config.USERS_CSV)
     
     # Create user data - original CSV format
     user_data = {
@@ -37,15 +39,13 @@ def create_user_admin(username, email, role):
         'role': role
     }
     
-    # Read existing users and append
-    users = read_csv(config.USERS_CSV)
-    users.append(user_data)
-    
-    # Use original fieldnames
+    # Append without rewriting the table, using original fieldnames
     fieldnames = ['id', 'username', 'email', 'role']
-    if write_csv(config.USERS_CSV, users, fieldnames):
-        log_admin_action('CREATE_USER', f"Created user {username} with role {role}")
-        return User(**user_data), None
+    with user_index.change() as change:
+        if append_csv(config.USERS_CSV, user_data, fieldnames):
+            change.add(user_data)
+            log_admin_action('CREATE_USER', f"Created user {username} with role {role}")
+            return User(**user_data), None
     
     return None, "Failed to create user"
 
@@ -62,9 +62,11 @@ def delete_user(user_id, admin_user_id):
     if str(user_id) == str(admin_user_id):
         return False, "Cannot delete your own account"
     
-    if delete_csv_row(config.USERS_CSV, 'id', user_id):
-        log_admin_action('DELETE_USER', f"Deleted user {user.username} (ID: {user_id})")
-        return True, None
+    with user_index.change() as change:
+        if delete_csv_row(config.USERS_CSV, 'id', user_id):
+            change.remove(user_id)
+            log_admin_action('DELETE_USER', f"Deleted user {user.username} (ID: {user_id})")
+            return True, None
     
     return False, "Failed to delete user"
 
@@ -73,9 +75,8 @@ def update_user_role(user_id, new_role, admin_user_id):
     """
     Admin function to update user role
     """
-    valid_roles = ['admin', 'faculty', 'student', 'visitor', 'staff']
-    if new_role not in valid_roles:
-        return False, f"Invalid role. Must be one of: {', '.join(valid_roles)}"
+    if new_role not in VALID_ROLES:
+        return False, f"Invalid role. Must be one of: {', '.join(VALID_ROLES)}"
     
     user = get_user_by_id(user_id)
     if not user:
@@ -84,16 +85,11 @@ def update_user_role(user_id, new_role, admin_user_id):
     old_role = user.role
     
     # Update user in CSV
-    users = read_csv(config.USERS_CSV)
-    for u in users:
-        if str(u['id']) == str(user_id):
-            u['role'] = new_role
-            break
-    
-    fieldnames = ['id', 'username', 'email', 'role']
-    if write_csv(config.USERS_CSV, users, fieldnames):
-        log_admin_action('UPDATE_ROLE', f"Changed {user.username} role from {old_role} to {new_role}")
-        return True, None
+    with user_index.change() as change:
+        if update_csv_row(config.USERS_CSV, 'id', user_id, {'role': new_role}):
+            change.set_role(user_id, new_role)
+            log_admin_action('UPDATE_ROLE', f"Changed {user.username} role from {old_role} to {new_role}")
+            return True, None
     
     return False, "Failed to update role"
 
@@ -102,8 +98,22 @@ def get_users_by_role(role):
     """
     Get all users with a specific role
     """
-    users = read_csv(config.USERS_CSV)
-    return [User(**u) for u in users if u.get('role', '').lower() == role.lower()]
+    return [User(**u) for u in user_index.with_role(role)]
+
+
+def get_users_page(sort='id', search='', role=None, after=None, limit=None):
+    """
+    Get one page of users for the management listing
+    search: prefix of username or email; role: filter ('faculty' includes 'staff')
+    Returns: (users, next_cursor)
+    """
+    if sort not in ('id', 'username'):
+        sort = 'id'
+    roles = None
+    if role:
+        roles = ['faculty', 'staff'] if role == 'faculty' else [role]
+    rows, next_cursor = user_index.page(sort, search, roles, after, limit or config.USERS_PAGE_SIZE)
+    return [User(**row) for row in rows], next_cursor
 
 
 def get_user_stats():
@@ -111,27 +121,14 @@ def get_user_stats():
     Get user statistics by role
     Note: 'staff' in CSV is treated as 'faculty'
     """
-    users = read_csv(config.USERS_CSV)
-    stats = {
-        'total': len(users),
-        'admin': 0,
-        'faculty': 0,  # This will include both 'faculty' and 'staff'
-        'student': 0,
-        'visitor': 0
+    counts = user_index.role_counts()
+    return {
+        'total': sum(counts.values()),
+        'admin': counts.get('admin', 0),
+        'faculty': counts.get('faculty', 0) + counts.get('staff', 0),
+        'student': counts.get('student', 0),
+        'visitor': counts.get('visitor', 0)
     }
-    
-    for user in users:
-        role = user.get('role', '').lower()
-        if role == 'admin':
-            stats['admin'] += 1
-        elif role in ['faculty', 'staff']:  # Count staff as faculty
-            stats['faculty'] += 1
-        elif role == 'student':
-            stats['student'] += 1
-        elif role == 'visitor':
-            stats['visitor'] += 1
-    
-    return stats
 
 
 def log_admin_action(action_type, description):
@@ -139,11 +136,9 @@ def log_admin_action(action_type, description):
     Log admin actions for audit trail
     """
     try:
-        os.makedirs(config.LOGS_DIR, exist_ok=True)
         timestamp = get_timestamp()
         log_entry = f"[{timestamp}] {action_type}: {description}\n"
         
-        with open(config.AUDIT_LOG, 'a', encoding='utf-8') as f:
-            f.write(log_entry)
+        log_event(config.AUDIT_LOG, log_entry, 'admin_action', action=action_type, description=description)
     except Exception as e:
         print(f"Error writing to audit log: {e}")
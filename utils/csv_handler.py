@@ -1,30 +1,251 @@
 """
 CSV Handler Utility
 Safe read/write operations for CSV files
+Calls are routed to the SQLite backend when config.STORAGE_BACKEND is 'sqlite'
+
+Each CSV table is a base snapshot plus an append-only journal of updates and
+deletes (see utils/journal.py). Appends go straight to the snapshot, row
+changes go to the journal, and a background compactor folds the journal into
+a new snapshot once it grows past config.JOURNAL_COMPACT_THRESHOLD.
+
+With config.PK_INDEX_ENABLED, a sidecar id -> byte offset index (see
+utils/pk_index.py) turns lookups by id into a single seek.
+
+With config.DURABILITY = 'write_behind', appends and row changes are queued
+in utils/write_behind.py and written in batches by a background writer;
+reads overlay whatever is still queued.
 """
 import csv
+import io
 import os
-from threading import Lock
+import queue
+import tempfile
+import threading
+from contextlib import contextmanager
+from itertools import groupby
+from operator import itemgetter
+import config
+from utils import journal, sqlite_store, write_behind
+from utils.locks import read_lock, write_lock
+from utils.pk_index import get_index
+from utils.sequences import get_sequence
+from utils.tail import reverse_lines
 
-# Thread lock for safe file operations
-_csv_lock = Lock()
+
+def _use_sqlite(filepath):
+    """
+    Check if a file is stored in the SQLite backend
+    """
+    return config.STORAGE_BACKEND == 'sqlite' and sqlite_store.handles(filepath)
 
 
 def read_csv(filepath):
     """
     Read CSV file and return list of dictionaries
     """
-    if not os.path.exists(filepath):
-        return []
+    if _use_sqlite(filepath):
+        return sqlite_store.read_rows(filepath)
     
-    with _csv_lock:
+    with read_lock(filepath):
+        return _read_rows(filepath)
+
+
+def _read_rows(filepath):
+    """
+    Read snapshot rows with the journal replayed (caller holds the file lock)
+    """
+    rows = []
+    if os.path.exists(filepath):
         try:
             with open(filepath, 'r', newline='', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                return list(reader)
+                rows = journal.apply_ops(list(csv.DictReader(f)), journal.read_ops(filepath))
         except Exception as e:
             print(f"Error reading CSV {filepath}: {e}")
             return []
+    
+    return _apply_pending(rows, write_behind.pending(filepath))
+
+
+def _apply_pending(rows, entries):
+    """
+    Overlay queued write-behind entries on rows, in the order they were made
+    """
+    for kind, group in groupby(entries, key=itemgetter(0)):
+        if kind == 'insert':
+            rows.extend(dict(row) for _, row in group)
+        else:
+            rows = journal.apply_ops(rows, [op for _, ops in group for op in ops])
+    return rows
+
+
+def read_csv_iter(filepath, columns=None, where=None, build=None):
+    """
+    Stream rows from a CSV file without loading the whole table
+    columns: only these fields are included in each yielded dict
+    where: {field: value} equality filters, checked before a row is built
+    build: build(header) gives a function from a row's values (in header
+    order) to the item yielded instead of a dict, e.g. a typed record
+    
+    Reads the snapshot as it was when iteration started; rows appended
+    while streaming are not included.
+    """
+    if _use_sqlite(filepath):
+        rows = sqlite_store.iter_rows(filepath, columns, where)
+        yield from rows if build is None else _built(rows, build)
+        return
+    
+    with read_lock(filepath):
+        if write_behind.pending(filepath):
+            # Queued writes are not on disk yet - filter the overlaid rows
+            rows = _read_rows(filepath)
+        elif not os.path.exists(filepath):
+            return
+        else:
+            rows = None
+            ops = journal.read_ops(filepath)
+            f = open(filepath, 'rb')
+    
+    if rows is not None:
+        where = {field: str(value) for field, value in (where or {}).items()}
+        for row in rows:
+            if all(str(row.get(field)) == value for field, value in where.items()):
+                if build is not None:
+                    yield build(tuple(row))(tuple(row.values()))
+                else:
+                    yield row if columns is None else {field: row.get(field, '') for field in columns}
+        return
+    
+    # The open handle keeps this snapshot even if it is replaced meanwhile
+    try:
+        size = os.fstat(f.fileno()).st_size
+        reader = csv.reader(_snapshot_lines(f, size))
+        header = next(reader, None)
+        if header is None:
+            return
+        
+        where = {field: str(value) for field, value in (where or {}).items()}
+        filters = [(header.index(field), value) for field, value in where.items() if field in header]
+        # Filtering on a column the snapshot does not have matches only rows
+        # the journal gives that column
+        missing_filter = len(filters) < len(where)
+        if missing_filter and not ops:
+            return
+        
+        if build is not None:
+            make = build(tuple(header))
+        elif columns is not None:
+            projection = [(field, header.index(field) if field in header else None) for field in columns]
+        
+        # Journal operations indexed by the key they target, in journal order
+        touched = {}
+        for seq, op in enumerate(ops):
+            touched.setdefault(op['key'], {}).setdefault(op['value'], []).append((seq, op))
+        touched_keys = [(header.index(key), by_value) for key, by_value in touched.items() if key in header]
+        applied = set()
+        
+        for values in reader:
+            pending = [entry for index, by_value in touched_keys if index < len(values)
+                       for entry in by_value.get(values[index], ())]
+            row = None
+            if not pending:
+                # Untouched row - skip on the raw values before building a dict
+                if missing_filter or any(index >= len(values) or values[index] != value
+                                         for index, value in filters):
+                    continue
+            else:
+                row = dict(zip(header, values))
+                deleted = False
+                for seq, op in sorted(pending, key=lambda entry: entry[0]):
+                    if op['op'] == 'delete':
+                        deleted = True
+                    elif seq not in applied:
+                        # An update only changes the first row it matches
+                        applied.add(seq)
+                        row.update(op['updates'])
+                if deleted or any(str(row.get(field)) != value for field, value in where.items()):
+                    continue
+            
+            if build is not None:
+                # Journal updates may add columns the header does not have
+                yield make(values) if row is None else build(tuple(row))(tuple(row.values()))
+            elif columns is None:
+                yield row if row is not None else dict(zip(header, values))
+            elif row is None:
+                yield {field: values[index] if index is not None and index < len(values) else ''
+                       for field, index in projection}
+            else:
+                yield {field: row.get(field, '') for field in columns}
+    finally:
+        f.close()
+
+
+def _built(rows, build):
+    """
+    Turn dict rows into build() items
+    """
+    for row in rows:
+        yield build(tuple(row))(tuple(row.values()))
+
+
+def tail_csv(filepath, count):
+    """
+    Get the last count rows of a table (the newest appends), oldest first
+    Reads the snapshot backwards instead of loading the whole file
+    """
+    if _use_sqlite(filepath):
+        return sqlite_store.tail_rows(filepath, count)
+    
+    with read_lock(filepath):
+        if not os.path.exists(filepath):
+            return _apply_pending([], write_behind.pending(filepath))[-count:]
+        
+        header = _read_header(filepath)
+        ops = journal.read_ops(filepath)
+        pending = write_behind.pending(filepath)
+        queued = [op for kind, entry in pending if kind != 'insert' for op in entry]
+        # Deletes may fall in the tail, so read that many extra rows; one more
+        # so the header is never among the lines parsed
+        wanted = count + sum(1 for op in ops + queued if op['op'] == 'delete') + 1
+        lines = []
+        for line in reverse_lines(filepath):
+            lines.append(line)
+            if len(lines) > wanted:
+                break
+        
+        if header is None or len(lines) <= wanted:
+            # Empty, or the whole file fits in the tail
+            rows = _read_rows(filepath)
+        elif any(line.count('"') % 2 for line in lines):
+            # A quoted value spans lines, so lines are not rows; fall back to a full read
+            rows = _read_rows(filepath)
+        else:
+            lines.reverse()
+            rows = list(csv.DictReader(lines[1:], fieldnames=header))
+            rows = _apply_pending(journal.apply_ops(rows, ops), pending)
+        return rows[-count:]
+
+
+def _snapshot_lines(f, size):
+    """
+    Decode lines from a binary file up to a byte limit
+    """
+    consumed = 0
+    for raw in f:
+        consumed += len(raw)
+        if consumed > size:
+            break
+        yield raw.decode('utf-8')
+
+
+def _read_header(filepath):
+    """
+    Read only the header row of a CSV file (caller holds the file lock)
+    """
+    try:
+        with open(filepath, 'r', newline='', encoding='utf-8') as f:
+            return next(csv.reader(f), None)
+    except OSError:
+        return None
 
 
 def write_csv(filepath, data, fieldnames=None):
@@ -34,98 +255,572 @@ def write_csv(filepath, data, fieldnames=None):
     if not data:
         return False
     
+    if _use_sqlite(filepath):
+        return sqlite_store.write_rows(filepath, data, fieldnames)
+    
+    with write_lock(filepath):
+        # Queued writes are superseded by the full table
+        write_behind.take(filepath)
+        return _write_snapshot(filepath, data, fieldnames)
+
+
+def _write_snapshot(filepath, data, fieldnames=None):
+    """
+    Atomically replace the snapshot and drop its journal (caller holds the write lock)
+    Written to a temp file and moved into place with os.replace
+    """
     if fieldnames is None:
         fieldnames = data[0].keys()
     
     # Ensure directory exists
-    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    directory = os.path.dirname(filepath)
+    os.makedirs(directory, exist_ok=True)
     
-    with _csv_lock:
-        try:
-            with open(filepath, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerows(data)
-            return True
-        except Exception as e:
-            print(f"Error writing CSV {filepath}: {e}")
-            return False
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(filepath) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, filepath)
+        journal.clear(filepath)
+        if config.PK_INDEX_ENABLED:
+            get_index(filepath).invalidate()
+        return True
+    except Exception as e:
+        print(f"Error writing CSV {filepath}: {e}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return False
 
 
 def append_csv(filepath, row, fieldnames=None):
     """
     Append single row to CSV file
+    fieldnames only applies when the file is created; an existing file keeps
+    its header, which is extended if the row carries new fields
     """
-    file_exists = os.path.exists(filepath)
-    
-    if fieldnames is None and file_exists:
-        existing = read_csv(filepath)
-        if existing:
-            fieldnames = existing[0].keys()
+    if _use_sqlite(filepath):
+        return sqlite_store.append_row(filepath, row)
     
-    if fieldnames is None:
-        fieldnames = row.keys()
+    if write_behind.enabled():
+        write_behind.enqueue('table', filepath, ('insert', dict(row)))
+        return True
     
     # Ensure directory exists
     os.makedirs(os.path.dirname(filepath), exist_ok=True)
     
-    with _csv_lock:
-        try:
-            mode = 'a' if file_exists else 'w'
-            with open(filepath, mode, newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                if not file_exists:
-                    writer.writeheader()
-                writer.writerow(row)
-            return True
-        except Exception as e:
-            print(f"Error appending to CSV {filepath}: {e}")
-            return False
+    with write_lock(filepath):
+        return _append_rows(filepath, [row], fieldnames)
+
+
+def _append_rows(filepath, rows, fieldnames=None):
+    """
+    Append rows with a single write (caller holds the write lock)
+    """
+    header = _read_header(filepath) if os.path.exists(filepath) else None
+    
+    if header is None:
+        fieldnames = list(fieldnames or rows[0].keys())
+        for row in rows[1:]:
+            fieldnames.extend(field for field in row if field not in fieldnames)
+    else:
+        fieldnames = list(header)
+        for row in rows:
+            fieldnames.extend(field for field in row if field not in fieldnames)
+        if len(fieldnames) > len(header):
+            # Rewrite the snapshot once with the wider header
+            if not _write_snapshot(filepath, _read_rows(filepath), fieldnames):
+                return False
+    
+    try:
+        buffer = io.StringIO(newline='')
+        writer = csv.DictWriter(buffer, fieldnames=fieldnames)
+        if header is None:
+            writer.writeheader()
+            offset = len(buffer.getvalue().encode('utf-8'))
+        else:
+            offset = os.path.getsize(filepath)
+        # Byte offset and length of each row, for the primary key index
+        locations = []
+        for row in rows:
+            start = buffer.tell()
+            writer.writerow(row)
+            length = len(buffer.getvalue()[start:].encode('utf-8'))
+            locations.append((row.get('id'), offset, length))
+            offset += length
+        
+        mode = 'a' if header is not None else 'w'
+        with open(filepath, mode, newline='', encoding='utf-8') as f:
+            f.write(buffer.getvalue())
+    except Exception as e:
+        print(f"Error appending to CSV {filepath}: {e}")
+        return False
+    
+    if config.PK_INDEX_ENABLED:
+        index = get_index(filepath)
+        for key, offset, length in locations:
+            if key:
+                index.record_append(key, offset, length)
+    return True
+
+
+def _write_pending(filepath):
+    """
+    Write the file's queued write-behind entries (caller holds the write lock)
+    Consecutive inserts become one append and consecutive changes one journal write
+    """
+    entries = write_behind.take(filepath)
+    for kind, group in groupby(entries, key=itemgetter(0)):
+        if kind == 'insert':
+            ok = _append_rows(filepath, [row for _, row in group])
+        else:
+            ok = _journal(filepath, [op for _, ops in group for op in ops])
+        if not ok:
+            print(f"Error flushing queued writes for {filepath}")
+
+
+def _flush_pending(filepath):
+    with write_lock(filepath):
+        _write_pending(filepath)
+
+
+write_behind.register('table', _flush_pending)
+
+
+def find_csv_rows(filepath, key_field, key_value, ignore_case=False):
+    """
+    Get rows where key_field equals key_value
+    Uses the table indexes on the SQLite backend
+    """
+    if _use_sqlite(filepath):
+        return sqlite_store.find_rows(filepath, key_field, key_value, ignore_case)
+    
+    if ignore_case:
+        key_value = str(key_value).lower()
+        return [row for row in read_csv_iter(filepath)
+                if str(row.get(key_field, '')).lower() == key_value]
+    return list(read_csv_iter(filepath, where={key_field: key_value}))
+
+
+def get_csv_row(filepath, key_value):
+    """
+    Get the row with the given id, or None
+    Uses the primary key index when enabled instead of scanning
+    """
+    if _use_sqlite(filepath):
+        return sqlite_store.get_row(filepath, key_value)
+    
+    with read_lock(filepath):
+        return _get_row(filepath, key_value)
+
+
+def get_csv_rows(filepath, key_values):
+    """
+    Get the rows with the given ids, in that order; ids without a row are skipped
+    Reads the journal once for the whole batch
+    """
+    if _use_sqlite(filepath):
+        return sqlite_store.get_rows(filepath, key_values)
+    
+    with read_lock(filepath):
+        return [row for row in _get_rows(filepath, key_values) if row is not None]
+
+
+def _get_row(filepath, key_value):
+    """
+    Look up a row by id (caller holds the file lock)
+    """
+    return _get_rows(filepath, [key_value])[0]
+
+
+def _get_rows(filepath, key_values):
+    """
+    Look up rows by id (caller holds the file lock)
+    Returns one entry per id, None where there is no row
+    """
+    key_values = [str(key_value) for key_value in key_values]
+    ops = journal.read_ops(filepath)
+    queued = write_behind.pending(filepath)
+    queued_ops = [op for kind, entry in queued if kind == 'ops' for op in entry]
+    if not config.PK_INDEX_ENABLED or any(op['key'] != 'id' for op in ops + queued_ops):
+        # Changes keyed on other fields need the full replay
+        wanted = set(key_values)
+        found = {}
+        for row in _read_rows(filepath):
+            if str(row.get('id')) in wanted:
+                found.setdefault(str(row.get('id')), row)
+        return [found.get(key_value) for key_value in key_values]
+    
+    index = get_index(filepath)
+    rows = []
+    for key_value in key_values:
+        row = index.lookup(key_value)
+        row = _apply_id_ops(row, key_value, ops)
+        # Queued write-behind entries, in order
+        for kind, entry in queued:
+            if kind == 'insert':
+                if row is None and str(entry.get('id')) == key_value:
+                    row = dict(entry)
+            else:
+                row = _apply_id_ops(row, key_value, entry)
+        rows.append(row)
+    return rows
+
+
+def _apply_id_ops(row, key_value, ops):
+    """
+    Apply id-keyed updates and deletes for one row
+    """
+    for op in ops:
+        if row is not None and op['value'] == key_value:
+            if op['op'] == 'delete':
+                return None
+            row.update(op['updates'])
+    return row
 
 
 def update_csv_row(filepath, key_field, key_value, updates):
     """
     Update a specific row in CSV file
+    The change is journaled instead of rewriting the file
     """
-    data = read_csv(filepath)
-    if not data:
+    if _use_sqlite(filepath):
+        return sqlite_store.update_row(filepath, key_field, key_value, updates)
+    
+    if write_behind.enabled():
+        # Queued without checking the row exists; a missing row is skipped on replay
+        write_behind.enqueue('table', filepath, ('ops', [journal.update_op(key_field, key_value, updates)]))
+        return True
+    
+    with write_lock(filepath):
+        if not _row_exists(filepath, key_field, key_value):
+            return False
+        
+        return _journal(filepath, [journal.update_op(key_field, key_value, updates)])
+
+
+def update_csv_rows(filepath, key_field, key_values, updates):
+    """
+    Apply the same updates to several rows in one journal write
+    Keys that no longer exist are ignored when the journal is replayed
+    
+    updates may instead be a function of the row returning its updates (or
+    None to leave it). It sees the current row while the table is locked, so
+    a read-modify-write is not lost to a concurrent writer. Rows are looked
+    up by id: key_field must be 'id'.
+    """
+    if not key_values:
         return False
     
-    updated = False
-    for row in data:
-        if str(row.get(key_field)) == str(key_value):
-            row.update(updates)
-            updated = True
-            break
+    if callable(updates):
+        return _update_each(filepath, key_field, key_values, updates)
+    
+    if _use_sqlite(filepath):
+        return sqlite_store.update_rows(filepath, key_field, key_values, updates)
     
-    if updated:
-        return write_csv(filepath, data)
-    return False
+    ops = [journal.update_op(key_field, value, updates) for value in key_values]
+    if write_behind.enabled():
+        write_behind.enqueue('table', filepath, ('ops', ops))
+        return True
+    
+    with write_lock(filepath):
+        return _journal(filepath, ops)
+
+
+def _update_each(filepath, key_field, key_values, change):
+    """
+    Journal change(row) for each current row (see update_csv_rows)
+    """
+    if key_field != 'id':
+        raise ValueError("Per-row updates look rows up by id")
+    
+    def ops_for(rows):
+        ops = []
+        for row in rows:
+            updates = change(row) if row is not None else None
+            if updates:
+                ops.append(journal.update_op(key_field, row['id'], updates))
+        return ops
+    
+    if _use_sqlite(filepath):
+        with sqlite_store.transaction(filepath) as batch:
+            batch.commit([], ops_for(sqlite_store.get_rows(filepath, key_values)))
+        return True
+    
+    with write_lock(filepath):
+        # Queued writes first, so the rows seen are the latest
+        _write_pending(filepath)
+        ops = ops_for(_get_rows(filepath, key_values))
+        return _journal(filepath, ops) if ops else True
 
 
 def delete_csv_row(filepath, key_field, key_value):
     """
     Delete a specific row from CSV file
+    The delete is journaled instead of rewriting the file
     """
-    data = read_csv(filepath)
-    if not data:
+    if _use_sqlite(filepath):
+        return sqlite_store.delete_row(filepath, key_field, key_value)
+    
+    if write_behind.enabled():
+        write_behind.enqueue('table', filepath, ('ops', [journal.delete_op(key_field, key_value)]))
+        return True
+    
+    with write_lock(filepath):
+        if not _row_exists(filepath, key_field, key_value):
+            return False
+        
+        return _journal(filepath, [journal.delete_op(key_field, key_value)])
+
+
+def _row_exists(filepath, key_field, key_value):
+    """
+    Check for a matching row (caller holds the file lock)
+    """
+    if key_field == 'id':
+        return _get_row(filepath, key_value) is not None
+    return any(str(row.get(key_field)) == str(key_value) for row in _read_rows(filepath))
+
+
+class Transaction:
+    """
+    Batch of inserts, updates and deletes on one table
+    Created by transaction(); the table is read once when the block starts
+    and written once, atomically, when it exits without an exception.
+    Inserts are applied before updates and deletes.
+    """
+    def __init__(self, filepath, load_rows, fieldnames, max_id):
+        self.filepath = filepath
+        self._load_rows = load_rows
+        self._max_id = max_id
+        self._rows = None
+        self.fieldnames = list(fieldnames or [])
+        self._inserts = []
+        self._ops = []
+    
+    def insert(self, row):
+        """
+        Queue a new row
+        Rows without an id get one when the transaction commits (one
+        sequence allocation for the whole batch), so read row['id'] after
+        the with block. Returns the row as it will be written.
+        """
+        row = dict({'id': row.get('id', '')}, **{k: v for k, v in row.items() if k != 'id'})
+        self._inserts.append(row)
+        return row
+    
+    def _assign_ids(self):
+        """
+        Give queued rows their ids with a single sequence allocation
+        """
+        sequence = get_sequence(self.filepath)
+        explicit = [int(row['id']) for row in self._inserts if row['id']]
+        if explicit:
+            sequence.advance_to(max(explicit) + 1)
+        
+        pending = [row for row in self._inserts if not row['id']]
+        if pending:
+            first = sequence.allocate(len(pending), self._max_id)
+            for offset, row in enumerate(pending):
+                row['id'] = str(first + offset)
+    
+    def update(self, key_field, key_value, updates):
+        """
+        Queue an update of the first row where key_field equals key_value
+        """
+        self._ops.append(journal.update_op(key_field, key_value, updates))
+    
+    def delete(self, key_field, key_value):
+        """
+        Queue removal of rows where key_field equals key_value
+        """
+        self._ops.append(journal.delete_op(key_field, key_value))
+    
+    @property
+    def rows(self):
+        """
+        Table rows as they were when the transaction started
+        """
+        if self._rows is None:
+            self._rows = self._load_rows()
+        return self._rows
+    
+    @property
+    def changed(self):
+        return bool(self._inserts or self._ops)
+    
+    def _commit(self):
+        """
+        Apply queued changes with a single snapshot write (caller holds the write lock)
+        """
+        self._assign_ids()
+        data = journal.apply_ops(self.rows + self._inserts, self._ops)
+        fieldnames = list(self.fieldnames)
+        for row in data:
+            for field in row:
+                if field is not None and field not in fieldnames:
+                    fieldnames.append(field)
+        return _write_snapshot(self.filepath, data, fieldnames)
+
+
+@contextmanager
+def transaction(filepath):
+    """
+    Batch several changes to one table into a single read and a single write
+    
+    Usage:
+        with csv_handler.transaction(config.NOTIFICATIONS_CSV) as tx:
+            tx.insert({'user_id': '3', 'message': 'Hello'})
+            tx.update('id', 7, {'delivered': 'True'})
+            tx.delete('id', 9)
+    
+    The table's write lock is held for the whole block, so the block must
+    not call other csv_handler functions on the same file; use tx.rows to
+    see the table as it was when the transaction started.
+    """
+    if _use_sqlite(filepath):
+        with sqlite_store.transaction(filepath) as batch:
+            tx = Transaction(filepath, lambda: sqlite_store.read_rows(filepath), [],
+                             lambda: sqlite_store.max_id(filepath))
+            yield tx
+            tx._assign_ids()
+            batch.commit(tx._inserts, tx._ops)
+        return
+    
+    # Ensure directory exists
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    
+    with write_lock(filepath):
+        _write_pending(filepath)
+        rows = _read_rows(filepath)
+        header = _read_header(filepath) if os.path.exists(filepath) else None
+        tx = Transaction(filepath, lambda: rows, header, lambda: _max_id(rows))
+        yield tx
+        if tx.changed and not tx._commit():
+            raise IOError(f"Failed to commit transaction on {filepath}")
+
+
+def _journal(filepath, ops):
+    """
+    Append operations to a file's journal (caller holds the write lock)
+    """
+    try:
+        size = journal.append_ops(filepath, ops)
+    except Exception as e:
+        print(f"Error writing journal for {filepath}: {e}")
         return False
     
-    original_len = len(data)
-    data = [row for row in data if str(row.get(key_field)) != str(key_value)]
+    if size >= config.JOURNAL_COMPACT_THRESHOLD:
+        _schedule_compaction(filepath)
+    return True
+
+
+def compact_csv(filepath):
+    """
+    Fold the journal into a new snapshot
+    """
+    if _use_sqlite(filepath):
+        return True
     
-    if len(data) < original_len:
-        return write_csv(filepath, data)
-    return False
+    with write_lock(filepath):
+        _write_pending(filepath)
+        if not os.path.exists(journal.journal_path(filepath)):
+            return True
+        header = _read_header(filepath) or []
+        data = _read_rows(filepath)
+        # Updates may have added fields the snapshot header does not have
+        extra = []
+        for row in data:
+            for field in row:
+                if field is not None and field not in header and field not in extra:
+                    extra.append(field)
+        if not data and not header:
+            return False
+        if not _write_snapshot(filepath, data, header + extra):
+            return False
+        if config.PK_INDEX_ENABLED:
+            get_index(filepath).rebuild()
+        return True
+
+
+# ========== BACKGROUND COMPACTION ==========
+
+_compact_queue = queue.Queue()
+_compact_pending = set()
+_compactor = None
+_compactor_lock = threading.Lock()
+
+
+def _schedule_compaction(filepath):
+    """
+    Queue a file for compaction by the background compactor
+    """
+    global _compactor
+    with _compactor_lock:
+        if filepath in _compact_pending:
+            return
+        _compact_pending.add(filepath)
+        if _compactor is None or not _compactor.is_alive():
+            _compactor = threading.Thread(target=_compaction_worker, name='csv-compactor', daemon=True)
+            _compactor.start()
+    _compact_queue.put(filepath)
+
+
+def _compaction_worker():
+    """
+    Compact queued files one at a time
+    """
+    while True:
+        filepath = _compact_queue.get()
+        with _compactor_lock:
+            _compact_pending.discard(filepath)
+        try:
+            compact_csv(filepath)
+        except Exception as e:
+            print(f"Error compacting {filepath}: {e}")
+
+
+def table_version(filepath):
+    """
+    Get a token that changes whenever a table changes
+    Lets callers cache data derived from a table and rebuild it only after writes
+    """
+    if _use_sqlite(filepath):
+        return sqlite_store.table_version(filepath)
+    
+    def stat_key(path):
+        try:
+            stat = os.stat(path)
+            return stat.st_ino, stat.st_size, stat.st_mtime_ns
+        except OSError:
+            return None
+    
+    return (stat_key(filepath), stat_key(journal.journal_path(filepath)),
+            len(write_behind.pending(filepath)))
+
+
+def _max_id(rows):
+    return max((int(row.get('id') or 0) for row in rows), default=0)
+
+
+def allocate_ids(filepath, count=1):
+    """
+    Reserve count new ids for a table and return the first
+    Served from the table's persistent sequence instead of scanning rows
+    """
+    if _use_sqlite(filepath):
+        seed = lambda: sqlite_store.max_id(filepath)
+    else:
+        seed = lambda: _max_id(read_csv(filepath))
+    return get_sequence(filepath).allocate(count, seed)
 
 
 def get_next_id(filepath):
     """
     Get next available ID for a CSV file
+    The id is reserved, so two callers never receive the same one
     """
-    data = read_csv(filepath)
-    if not data:
-        return 1
-    
-    max_id = max(int(row.get('id', 0)) for row in data)
-    return max_id + 1
+    return allocate_ids(filepath)
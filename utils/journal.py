@@ -0,0 +1,137 @@
+"""
+Mutation Journal
+Append-only log of row updates and deletes, replayed over a CSV snapshot
+
+Each CSV table is a base snapshot ('<file>') plus a journal ('<file>.journal')
+of JSON lines. The first line records the inode of the snapshot the journal
+belongs to, so a journal left behind by an interrupted compaction is ignored
+once the snapshot has been replaced.
+"""
+import json
+import os
+from bisect import insort
+
+
+def journal_path(filepath):
+    """
+    Get the journal path for a CSV file
+    """
+    return filepath + '.journal'
+
+
+def _snapshot_inode(filepath):
+    try:
+        return os.stat(filepath).st_ino
+    except OSError:
+        return None
+
+
+def read_ops(filepath):
+    """
+    Read journal operations for the current snapshot of a CSV file
+    """
+    path = journal_path(filepath)
+    if not os.path.exists(path):
+        return []
+    
+    ops = []
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            header = f.readline()
+            if not header or json.loads(header).get('inode') != _snapshot_inode(filepath):
+                return []
+            for line in f:
+                # A torn final line from a crash mid-append is skipped
+                try:
+                    ops.append(json.loads(line))
+                except ValueError:
+                    pass
+    except Exception as e:
+        print(f"Error reading journal {path}: {e}")
+        return []
+    return ops
+
+
+def append_ops(filepath, ops):
+    """
+    Append operations to the journal
+    Returns the number of operations now in the journal
+    """
+    path = journal_path(filepath)
+    inode = _snapshot_inode(filepath)
+    
+    # Start a fresh journal if it belongs to an older snapshot
+    existing = 0
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            header = f.readline()
+            try:
+                current = header and json.loads(header).get('inode') == inode
+            except ValueError:
+                current = False
+            if current:
+                existing = sum(1 for _ in f)
+    else:
+        current = False
+    
+    with open(path, 'a' if current else 'w', encoding='utf-8') as f:
+        if not current:
+            f.write(json.dumps({'inode': inode}) + '\n')
+        f.write(''.join(json.dumps(op) + '\n' for op in ops))
+    return existing + len(ops)
+
+
+def clear(filepath):
+    """
+    Remove the journal after it has been folded into a new snapshot
+    """
+    try:
+        os.remove(journal_path(filepath))
+    except FileNotFoundError:
+        pass
+
+
+def update_op(key_field, key_value, updates):
+    return {'op': 'update', 'key': key_field, 'value': str(key_value), 'updates': updates}
+
+
+def delete_op(key_field, key_value):
+    return {'op': 'delete', 'key': key_field, 'value': str(key_value)}
+
+
+def apply_ops(rows, ops):
+    """
+    Replay journal operations over snapshot rows (in place where possible)
+    An update changes the first matching row; a delete removes every match
+    """
+    if not ops:
+        return rows
+    
+    # Lazily built lookup per key field: value -> row positions
+    lookups = {}
+    
+    def positions(key_field, value):
+        if key_field not in lookups:
+            lookup = {}
+            for i, row in enumerate(rows):
+                lookup.setdefault(str(row.get(key_field)), []).append(i)
+            lookups[key_field] = lookup
+        return lookups[key_field].get(value, [])
+    
+    deleted = set()
+    for op in ops:
+        matches = [i for i in positions(op['key'], op['value']) if i not in deleted]
+        if op['op'] == 'update' and matches:
+            row = rows[matches[0]]
+            for field, new_value in op['updates'].items():
+                # Keep lookups on the updated field in sync
+                if field in lookups and row.get(field) != new_value:
+                    lookups[field][str(row.get(field))].remove(matches[0])
+                    insort(lookups[field].setdefault(str(new_value), []), matches[0])
+                row[field] = new_value
+        elif op['op'] == 'delete':
+            deleted.update(matches)
+    
+    if deleted:
+        return [row for i, row in enumerate(rows) if i not in deleted]
+    return rows
@@ -0,0 +1,173 @@
+"""
+File Locks
+Per-file reader/writer locks shared across threads and processes
+"""
+import os
+import time
+from contextlib import contextmanager
+from threading import Condition, Lock
+
+try:
+    import fcntl
+except ImportError:  # Windows - fall back to in-process locking only
+    fcntl = None
+
+
+class RWLock:
+    """
+    Reader/writer lock - many readers or one writer
+    Waiting writers block new readers so writes are not starved
+    """
+    def __init__(self):
+        self._cond = Condition(Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+    
+    def acquire_read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+    
+    def release_read(self):
+        with self._cond:
+            self._readers -= 1
+            if self._readers == 0:
+                self._cond.notify_all()
+    
+    def acquire_write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+    
+    def release_write(self):
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+
+
+class FileLock:
+    """
+    Lock for a single data file
+    Threads share an RWLock; processes share an fcntl lock on '<file>.lock'
+    """
+    def __init__(self, filepath):
+        self.lock_path = filepath + '.lock'
+        self._rw = RWLock()
+        self._fd = None
+        self._fd_lock = Lock()
+        self._shared_holders = 0
+        self._stats_lock = Lock()
+        self.stats = {
+            'reads': 0,
+            'writes': 0,
+            'read_wait': 0.0,
+            'write_wait': 0.0,
+            'max_wait': 0.0
+        }
+    
+    def _open(self):
+        if self._fd is None:
+            os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+            self._fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        return self._fd
+    
+    def _record(self, kind, waited):
+        with self._stats_lock:
+            self.stats[kind + 's'] += 1
+            self.stats[kind + '_wait'] += waited
+            if waited > self.stats['max_wait']:
+                self.stats['max_wait'] = waited
+    
+    def acquire_read(self):
+        start = time.perf_counter()
+        self._rw.acquire_read()
+        if fcntl is not None:
+            # Readers in this process share one LOCK_SH on the lock file
+            with self._fd_lock:
+                if self._shared_holders == 0:
+                    fcntl.flock(self._open(), fcntl.LOCK_SH)
+                self._shared_holders += 1
+        self._record('read', time.perf_counter() - start)
+    
+    def release_read(self):
+        if fcntl is not None:
+            with self._fd_lock:
+                self._shared_holders -= 1
+                if self._shared_holders == 0:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._rw.release_read()
+    
+    def acquire_write(self):
+        start = time.perf_counter()
+        self._rw.acquire_write()
+        if fcntl is not None:
+            fcntl.flock(self._open(), fcntl.LOCK_EX)
+        self._record('write', time.perf_counter() - start)
+    
+    def release_write(self):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._rw.release_write()
+
+
+_locks = {}
+_locks_guard = Lock()
+
+
+def get_file_lock(filepath):
+    """
+    Get the lock for a file path (one per path per process)
+    """
+    filepath = os.path.abspath(filepath)
+    with _locks_guard:
+        if filepath not in _locks:
+            _locks[filepath] = FileLock(filepath)
+        return _locks[filepath]
+
+
+@contextmanager
+def read_lock(filepath):
+    """
+    Hold a shared lock on a file
+    """
+    lock = get_file_lock(filepath)
+    lock.acquire_read()
+    try:
+        yield
+    finally:
+        lock.release_read()
+
+
+@contextmanager
+def write_lock(filepath):
+    """
+    Hold an exclusive lock on a file
+    """
+    lock = get_file_lock(filepath)
+    lock.acquire_write()
+    try:
+        yield
+    finally:
+        lock.release_write()
+
+
+def get_lock_stats():
+    """
+    Get lock acquisition counts and wait times (seconds) per file
+    """
+    with _locks_guard:
+        locks = dict(_locks)
+    
+    stats = {}
+    for filepath, lock in locks.items():
+        with lock._stats_lock:
+            data = dict(lock.stats)
+        data['avg_read_wait'] = round(data['read_wait'] / data['reads'], 6) if data['reads'] else 0
+        data['avg_write_wait'] = round(data['write_wait'] / data['writes'], 6) if data['writes'] else 0
+        stats[os.path.basename(filepath)] = data
+    return stats
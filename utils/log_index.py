@@ -0,0 +1,254 @@
+"""
+Log Index
+Incremental inverted index over an append-only text log
+
+Maps terms to the byte offsets of the lines that contain them: every word
+token of a line, plus 'name:value' terms for the fields a log-specific
+parser extracts (e.g. 'user:12'). The index remembers how far into the log
+it has read and only reads the lines appended since on the next search.
+It is checkpointed to a JSON file next to the log, with that byte offset,
+so a restart resumes from there instead of reading the whole log again. A
+log that was truncated or replaced (its first line changed) is indexed
+from the start.
+
+Searches return whole lines, newest first. A text query is matched as a
+case-insensitive substring, like `query in line.lower()`: the index only
+narrows the candidates, which are then checked against the line itself.
+When the log rotates, each new segment gets its own postings (line numbers
+instead of offsets, see utils/log_rotation.py). Once the active log has
+fewer matches than the limit the segments are searched after it, newest
+first: segments without a candidate line are skipped, the others are read
+only up to their last candidate. Segments written without postings are
+scanned.
+"""
+import hashlib
+import itertools
+import json
+import os
+import re
+import threading
+from utils.log_rotation import segments, read_segment, read_postings, index_segments
+from utils.tail import reverse_lines
+
+
+TOKEN = re.compile(r'\w+')
+CHECKPOINT_EVERY = 1000  # lines indexed between checkpoints
+
+
+def _token_matches(term, token, left_open, right_open):
+    """
+    Check if an index term can hold a query token
+    A token at the edge of the query may be only part of a word
+    """
+    if left_open and right_open:
+        return token in term
+    if left_open:
+        return term.endswith(token)
+    if right_open:
+        return term.startswith(token)
+    return term == token
+
+
+class LogIndex:
+    """
+    Inverted index of one log file
+    fields(line) returns a dict of field name -> value for the line, or None
+    """
+    def __init__(self, log_path, index_path, fields=None):
+        self.log_path = log_path
+        self.index_path = index_path
+        self.fields = fields
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._unsaved = 0
+        self._reset('')
+        index_segments(log_path, self._terms)
+    
+    def _reset(self, fingerprint):
+        self.offset = 0
+        self.fingerprint = fingerprint
+        self.postings = {}
+    
+    def _fingerprint(self):
+        """
+        Hash of the log's first line: changes when the log is replaced
+        """
+        with open(self.log_path, 'rb') as f:
+            first = f.readline(4096)
+        return hashlib.sha1(first).hexdigest() if first.endswith(b'\n') else ''
+    
+    def _load(self):
+        """
+        Read the last checkpoint, if any (caller holds the lock)
+        """
+        self._loaded = True
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            self.offset = saved['offset']
+            self.fingerprint = saved['fingerprint']
+            self.postings = saved['postings']
+        except (OSError, ValueError, KeyError) as e:
+            if os.path.exists(self.index_path):
+                print(f"Error reading log index {self.index_path}: {e}")
+            self._reset('')
+    
+    def _save(self):
+        """
+        Write a checkpoint (caller holds the lock)
+        """
+        try:
+            temp_path = self.index_path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'offset': self.offset, 'fingerprint': self.fingerprint,
+                           'postings': self.postings}, f)
+            os.replace(temp_path, self.index_path)
+            self._unsaved = 0
+        except OSError as e:
+            print(f"Error saving log index {self.index_path}: {e}")
+    
+    def _terms(self, line):
+        terms = set(TOKEN.findall(line.lower()))
+        if self.fields is not None:
+            for name, value in (self.fields(line) or {}).items():
+                if value:
+                    terms.add(f"{name}:{str(value).lower()}")
+        return terms
+    
+    def _refresh(self):
+        """
+        Index the complete lines appended since the last refresh (caller holds the lock)
+        """
+        if not self._loaded:
+            self._load()
+        if not os.path.exists(self.log_path):
+            if self.offset:
+                self._reset('')
+                self._save()
+            return
+        
+        fingerprint = self._fingerprint()
+        if fingerprint != self.fingerprint or os.path.getsize(self.log_path) < self.offset:
+            self._reset(fingerprint)
+        
+        position = self.offset
+        with open(self.log_path, 'rb') as f:
+            f.seek(position)
+            for raw in f:
+                if not raw.endswith(b'\n'):
+                    break  # still being written
+                for term in self._terms(raw.decode('utf-8', errors='replace')):
+                    self.postings.setdefault(term, []).append(position)
+                position += len(raw)
+                self._unsaved += 1
+        self.offset = position
+        if self._unsaved >= CHECKPOINT_EVERY or (self._unsaved and not os.path.exists(self.index_path)):
+            self._save()
+    
+    @staticmethod
+    def _candidates(postings, text, fields):
+        """
+        Positions of the lines that may match, or None if the postings cannot narrow them
+        """
+        sets = []
+        for name, value in fields.items():
+            sets.append(set(postings.get(f"{name}:{str(value).lower()}", ())))
+        
+        tokens = list(TOKEN.finditer(text))
+        for number, match in enumerate(tokens):
+            token = match.group()
+            left_open = number == 0 and match.start() == 0
+            right_open = number == len(tokens) - 1 and match.end() == len(text)
+            if not (left_open or right_open):
+                sets.append(set(postings.get(token, ())))
+                continue
+            offsets = set()
+            for term, positions in postings.items():
+                if ':' not in term and _token_matches(term, token, left_open, right_open):
+                    offsets.update(positions)
+            sets.append(offsets)
+        
+        if not sets:
+            return None
+        return set.intersection(*sets)
+    
+    def _matches(self, line, text, fields):
+        """
+        Check a line that was not looked up in the index (caller lowercased text)
+        """
+        if text not in line.lower():
+            return False
+        values = (self.fields(line) if self.fields is not None else None) or {}
+        return all(str(values.get(name) or '').lower() == str(value).lower() for name, value in fields.items())
+    
+    def _active_matches(self, text, candidates, end):
+        """
+        Yield the matching lines of the active log, newest first
+        """
+        if not os.path.exists(self.log_path):
+            return
+        if candidates is None:
+            # Nothing to look up (e.g. punctuation only): scan from the end
+            for line in reverse_lines(self.log_path):
+                if text in line.lower():
+                    yield line
+            return
+        
+        with open(self.log_path, 'rb') as f:
+            for offset in sorted(candidates, reverse=True):
+                if offset >= end:
+                    continue
+                f.seek(offset)
+                line = f.readline().rstrip(b'\r\n').decode('utf-8', errors='replace')
+                if text in line.lower():
+                    yield line
+    
+    def _segment_matches(self, text, fields):
+        """
+        Yield the matching lines of the rotated segments, newest first
+        """
+        for manifest in reversed(segments(self.log_path)):
+            postings = read_postings(manifest)
+            candidates = self._candidates(postings, text, fields) if postings is not None else None
+            if candidates is not None and not candidates:
+                continue
+            last = max(candidates) if candidates is not None else None
+            lines = []
+            try:
+                for number, line in enumerate(read_segment(manifest)):
+                    if candidates is None:
+                        line = line.rstrip('\r\n')
+                        if self._matches(line, text, fields):
+                            lines.append(line)
+                    elif number in candidates:
+                        if text in line.lower():
+                            lines.append(line.rstrip('\r\n'))
+                        if number == last:
+                            break
+            except (OSError, EOFError) as e:
+                print(f"Error reading log segment {manifest['segment']}: {e}")
+            yield from reversed(lines)
+    
+    def search(self, text='', limit=None, **fields):
+        """
+        Get the lines containing text (case-insensitive) whose fields have
+        the given values, newest first, without line endings
+        The active log comes first, then its rotated segments
+        """
+        text = text.lower()
+        fields = {name: value for name, value in fields.items() if value is not None and value != ''}
+        with self._lock:
+            self._refresh()
+            candidates = self._candidates(self.postings, text, fields)
+            end = self.offset
+        
+        matches = itertools.chain(self._active_matches(text, candidates, end), self._segment_matches(text, fields))
+        return list(itertools.islice(matches, limit))
+    
+    def checkpoint(self):
+        """
+        Index any new lines and write a checkpoint now
+        """
+        with self._lock:
+            self._refresh()
+            self._save()
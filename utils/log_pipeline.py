@@ -0,0 +1,208 @@
+"""
+Log Pipeline
+Asynchronous writer for the text logs (activity, alerts, audit, OTP)
+
+log_event() puts an event on a bounded in-memory queue and returns at
+once; one writer thread takes whatever has queued up, groups it by file
+and appends each group in a single write, keeping the files open between
+batches. Full or day-old files are first rotated into compressed segments
+(see utils/log_rotation.py). Every event is written twice: as the legacy
+text line to the log itself and as a JSON object to the JSON Lines file
+beside it ('activity_log.txt' -> 'activity_log.jsonl'), unless
+config.LOG_JSONL is off. When the queue is full the event is dropped and counted rather than
+blocking the request. Readers call flush_logs() first to see everything
+logged so far; the queue is also flushed at exit.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+import config
+from utils import log_rotation
+from utils.time_utils import get_timestamp
+
+
+_events = deque()
+_cond = threading.Condition()
+_writer = None
+_in_flight = 0
+
+
+def jsonl_path(path):
+    """
+    Get the JSON Lines file written beside a text log
+    """
+    return os.path.splitext(path)[0] + '.jsonl'
+
+
+# ========== METRICS ==========
+
+class LogMetrics:
+    """
+    Running totals of the log pipeline (updated under _cond)
+    """
+    def __init__(self):
+        self.logged = 0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.errors = 0
+        self.max_queued = 0
+
+
+metrics = LogMetrics()
+
+
+# ========== QUEUE ==========
+
+def log_event(path, line, event, **fields):
+    """
+    Queue a log event
+    path: the text log; line: its legacy text line (with newline); event:
+    the event type, e.g. 'activity' or 'alert'; fields: the event's data
+    Returns False if the queue was full and the event was dropped
+    """
+    record = {'ts': get_timestamp(), 'event': event}
+    record.update(fields)
+    with _cond:
+        if len(_events) >= config.LOG_QUEUE_SIZE:
+            metrics.dropped += 1
+            return False
+        _events.append((path, line, record))
+        metrics.logged += 1
+        metrics.max_queued = max(metrics.max_queued, len(_events))
+        _start_writer()
+        _cond.notify_all()
+    return True
+
+
+def flush_logs(timeout=5.0):
+    """
+    Wait until every queued event has been written
+    Returns False if the writer did not catch up within timeout seconds
+    """
+    with _cond:
+        if _events:
+            _start_writer()
+        return _cond.wait_for(lambda: not _events and not _in_flight, timeout)
+
+
+def get_log_metrics():
+    """
+    Get log pipeline statistics for the admin dashboard
+    """
+    with _cond:
+        return {
+            'queued': len(_events) + _in_flight,
+            'capacity': config.LOG_QUEUE_SIZE,
+            'max_queued': metrics.max_queued,
+            'logged': metrics.logged,
+            'written': metrics.written,
+            'dropped': metrics.dropped,
+            'batches': metrics.batches,
+            'errors': metrics.errors
+        }
+
+
+# ========== WRITER ==========
+
+class _OpenFiles:
+    """
+    Append handles kept open between batches (used by the writer thread only)
+    A file that was moved or deleted since it was opened is opened again.
+    """
+    def __init__(self):
+        self._files = {}
+    
+    def get(self, path):
+        f = self._files.get(path)
+        if f is not None:
+            try:
+                if os.stat(path).st_ino == os.fstat(f.fileno()).st_ino:
+                    return f
+            except OSError:
+                pass
+            self.close(path)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        f = self._files[path] = open(path, 'a', encoding='utf-8')
+        return f
+    
+    def close(self, path):
+        f = self._files.pop(path, None)
+        if f is not None:
+            try:
+                f.close()
+            except OSError:
+                pass
+
+
+_files = _OpenFiles()
+
+
+def _write_batch(batch):
+    """
+    Append a batch of events, one write per file
+    Returns the number of events that could not be written
+    """
+    groups = {}
+    for path, line, record in batch:
+        group = groups.setdefault(path, ([], []))
+        group[0].append(line)
+        group[1].append(json.dumps(record, default=str) + '\n')
+    
+    failed = 0
+    for path, (lines, records) in groups.items():
+        targets = [(path, lines)]
+        if config.LOG_JSONL:
+            targets.append((jsonl_path(path), records))
+        for target, entries in targets:
+            try:
+                if log_rotation.due(target):
+                    _files.close(target)
+                    log_rotation.rotate(target)
+                f = _files.get(target)
+                f.write(''.join(entries))
+                f.flush()
+            except Exception as e:
+                print(f"Error writing log {target}: {e}")
+                _files.close(target)
+                if target == path:
+                    failed += len(entries)
+    return failed
+
+
+def _start_writer():
+    """
+    Start the writer thread (caller holds _cond)
+    """
+    global _writer
+    if _writer is None or not _writer.is_alive():
+        _writer = threading.Thread(target=_writer_loop, name='log-writer', daemon=True)
+        _writer.start()
+
+
+def _writer_loop():
+    global _in_flight
+    while True:
+        with _cond:
+            _cond.wait_for(lambda: _events)
+            batch = [_events.popleft() for _ in range(min(len(_events), config.LOG_BATCH_SIZE))]
+            _in_flight = len(batch)
+        try:
+            failed = _write_batch(batch)
+        except Exception as e:
+            print(f"Error writing logs: {e}")
+            failed = len(batch)
+        with _cond:
+            _in_flight = 0
+            metrics.batches += 1
+            metrics.written += len(batch) - failed
+            metrics.errors += failed
+            _cond.notify_all()
+        if failed:
+            time.sleep(0.1)  # e.g. disk full: do not spin
+
+
+atexit.register(flush_logs)
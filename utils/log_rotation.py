@@ -0,0 +1,235 @@
+"""
+Log Rotation
+Moves full or day-old logs into compressed segments with manifests
+
+The log writer (utils/log_pipeline.py) checks each file before appending
+to it: once the file is config.LOG_ROTATE_BYTES long, or was last written
+on an earlier day, it is compressed into config.LOG_SEGMENTS_DIR as
+'<name>-<YYYYmmddTHHMMSS>.<ext>.gz' and a new file is started. Beside each
+segment a small JSON manifest records the time range of its lines, the
+line count and the number of lines per hour, so reports can add up whole
+segments without opening them.
+
+A log with a search index (utils/log_index.py) also gets a postings file
+per segment, '<name>-<stamp>.<ext>.idx': each term of the index mapped to
+the numbers of the segment lines that contain it. Searches read it to skip
+segments without a match and to pick the matching lines out of the rest.
+"""
+import gzip
+import json
+import os
+import re
+from collections import Counter
+from datetime import datetime
+from functools import lru_cache
+import config
+
+
+# '[2024-12-30T17:00:00...]' or '[2024-12-30 17:00:00]' (text), '{"ts": "2024-12-30T17:00:00..."' (JSON Lines)
+LINE_TIME = re.compile(r'(\d{4}-\d{2}-\d{2})[T ](\d{2}:\d{2}:\d{2})')
+# '-<YYYYmmddTHHMMSS>' or '-<YYYYmmddTHHMMSS>-<n>' in a segment name
+SEGMENT_STAMP = re.compile(r'-(\d{8}T\d{6})(?:-(\d+))?\.')
+
+_manifests = {}  # manifest path -> manifest; segments never change once written
+_indexers = {}  # log file name -> terms(line) of its search index
+
+
+def line_time(line):
+    """
+    Get the timestamp at the start of a log line as 'YYYY-MM-DDTHH:MM:SS', or None
+    """
+    match = LINE_TIME.search(line, 0, 64)
+    return f"{match.group(1)}T{match.group(2)}" if match else None
+
+
+def due(path, now=None):
+    """
+    Check if a log should be rotated before more is appended to it
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return False
+    if stat.st_size == 0:
+        return False
+    if stat.st_size >= config.LOG_ROTATE_BYTES:
+        return True
+    now = now or datetime.now()
+    return config.LOG_ROTATE_DAILY and datetime.fromtimestamp(stat.st_mtime).date() != now.date()
+
+
+def _segment_path(path, now):
+    name, ext = os.path.splitext(os.path.basename(path))
+    stamp = now.strftime('%Y%m%dT%H%M%S')
+    segment = os.path.join(config.LOG_SEGMENTS_DIR, f"{name}-{stamp}{ext}.gz")
+    number = 1
+    while os.path.exists(segment):
+        number += 1
+        segment = os.path.join(config.LOG_SEGMENTS_DIR, f"{name}-{stamp}-{number}{ext}.gz")
+    return segment
+
+
+def manifest_path(segment):
+    return segment[:-len('.gz')] + '.json'
+
+
+def postings_path(segment):
+    return segment[:-len('.gz')] + '.idx'
+
+
+def index_segments(path, terms):
+    """
+    Write postings beside the log's future segments
+    terms(line) returns the set of index terms of one line
+    """
+    _indexers[os.path.basename(path)] = terms
+
+
+def _write_postings(segment, postings):
+    """
+    Write a segment's postings; returns the file name, or None on failure
+    """
+    path = postings_path(segment)
+    try:
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(postings, f)
+        os.replace(path + '.tmp', path)
+        return os.path.basename(path)
+    except OSError as e:
+        print(f"Error writing log postings {path}: {e}")
+        return None
+
+
+def rotate(path, now=None):
+    """
+    Compress a log into a new segment with its manifest and remove it
+    The caller must not be writing to the log (the log writer calls this
+    itself, with the file closed)
+    Returns the manifest, or None if there was nothing to rotate
+    """
+    if not os.path.exists(path):
+        return None
+    now = now or datetime.now()
+    os.makedirs(config.LOG_SEGMENTS_DIR, exist_ok=True)
+    segment = _segment_path(path, now)
+    
+    terms = _indexers.get(os.path.basename(path))
+    postings = {}
+    hours = Counter()
+    first = last = None
+    lines = 0
+    temp_path = segment + '.tmp'
+    with open(path, 'rb') as src, gzip.open(temp_path, 'wb') as dst:
+        for raw in src:
+            dst.write(raw)
+            if terms is not None:
+                for term in terms(raw.decode('utf-8', errors='replace')):
+                    postings.setdefault(term, []).append(lines)
+            lines += 1
+            timestamp = line_time(raw[:64].decode('utf-8', errors='replace'))
+            if timestamp:
+                hours[timestamp[:13]] += 1
+                first = min(first, timestamp) if first else timestamp
+                last = max(last, timestamp) if last else timestamp
+    
+    manifest = {
+        'log': os.path.basename(path),
+        'segment': os.path.basename(segment),
+        'first': first,
+        'last': last,
+        'lines': lines,
+        'bytes': os.path.getsize(path),
+        'hours': dict(sorted(hours.items()))
+    }
+    # Segment and postings first, then manifest: a segment without a manifest is ignored
+    os.replace(temp_path, segment)
+    if terms is not None:
+        manifest['postings'] = _write_postings(segment, postings)
+    with open(manifest_path(segment) + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(manifest_path(segment) + '.tmp', manifest_path(segment))
+    os.remove(path)
+    _manifests[manifest_path(segment)] = manifest
+    return manifest
+
+
+def segments(path):
+    """
+    Get the manifests of a log's segments, oldest first
+    """
+    name, ext = os.path.splitext(os.path.basename(path))
+    try:
+        filenames = os.listdir(config.LOG_SEGMENTS_DIR)
+    except OSError:
+        return []
+    
+    manifests = []
+    for filename in sorted(filenames):
+        if not (filename.startswith(name + '-') and filename.endswith(f"{ext}.json")):
+            continue
+        full_path = os.path.join(config.LOG_SEGMENTS_DIR, filename)
+        manifest = _manifests.get(full_path)
+        if manifest is None:
+            try:
+                with open(full_path, 'r', encoding='utf-8') as f:
+                    manifest = _manifests[full_path] = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Error reading log manifest {full_path}: {e}")
+                continue
+        if manifest.get('log') == os.path.basename(path):
+            manifests.append(manifest)
+    return sorted(manifests, key=lambda m: (m.get('first') or '', _rotation_order(m['segment'])))
+
+
+def _rotation_order(segment):
+    """
+    Sort key of a segment name: rotation time, then its number within that second
+    """
+    match = SEGMENT_STAMP.search(segment)
+    if match is None:
+        return (segment, 0)
+    return (match.group(1), int(match.group(2) or 1))
+
+
+def read_segment(manifest):
+    """
+    Yield the lines of a segment (decompressed, with line endings)
+    """
+    with gzip.open(os.path.join(config.LOG_SEGMENTS_DIR, manifest['segment']), 'rt', encoding='utf-8') as f:
+        yield from f
+
+
+def read_postings(manifest):
+    """
+    Get a segment's postings (term -> line numbers), or None if it has none
+    """
+    if not manifest.get('postings'):
+        return None
+    path = os.path.join(config.LOG_SEGMENTS_DIR, manifest['postings'])
+    try:
+        return _load_postings(path)
+    except (OSError, ValueError) as e:
+        print(f"Error reading log postings {path}: {e}")
+        return None
+
+
+@lru_cache(maxsize=16)
+def _load_postings(path):
+    # Cached by path: postings never change once written (failures are not cached)
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def reverse_segment_lines(path):
+    """
+    Yield the lines of a log's segments, newest first, without line endings
+    Each segment is decompressed whole (at most config.LOG_ROTATE_BYTES)
+    """
+    for manifest in reversed(segments(path)):
+        try:
+            lines = list(read_segment(manifest))
+        except (OSError, EOFError) as e:
+            print(f"Error reading log segment {manifest['segment']}: {e}")
+            continue
+        for line in reversed(lines):
+            yield line.rstrip('\r\n')
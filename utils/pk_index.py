@@ -0,0 +1,231 @@
+"""
+Primary Key Index
+Sidecar index of id -> (byte offset, length) for point lookups in CSV files
+
+The index lives in '<file>.idx': a JSON header line with the inode of the
+snapshot it describes, then one 'id,offset,length' line per row. Appends add
+a line; a rewritten snapshot (new inode) invalidates it and it is rebuilt
+with a single scan. Rows appended by other processes are picked up by
+scanning only the bytes past the last indexed row.
+
+All functions expect the caller to hold the table's file lock.
+"""
+import csv
+import json
+import os
+import tempfile
+from threading import Lock
+
+
+def index_path(filepath):
+    """
+    Get the sidecar index path for a CSV file
+    """
+    return filepath + '.idx'
+
+
+class PrimaryKeyIndex:
+    """
+    In-memory copy of one table's sidecar index
+    """
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.header = None
+        self.offsets = {}
+        self.inode = None
+        self.indexed_size = 0
+        self._lock = Lock()
+    
+    def _reset(self):
+        self.header = None
+        self.offsets = {}
+        self.inode = None
+        self.indexed_size = 0
+    
+    def _load_sidecar(self, inode):
+        """
+        Load the sidecar if it belongs to the current snapshot
+        """
+        try:
+            with open(index_path(self.filepath), 'r', encoding='utf-8') as f:
+                if json.loads(f.readline()).get('inode') != inode:
+                    return False
+                with open(self.filepath, 'r', encoding='utf-8', newline='') as data:
+                    self.header = next(csv.reader([data.readline()]), [])
+                for line in f:
+                    parts = line.rstrip('\n').rsplit(',', 2)
+                    if len(parts) != 3:
+                        continue
+                    key, offset, length = parts[0], int(parts[1]), int(parts[2])
+                    self.offsets.setdefault(key, (offset, length))
+                    self.indexed_size = max(self.indexed_size, offset + length)
+        except (OSError, ValueError):
+            self._reset()
+            return False
+        return True
+    
+    def _write_sidecar(self):
+        """
+        Save the index (callers may hold only the read lock, so each writer
+        uses its own temp file; a failure only skips the cache)
+        """
+        path = index_path(self.filepath)
+        temp_path = None
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                                             prefix=os.path.basename(path) + '.', suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({'inode': self.inode}) + '\n')
+                f.write(''.join(f"{key},{offset},{length}\n" for key, (offset, length) in self.offsets.items()))
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Error saving index for {self.filepath}: {e}")
+            if temp_path is not None:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+    
+    def _scan(self, start):
+        """
+        Index rows from a byte offset to the end of the file
+        Returns the new entries
+        """
+        entries = {}
+        with open(self.filepath, 'rb') as f:
+            if self.header is None:
+                header_line = f.readline()
+                self.header = next(csv.reader([header_line.decode('utf-8')]), [])
+                start = max(start, len(header_line))
+            if 'id' not in self.header:
+                return entries
+            id_index = self.header.index('id')
+            
+            f.seek(start)
+            offset = start
+            buffer = b''
+            for line in f:
+                buffer += line
+                # A quoted field may span lines; a row is complete when quotes balance
+                if buffer.count(b'"') % 2:
+                    continue
+                if not line.endswith(b'\n'):
+                    # Row still being written by another process
+                    break
+                values = next(csv.reader([buffer.decode('utf-8')]), [])
+                if len(values) > id_index:
+                    entries.setdefault(values[id_index], (offset, len(buffer)))
+                offset += len(buffer)
+                buffer = b''
+        
+        for key, location in entries.items():
+            self.offsets.setdefault(key, location)
+        self.indexed_size = offset
+        return entries
+    
+    def refresh(self):
+        """
+        Bring the index up to date with the file
+        """
+        try:
+            stat = os.stat(self.filepath)
+        except OSError:
+            self._reset()
+            return False
+        
+        if stat.st_ino != self.inode or stat.st_size < self.indexed_size:
+            self._reset()
+            self.inode = stat.st_ino
+            if not self._load_sidecar(stat.st_ino):
+                self._scan(0)
+                self._write_sidecar()
+                return True
+        
+        if stat.st_size > self.indexed_size:
+            # Rows appended since the index was saved (e.g. by another process)
+            entries = self._scan(self.indexed_size)
+            self._append_sidecar(entries)
+        return True
+    
+    def _append_sidecar(self, entries):
+        if not entries:
+            return
+        try:
+            with open(index_path(self.filepath), 'a', encoding='utf-8') as f:
+                f.write(''.join(f"{key},{offset},{length}\n" for key, (offset, length) in entries.items()))
+        except OSError as e:
+            print(f"Error updating index for {self.filepath}: {e}")
+    
+    def lookup(self, key):
+        """
+        Read the row stored under key with one seek
+        Returns a dict, or None if the key is not in the snapshot
+        """
+        with self._lock:
+            if not self.refresh():
+                return None
+            location = self.offsets.get(str(key))
+            header = self.header
+        if location is None:
+            return None
+        
+        offset, length = location
+        with open(self.filepath, 'rb') as f:
+            f.seek(offset)
+            data = f.read(length)
+        values = next(csv.reader([data.decode('utf-8')]), [])
+        return dict(zip(header, values))
+    
+    def record_append(self, key, offset, length):
+        """
+        Add a row that was just appended at offset
+        """
+        with self._lock:
+            try:
+                stat = os.stat(self.filepath)
+            except OSError:
+                return
+            if stat.st_ino != self.inode or offset != self.indexed_size:
+                # Not loaded or missed other changes - catch up on next lookup
+                return
+            self.offsets.setdefault(str(key), (offset, length))
+            self.indexed_size = offset + length
+            self._append_sidecar({str(key): (offset, length)})
+    
+    def invalidate(self):
+        """
+        Forget the index after the snapshot is rewritten
+        """
+        with self._lock:
+            self._reset()
+            try:
+                os.remove(index_path(self.filepath))
+            except FileNotFoundError:
+                pass
+    
+    def rebuild(self):
+        """
+        Rebuild the index and its sidecar from the current snapshot
+        """
+        with self._lock:
+            self._reset()
+            try:
+                os.remove(index_path(self.filepath))
+            except FileNotFoundError:
+                pass
+            self.refresh()
+
+
+_indexes = {}
+_indexes_lock = Lock()
+
+
+def get_index(filepath):
+    """
+    Get the primary key index for a table (one per path per process)
+    """
+    filepath = os.path.abspath(filepath)
+    with _indexes_lock:
+        if filepath not in _indexes:
+            _indexes[filepath] = PrimaryKeyIndex(filepath)
+        return _indexes[filepath]
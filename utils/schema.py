@@ -0,0 +1,263 @@
+"""
+Table Schemas
+Typed records for the CSV tables, parsed once when rows are read
+
+Each table declares its columns and their types. Rows are turned into
+records by a converter compiled once per schema, file header and column
+projection; records use __slots__ (no per-row __dict__) and hold real ints
+and bools, so callers stop re-parsing strings like 'True' or '120' on every
+access. Code that has to keep a dict row (templates, transactions) parses
+single columns with Schema.value().
+
+The users table has no schema: UserIndex keeps its rows as dicts, which it
+hands out and updates in place.
+"""
+from functools import partial
+import config
+from utils.csv_handler import read_csv_iter, get_csv_row, get_csv_rows
+
+
+def _parse_str(value, default):
+    return default if value is None else value
+
+
+def _parse_int(value, default):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _parse_bool(value, default):
+    if not value:
+        return default
+    return value.lower() == 'true'
+
+
+def _format(value):
+    if value is None:
+        return ''
+    return str(value)
+
+
+PARSERS = {
+    str: _parse_str,
+    int: _parse_int,
+    bool: _parse_bool
+}
+
+
+class Field:
+    """
+    One column: name, Python type (str, int or bool) and default
+    The default is used when the column is missing or does not parse
+    """
+    __slots__ = ('name', 'type', 'default')
+    
+    def __init__(self, name, type=str, default=None):
+        self.name = name
+        self.type = type
+        self.default = default if default is not None or type is not str else ''
+
+
+class Record:
+    """
+    Base class for typed rows
+    Supports row['field'] and row.get('field') like the dicts it replaces
+    """
+    __slots__ = ()
+    _schema = None
+    
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+    
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+    
+    def to_dict(self):
+        """
+        Convert back to a CSV row (all values as strings)
+        """
+        return {name: _format(getattr(self, name)) for name in self.__slots__}
+    
+    def __repr__(self):
+        values = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({values})"
+
+
+class Schema:
+    """
+    Declarative schema for one table
+    """
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = tuple(fields)
+        self.names = tuple(field.name for field in self.fields)
+        self.record_class = type(name, (Record,), {'__slots__': self.names, '_schema': self})
+        self._by_name = {field.name: field for field in self.fields}
+        self._converters = {}
+        self._row_converters = {}
+    
+    def converter(self, columns=None):
+        """
+        Get the row -> record converter for a column projection
+        Columns outside the projection are set to their defaults
+        """
+        key = tuple(columns) if columns else None
+        convert = self._converters.get(key)
+        if convert is None:
+            convert = self._compile(columns)
+            self._converters[key] = convert
+        return convert
+    
+    def _compile(self, columns):
+        wanted = set(columns) if columns else None
+        steps = tuple(
+            (field.name, PARSERS[field.type], field.default)
+            for field in self.fields
+            if wanted is None or field.name in wanted
+        )
+        defaults = tuple(
+            (field.name, field.default)
+            for field in self.fields
+            if wanted is not None and field.name not in wanted
+        )
+        record_class = self.record_class
+        new = object.__new__
+        
+        def convert(row):
+            record = new(record_class)
+            for name, parse, default in steps:
+                setattr(record, name, parse(row.get(name), default))
+            for name, default in defaults:
+                setattr(record, name, default)
+            return record
+        
+        return convert
+    
+    def row_converter(self, header, columns=None):
+        """
+        Get the values -> record converter for rows read under a file header
+        Values are taken by position, so no dict is built for the row
+        """
+        key = (tuple(header), tuple(columns) if columns else None)
+        convert = self._row_converters.get(key)
+        if convert is None:
+            convert = self._compile_values(key[0], columns)
+            self._row_converters[key] = convert
+        return convert
+    
+    def _compile_values(self, header, columns):
+        wanted = set(columns) if columns else None
+        positions = {name: index for index, name in reversed(list(enumerate(header)))}
+        steps = tuple(
+            (field.name, positions[field.name], PARSERS[field.type], field.default)
+            for field in self.fields
+            if (wanted is None or field.name in wanted) and field.name in positions
+        )
+        defaults = tuple(
+            (field.name, field.default)
+            for field in self.fields
+            if (wanted is not None and field.name not in wanted) or field.name not in positions
+        )
+        record_class = self.record_class
+        new = object.__new__
+        
+        def convert(values):
+            record = new(record_class)
+            count = len(values)
+            for name, index, parse, default in steps:
+                setattr(record, name, parse(values[index] if index < count else None, default))
+            for name, default in defaults:
+                setattr(record, name, default)
+            return record
+        
+        return convert
+    
+    def parse(self, row):
+        """
+        Convert one CSV row dict to a record
+        """
+        return self.converter()(row)
+    
+    def value(self, row, name):
+        """
+        Parse one column of a CSV row dict
+        """
+        field = self._by_name[name]
+        return PARSERS[field.type](row.get(name), field.default)
+
+
+LOCATION_SCHEMA = Schema('LocationRecord', [
+    Field('id', int),
+    Field('name'),
+    Field('building'),
+    Field('floor', int, 1),
+    Field('accessible', bool, False)
+])
+
+ROUTE_SCHEMA = Schema('RouteRecord', [
+    Field('id', int),
+    Field('start_location'),
+    Field('end_location'),
+    Field('distance_m', int),
+    Field('accessible', bool, False)
+])
+
+NOTIFICATION_SCHEMA = Schema('NotificationRecord', [
+    Field('id', int),
+    Field('user_id', int),
+    Field('message'),
+    Field('delivered', bool, False),
+    Field('status'),
+    Field('created_at'),
+    Field('message_id', int, 0)
+])
+
+BROADCAST_SCHEMA = Schema('BroadcastRecord', [
+    Field('id', int),
+    Field('message'),
+    Field('message_id', int, 0),
+    Field('role'),
+    Field('max_user_id', int, 0),
+    Field('recipients', int, 0),
+    Field('delivered_bitmap'),
+    Field('created_at')
+])
+
+SCHEMAS = {
+    config.LOCATIONS_CSV: LOCATION_SCHEMA,
+    config.ROUTES_CSV: ROUTE_SCHEMA,
+    config.NOTIFICATIONS_CSV: NOTIFICATION_SCHEMA,
+    config.BROADCASTS_CSV: BROADCAST_SCHEMA
+}
+
+
+def read_records(filepath, columns=None, where=None):
+    """
+    Stream typed records from a table
+    columns and where are passed through to read_csv_iter
+    """
+    build = partial(SCHEMAS[filepath].row_converter, columns=columns)
+    return read_csv_iter(filepath, columns=columns, where=where, build=build)
+
+
+def get_record(filepath, key_value):
+    """
+    Get the typed record with the given id, or None
+    """
+    row = get_csv_row(filepath, key_value)
+    if row is None:
+        return None
+    return SCHEMAS[filepath].parse(row)
+
+
+def get_records(filepath, key_values):
+    """
+    Get the typed records with the given ids, in that order; missing ids are skipped
+    """
+    parse = SCHEMAS[filepath].parse
+    return [parse(row) for row in get_csv_rows(filepath, key_values)]
@@ -0,0 +1,111 @@
+"""
+ID Sequences
+Per-table id allocation without scanning the table
+
+Each table has a high-water mark in '<file>.seq' - every id below it has
+been handed out. A process reserves a block of ids by moving the mark
+forward under a file lock, then serves ids from memory until the block
+runs out. Unused ids in a block are skipped after a restart, so ids are
+unique and increasing per process but may have gaps.
+"""
+import os
+import tempfile
+from threading import Lock
+import config
+from utils.locks import write_lock
+
+
+class Sequence:
+    """
+    Id allocator for one table
+    """
+    def __init__(self, filepath):
+        self.path = filepath + '.seq'
+        self._lock = Lock()
+        self._next = None
+        self._limit = None
+    
+    def _read_mark(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return None
+    
+    def _write_mark(self, mark):
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(self.path) + '.', suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(str(mark))
+        os.replace(temp_path, self.path)
+    
+    def _initialize(self, max_id):
+        """
+        Save a first high-water mark just past the table's largest id
+        """
+        with write_lock(self.path):
+            if self._read_mark() is None:
+                self._write_mark(max_id + 1)
+    
+    def _reserve(self, count):
+        """
+        Move the shared high-water mark forward by at least count ids
+        Returns False if there is no mark to move (caller holds self._lock)
+        """
+        block = max(count, config.SEQUENCE_BLOCK_SIZE)
+        with write_lock(self.path):
+            mark = self._read_mark()
+            if mark is None:
+                return False
+            self._next = mark
+            self._limit = mark + block
+            self._write_mark(self._limit)
+            return True
+    
+    def allocate(self, count, seed):
+        """
+        Hand out count consecutive ids and return the first
+        seed() returns the table's current max id; it is only called while
+        there is no mark, with no lock held, so it may read the table
+        """
+        while True:
+            with self._lock:
+                if (self._next is not None and self._next + count <= self._limit) or self._reserve(count):
+                    first = self._next
+                    self._next += count
+                    return first
+            # First use, or the mark was lost (e.g. the data directory was
+            # restored without it): start again past the table's largest id
+            # and any id this process has handed out
+            self._initialize(max(seed(), (self._limit or 1) - 1))
+    
+    def advance_to(self, value):
+        """
+        Make sure ids below value are never handed out (after explicit ids are written)
+        """
+        with self._lock:
+            if self._next is not None and self._next >= value:
+                return
+            with write_lock(self.path):
+                mark = self._read_mark() or 0
+                if mark < value:
+                    self._write_mark(value)
+                # Drop the in-memory block; the next allocation reserves afresh
+                self._next = None
+                self._limit = None
+
+
+_sequences = {}
+_sequences_lock = Lock()
+
+
+def get_sequence(filepath):
+    """
+    Get the sequence for a table (one per path per process)
+    """
+    filepath = os.path.abspath(filepath)
+    with _sequences_lock:
+        if filepath not in _sequences:
+            _sequences[filepath] = Sequence(filepath)
+        return _sequences[filepath]
@@ -0,0 +1,434 @@
+"""
+SQLite Storage Backend
+Indexed alternative to the CSV files, used by csv_handler when
+config.STORAGE_BACKEND is 'sqlite'
+
+Usage:
+    python -m utils.sqlite_store import    # load the CSV files into the database
+    python -m utils.sqlite_store export    # write the database back to CSV
+"""
+import csv
+import os
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+
+import config
+
+# Table definitions keyed by the CSV path they replace
+# Columns are stored as TEXT (except the integer id) to match CSV semantics
+TABLES = {
+    config.USERS_CSV: {
+        'table': 'users',
+        'columns': ['id', 'username', 'email', 'role'],
+        'indexes': {
+            'idx_users_username': 'username COLLATE NOCASE',
+            'idx_users_email': 'email COLLATE NOCASE',
+            'idx_users_role': 'role COLLATE NOCASE'
+        }
+    },
+    config.LOCATIONS_CSV: {
+        'table': 'locations',
+        'columns': ['id', 'name', 'building', 'floor', 'accessible'],
+        'indexes': {}
+    },
+    config.ROUTES_CSV: {
+        'table': 'routes',
+        'columns': ['id', 'start_location', 'end_location', 'distance_m', 'accessible'],
+        'indexes': {}
+    },
+    config.NOTIFICATIONS_CSV: {
+        'table': 'notifications',
+        'columns': ['id', 'user_id', 'message', 'delivered', 'status', 'created_at', 'message_id'],
+        'indexes': {
+            'idx_notifications_user_delivered': 'user_id, delivered'
+        }
+    },
+    config.BROADCASTS_CSV: {
+        'table': 'broadcasts',
+        'columns': ['id', 'message_id', 'role', 'max_user_id', 'recipients', 'delivered_bitmap', 'created_at'],
+        'indexes': {}
+    },
+    config.MESSAGES_CSV: {
+        'table': 'messages',
+        'columns': ['id', 'text'],
+        'indexes': {}
+    },
+    config.SCHEDULES_CSV: {
+        'table': 'schedules',
+        'columns': ['id', 'target', 'target_value', 'message', 'send_at', 'recurrence',
+                    'created_by', 'active', 'last_sent_at'],
+        'indexes': {}
+    }
+}
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_initialized = False
+_columns_cache = {}
+_write_counts = {}
+
+
+def handles(filepath):
+    """
+    Check if a CSV path is backed by a database table
+    """
+    return filepath in TABLES
+
+
+def get_connection():
+    """
+    Get the thread-local database connection
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        os.makedirs(os.path.dirname(config.SQLITE_DB), exist_ok=True)
+        conn = sqlite3.connect(config.SQLITE_DB, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        _local.conn = conn
+    init_db(conn)
+    return conn
+
+
+def init_db(conn):
+    """
+    Create tables and indexes if they do not exist
+    """
+    global _initialized
+    if _initialized:
+        return
+    
+    with _schema_lock:
+        if _initialized:
+            return
+        with conn:
+            for spec in TABLES.values():
+                columns = ['id INTEGER PRIMARY KEY'] + [f'"{c}" TEXT' for c in spec['columns'][1:]]
+                conn.execute(f"CREATE TABLE IF NOT EXISTS {spec['table']} ({', '.join(columns)})")
+                for name, expr in spec['indexes'].items():
+                    conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {spec['table']} ({expr})")
+        _initialized = True
+
+
+def _table(filepath):
+    return TABLES[filepath]['table']
+
+
+def _get_columns(conn, table):
+    """
+    Get column names of a table (cached)
+    """
+    if table not in _columns_cache:
+        info = conn.execute(f'PRAGMA table_info({table})').fetchall()
+        _columns_cache[table] = [row['name'] for row in info]
+    return _columns_cache[table]
+
+
+def _ensure_columns(conn, table, fieldnames):
+    """
+    Add any columns that rows carry but the table does not have yet
+    """
+    columns = _get_columns(conn, table)
+    for field in fieldnames:
+        if field not in columns:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN "{field}" TEXT')
+            columns.append(field)
+
+
+def _row_to_dict(row):
+    """
+    Convert a database row to a CSV-style dict of strings
+    NULL columns are left out, like a missing CSV column
+    """
+    return {key: str(row[key]) for key in row.keys() if row[key] is not None}
+
+
+def _insert(conn, table, row):
+    _ensure_columns(conn, table, row.keys())
+    fields = list(row.keys())
+    placeholders = ', '.join('?' for _ in fields)
+    names = ', '.join(f'"{f}"' for f in fields)
+    conn.execute(f'INSERT OR REPLACE INTO {table} ({names}) VALUES ({placeholders})',
+                 [row[f] for f in fields])
+
+
+def read_rows(filepath):
+    """
+    Read all rows of a table in id order
+    """
+    conn = get_connection()
+    cursor = conn.execute(f'SELECT * FROM {_table(filepath)} ORDER BY id')
+    return [_row_to_dict(row) for row in cursor]
+
+
+def tail_rows(filepath, count):
+    """
+    Read the last count rows of a table in id order
+    """
+    conn = get_connection()
+    cursor = conn.execute(f'SELECT * FROM {_table(filepath)} ORDER BY id DESC LIMIT ?', (count,))
+    return [_row_to_dict(row) for row in cursor][::-1]
+
+
+def find_rows(filepath, key_field, key_value, ignore_case=False):
+    """
+    Read rows where key_field equals key_value, using the table indexes
+    """
+    conn = get_connection()
+    table = _table(filepath)
+    if key_field not in _get_columns(conn, table):
+        return []
+    collate = ' COLLATE NOCASE' if ignore_case else ''
+    cursor = conn.execute(f'SELECT * FROM {table} WHERE "{key_field}" = ?{collate} ORDER BY id',
+                          (str(key_value),))
+    return [_row_to_dict(row) for row in cursor]
+
+
+def iter_rows(filepath, columns=None, where=None):
+    """
+    Stream rows, selecting only the given columns and filtering in SQL
+    """
+    conn = get_connection()
+    table = _table(filepath)
+    existing = _get_columns(conn, table)
+    where = where or {}
+    if any(field not in existing for field in where):
+        return
+    
+    select = ', '.join(f'"{c}"' for c in columns if c in existing) if columns else '*'
+    clause = ' AND '.join(f'"{field}" = ?' for field in where)
+    sql = f'SELECT {select or "id"} FROM {table}'
+    if clause:
+        sql += f' WHERE {clause}'
+    cursor = conn.execute(sql + ' ORDER BY id', [str(value) for value in where.values()])
+    for row in cursor:
+        if columns:
+            yield {c: str(row[c]) if c in existing and row[c] is not None else '' for c in columns}
+        else:
+            yield _row_to_dict(row)
+
+
+def get_row(filepath, key_value):
+    """
+    Get a row by primary key
+    """
+    conn = get_connection()
+    row = conn.execute(f'SELECT * FROM {_table(filepath)} WHERE id = ?', (str(key_value),)).fetchone()
+    return _row_to_dict(row) if row is not None else None
+
+
+def get_rows(filepath, key_values):
+    """
+    Get rows by primary key, in the order given; keys without a row are skipped
+    """
+    conn = get_connection()
+    key_values = [str(key_value) for key_value in key_values]
+    found = {}
+    # Stay under SQLite's limit on query parameters
+    for start in range(0, len(key_values), 500):
+        chunk = key_values[start:start + 500]
+        placeholders = ', '.join('?' * len(chunk))
+        for row in conn.execute(f'SELECT * FROM {_table(filepath)} WHERE id IN ({placeholders})', chunk):
+            row = _row_to_dict(row)
+            found[str(row['id'])] = row
+    return [found[key_value] for key_value in key_values if key_value in found]
+
+
+def write_rows(filepath, data, fieldnames=None):
+    """
+    Replace the contents of a table
+    """
+    conn = get_connection()
+    table = _table(filepath)
+    if fieldnames is not None:
+        data = [{f: row.get(f, '') for f in fieldnames} for row in data]
+    with conn:
+        conn.execute(f'DELETE FROM {table}')
+        for row in data:
+            _insert(conn, table, row)
+    _record_write(filepath)
+    return True
+
+
+def append_row(filepath, row):
+    """
+    Insert a single row
+    """
+    conn = get_connection()
+    with conn:
+        _insert(conn, _table(filepath), row)
+    _record_write(filepath)
+    return True
+
+
+def update_row(filepath, key_field, key_value, updates):
+    """
+    Update the first row where key_field equals key_value
+    """
+    conn = get_connection()
+    table = _table(filepath)
+    with conn:
+        _ensure_columns(conn, table, updates.keys())
+        assignments = ', '.join(f'"{f}" = ?' for f in updates)
+        cursor = conn.execute(
+            f'UPDATE {table} SET {assignments} WHERE id = '
+            f'(SELECT id FROM {table} WHERE "{key_field}" = ? ORDER BY id LIMIT 1)',
+            list(updates.values()) + [str(key_value)])
+    _record_write(filepath)
+    return cursor.rowcount > 0
+
+
+def update_rows(filepath, key_field, key_values, updates):
+    """
+    Apply the same updates to several rows in one transaction
+    """
+    conn = get_connection()
+    table = _table(filepath)
+    with conn:
+        _ensure_columns(conn, table, updates.keys())
+        assignments = ', '.join(f'"{f}" = ?' for f in updates)
+        conn.executemany(f'UPDATE {table} SET {assignments} WHERE "{key_field}" = ?',
+                         [list(updates.values()) + [str(value)] for value in key_values])
+    _record_write(filepath)
+    return True
+
+
+class Batch:
+    """
+    Open write transaction used by csv_handler.transaction()
+    """
+    def __init__(self, conn, filepath):
+        self.conn = conn
+        self.table = _table(filepath)
+    
+    def commit(self, inserts, ops):
+        """
+        Apply queued inserts, then journal-style update/delete operations
+        """
+        for row in inserts:
+            _insert(self.conn, self.table, row)
+        for op in ops:
+            if op['op'] == 'update':
+                _ensure_columns(self.conn, self.table, op['updates'].keys())
+                assignments = ', '.join(f'"{f}" = ?' for f in op['updates'])
+                self.conn.execute(
+                    f'UPDATE {self.table} SET {assignments} WHERE id = '
+                    f'(SELECT id FROM {self.table} WHERE "{op["key"]}" = ? ORDER BY id LIMIT 1)',
+                    list(op['updates'].values()) + [op['value']])
+            elif op['op'] == 'delete':
+                self.conn.execute(f'DELETE FROM {self.table} WHERE "{op["key"]}" = ?', (op['value'],))
+
+
+@contextmanager
+def transaction(filepath):
+    """
+    Hold an immediate (write-locked) transaction for a batch of changes
+    Rolled back if the block raises
+    """
+    conn = get_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield Batch(conn, filepath)
+        conn.commit()
+        _record_write(filepath)
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def delete_row(filepath, key_field, key_value):
+    """
+    Delete rows where key_field equals key_value
+    """
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute(f'DELETE FROM {_table(filepath)} WHERE "{key_field}" = ?',
+                              (str(key_value),))
+    _record_write(filepath)
+    return cursor.rowcount > 0
+
+
+def _record_write(filepath):
+    _write_counts[filepath] = _write_counts.get(filepath, 0) + 1
+
+
+def table_version(filepath):
+    """
+    Get a token that changes when a table is written
+    Writes in this process are counted; commits from other processes show
+    up as changes to the database and WAL files
+    """
+    def stat_key(path):
+        try:
+            stat = os.stat(path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+    
+    return (_write_counts.get(filepath, 0), stat_key(config.SQLITE_DB),
+            stat_key(config.SQLITE_DB + '-wal'))
+
+
+def max_id(filepath):
+    """
+    Get the largest id in a table (seeds its id sequence)
+    """
+    conn = get_connection()
+    row = conn.execute(f'SELECT MAX(id) AS max_id FROM {_table(filepath)}').fetchone()
+    return row['max_id'] or 0
+
+
+def import_from_csv():
+    """
+    One-shot import of every CSV file into the database
+    Existing table contents are replaced
+    """
+    counts = {}
+    for filepath, spec in TABLES.items():
+        if not os.path.exists(filepath):
+            continue
+        with open(filepath, 'r', newline='', encoding='utf-8') as f:
+            # Drop overflow fields from malformed lines (DictReader keys them as None)
+            rows = [{k: v for k, v in row.items() if k is not None} for row in csv.DictReader(f)]
+        write_rows(filepath, rows)
+        counts[spec['table']] = len(rows)
+    return counts
+
+
+def export_to_csv(output_dir=None):
+    """
+    Export every table back to CSV
+    Writes to the configured CSV paths unless output_dir is given
+    """
+    conn = get_connection()
+    counts = {}
+    for filepath, spec in TABLES.items():
+        table = spec['table']
+        rows = read_rows(filepath)
+        fieldnames = [c for c in _get_columns(conn, table)
+                      if any(c in row for row in rows)] or spec['columns']
+        target = os.path.join(output_dir, os.path.basename(filepath)) if output_dir else filepath
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(rows)
+        counts[table] = len(rows)
+    return counts
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    if command == 'import':
+        for table, count in import_from_csv().items():
+            print(f"Imported {count} rows into {table}")
+    elif command == 'export':
+        output_dir = sys.argv[2] if len(sys.argv) > 2 else None
+        for table, count in export_to_csv(output_dir).items():
+            print(f"Exported {count} rows from {table}")
+    else:
+        print("Usage: python -m utils.sqlite_store import|export [output_dir]")
+        sys.exit(1)
@@ -0,0 +1,54 @@
+"""
+Reverse File Reader
+Reads a text file from the end in fixed-size blocks
+
+Used to get the newest lines of append-only files (CSV tables, logs)
+without reading everything before them.
+"""
+import os
+
+
+BLOCK_SIZE = 64 * 1024
+
+
+def reverse_lines(filepath, block_size=BLOCK_SIZE):
+    """
+    Yield the lines of a file last to first, without line endings
+    Reads one block at a time from the end; the trailing newline does not
+    produce an empty line
+    """
+    with open(filepath, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        remainder = b''
+        first = True
+        while position > 0:
+            size = min(block_size, position)
+            position -= size
+            f.seek(position)
+            lines = (f.read(size) + remainder).split(b'\n')
+            # The first piece may continue in the previous block
+            remainder = lines.pop(0)
+            if first:
+                first = False
+                if lines and lines[-1] == b'':
+                    lines.pop()
+            for line in reversed(lines):
+                yield line.rstrip(b'\r').decode('utf-8', errors='replace')
+        if remainder or not first:
+            yield remainder.rstrip(b'\r').decode('utf-8', errors='replace')
+
+
+def tail_lines(filepath, count, block_size=BLOCK_SIZE):
+    """
+    Get the last count lines of a file, oldest first
+    """
+    if count <= 0 or not os.path.exists(filepath):
+        return []
+    lines = []
+    for line in reverse_lines(filepath, block_size):
+        lines.append(line)
+        if len(lines) >= count:
+            break
+    lines.reverse()
+    return lines
@@ -0,0 +1,141 @@
+"""
+Write-Behind Buffer
+Queues writes in memory and commits them to disk in batches
+
+With config.DURABILITY = 'write_behind', table changes (see csv_handler)
+return as soon as they are queued. A background writer group-commits
+everything waiting for a file in one write every
+config.WRITE_BEHIND_INTERVAL seconds, or sooner once
+config.WRITE_BEHIND_BATCH_SIZE entries are queued. Queued table changes are
+overlaid on reads, and everything is flushed at exit (atexit and SIGTERM).
+A crash can lose up to one interval of writes.
+"""
+import atexit
+import signal
+import threading
+import config
+
+
+_pending = {}
+_flushers = {}
+_queued = 0
+_cond = threading.Condition()
+_flush_lock = threading.Lock()
+_writer = None
+
+
+def enabled():
+    """
+    Check if writes are buffered instead of written synchronously
+    """
+    return config.DURABILITY == 'write_behind'
+
+
+def register(kind, flusher):
+    """
+    Register the function that writes a kind of entry
+    flusher(path) must take() the path's entries and write them
+    """
+    _flushers[kind] = flusher
+
+
+def enqueue(kind, path, entry):
+    """
+    Queue an entry for a file
+    """
+    global _queued
+    with _cond:
+        _pending.setdefault(path, (kind, []))[1].append(entry)
+        _queued += 1
+        _start_writer()
+        if _queued >= config.WRITE_BEHIND_BATCH_SIZE:
+            _cond.notify()
+
+
+def pending(path):
+    """
+    Get a copy of the entries still queued for a file
+    """
+    with _cond:
+        if path not in _pending:
+            return []
+        return list(_pending[path][1])
+
+
+def take(path):
+    """
+    Remove and return the entries queued for a file
+    Called by flushers while they hold the file's write lock
+    """
+    global _queued
+    with _cond:
+        if path not in _pending:
+            return []
+        entries = _pending.pop(path)[1]
+        _queued -= len(entries)
+        return entries
+
+
+def flush(path=None):
+    """
+    Write queued entries for one file, or for every file
+    """
+    with _cond:
+        if path is None:
+            targets = [(p, kind) for p, (kind, _) in _pending.items()]
+        elif path in _pending:
+            targets = [(path, _pending[path][0])]
+        else:
+            targets = []
+    
+    with _flush_lock:
+        for target, kind in targets:
+            try:
+                _flushers[kind](target)
+            except Exception as e:
+                print(f"Error flushing writes for {target}: {e}")
+
+
+def _start_writer():
+    """
+    Start the background writer (caller holds _cond)
+    """
+    global _writer
+    if _writer is None or not _writer.is_alive():
+        _writer = threading.Thread(target=_writer_loop, name='write-behind', daemon=True)
+        _writer.start()
+
+
+def _writer_loop():
+    """
+    Group-commit queued entries on a timer or when a batch fills up
+    """
+    while True:
+        with _cond:
+            _cond.wait_for(lambda: _queued >= config.WRITE_BEHIND_BATCH_SIZE,
+                           timeout=config.WRITE_BEHIND_INTERVAL)
+            if not _queued:
+                continue
+        flush()
+
+
+# ========== SHUTDOWN ==========
+
+atexit.register(flush)
+
+
+def install_signal_handlers():
+    """
+    Flush queued writes before the process is terminated by SIGTERM
+    Must be called from the main thread
+    """
+    previous = signal.getsignal(signal.SIGTERM)
+    
+    def handle_sigterm(signum, frame):
+        flush()
+        if callable(previous):
+            previous(signum, frame)
+        else:
+            raise SystemExit(0)
+    
+    signal.signal(signal.SIGTERM, handle_sigterm)